@@ -0,0 +1,148 @@
+﻿using System.Collections;
+using System.Collections.Generic;
+using UnityEngine;
+using VRSketch3;
+
+
+public class MergedGroupObject : WorldObject
+{
+    /* All the faces and edges of a group that is not editable at the moment,
+     * sent by Python as a single world object (see worldobj.MergedGroup).
+     * The faces are grouped by color and the edges are drawn as thin square
+     * prisms.  Everything goes into a few meshes, split in children objects
+     * to stay below the limit of 65535 vertices per mesh.
+     */
+    public Material face_material, edge_material;
+    public float edge_radius = 0.0015f;
+
+    static MaterialCache face_mcache, edge_mcache;
+
+    const int MAX_VERTICES = 65000;
+
+    List<Vector3> vpositions = new List<Vector3>();
+    List<Vector3> vnormals = new List<Vector3>();
+    List<int> triangles = new List<int>();
+
+    public override void UpdateWorldObject(WorldScript ws, float[] data)
+    {
+        if (face_mcache == null)
+            face_mcache = new MaterialCache(face_material);
+        if (edge_mcache == null)
+            edge_mcache = new MaterialCache(edge_material);
+
+        foreach (Transform child in transform)
+            Destroy(child.gameObject);
+
+        int index = 0;
+        int num_colors = (int)data[index++];
+        for (int c = 0; c < num_colors; c++)
+        {
+            Color col = data[index] < 0 ? Color.clear : GetColor24(data, index);   /* Color.clear == use default */
+            index++;
+            Material mat = face_mcache.Get(col);
+            int num_faces = (int)data[index++];
+            for (int f = 0; f < num_faces; f++)
+            {
+                var vertices = new Vector3[(int)data[index++]];
+                for (int i = 0; i < vertices.Length; i++)
+                {
+                    vertices[i] = GetVec3(data, index);
+                    index += 3;
+                }
+                if (vpositions.Count + 2 * vertices.Length > MAX_VERTICES)
+                    Flush(mat);
+                AddFace(vertices);
+            }
+            Flush(mat);
+        }
+
+        Material edge_mat = edge_mcache.Get(GetColor24(data, index++));
+        int num_edges = (int)data[index++];
+        for (int e = 0; e < num_edges; e++)
+        {
+            if (vpositions.Count + 8 > MAX_VERTICES)
+                Flush(edge_mat);
+            AddPrism(GetVec3(data, index), GetVec3(data, index + 3));
+            index += 6;
+        }
+        Flush(edge_mat);
+    }
+
+    void AddFace(Vector3[] vertices)
+    {
+        /* same as PolygonObject.ComputeMesh(), for one face among others */
+        Plane plane = PlaneRecomputer.RecomputePlane(vertices);
+
+        int face_vstart = vpositions.Count;
+        foreach (var vertex in vertices)
+        {
+            vpositions.Add(vertex);
+            vnormals.Add(plane.normal);
+        }
+        int face_vstart_back = vpositions.Count;
+        foreach (var vertex in vertices)
+        {
+            vpositions.Add(vertex);
+            vnormals.Add(-plane.normal);
+        }
+
+        var uvs = PolygonObject.ProjectOnPlane(plane, vertices);
+        var triangulation = new Triangulator(uvs).Triangulate();
+        for (var i = 0; i < triangulation.Length / 3; ++i)
+        {
+            triangles.Add(face_vstart + triangulation[3 * i]);
+            triangles.Add(face_vstart + triangulation[3 * i + 2]);
+            triangles.Add(face_vstart + triangulation[3 * i + 1]);
+            triangles.Add(face_vstart_back + triangulation[3 * i + 1]);
+            triangles.Add(face_vstart_back + triangulation[3 * i + 2]);
+            triangles.Add(face_vstart_back + triangulation[3 * i]);
+        }
+    }
+
+    void AddPrism(Vector3 p1, Vector3 p2)
+    {
+        Vector3 axis = p2 - p1;
+        if (axis == Vector3.zero)
+            return;
+        Vector3 u = Vector3.Cross(axis, Mathf.Abs(axis.y) < Mathf.Abs(axis.x) ? Vector3.up : Vector3.right);
+        u = u.normalized * edge_radius;
+        Vector3 v = Vector3.Cross(axis.normalized, u);
+        Vector3[] corners = { u, v, -u, -v };
+
+        int start = vpositions.Count;
+        foreach (var corner in corners)
+        {
+            vpositions.Add(p1 + corner);
+            vnormals.Add(corner.normalized);
+            vpositions.Add(p2 + corner);
+            vnormals.Add(corner.normalized);
+        }
+        for (int i = 0; i < 4; i++)
+        {
+            int a = start + 2 * i;
+            int b = start + 2 * ((i + 1) % 4);
+            triangles.Add(a); triangles.Add(a + 1); triangles.Add(b);
+            triangles.Add(b); triangles.Add(a + 1); triangles.Add(b + 1);
+        }
+    }
+
+    void Flush(Material mat)
+    {
+        if (triangles.Count > 0)
+        {
+            var mesh = new Mesh();
+            mesh.vertices = vpositions.ToArray();
+            mesh.normals = vnormals.ToArray();
+            mesh.triangles = triangles.ToArray();
+            mesh.RecalculateBounds();
+
+            var go = new GameObject("part");
+            go.transform.SetParent(transform, false);
+            go.AddComponent<MeshFilter>().sharedMesh = mesh;
+            go.AddComponent<MeshRenderer>().sharedMaterial = mat;
+        }
+        vpositions.Clear();
+        vnormals.Clear();
+        triangles.Clear();
+    }
+}
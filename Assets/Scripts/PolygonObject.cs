@@ -90,7 +90,7 @@ public class PolygonObject : WorldObject
         GetComponent<MeshFilter>().sharedMesh = mesh;
     }
 
-    static Vector2[] ProjectOnPlane(Plane plane, Vector3[] vertices)
+    public static Vector2[] ProjectOnPlane(Plane plane, Vector3[] vertices)
     {
         Vector3 plane1, plane2;
         Vector3 normal = plane.normal;
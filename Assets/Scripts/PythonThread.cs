@@ -181,9 +181,45 @@ namespace VRSketch3
         void CB_Update(int index, int kind1, float[] data, int data_count)
         {
             /* callback from python, runs in the python thread */
+            if (kind1 == KIND_BATCH)
+            {
+                CB_UpdateBatch(index, data, data_count);
+                return;
+            }
             RunInMainThread((ws) => ws.ApplyPendingUpdate(index, kind1, data));
         }
 
+        const int KIND_BATCH = -1;
+
+        void CB_UpdateBatch(int record_count, float[] data, int data_count)
+        {
+            /* all the updates of a frame, packed by app.UpdateBatch: each record is
+             * (index, kind, length) followed by 'length' floats of data */
+            int[] indexes = new int[record_count];
+            int[] kinds = new int[record_count];
+            float[][] datas = new float[record_count][];
+            int pos = 0;
+            for (int i = 0; i < record_count; i++)
+            {
+                indexes[i] = (int)data[pos];
+                kinds[i] = (int)data[pos + 1];
+                int length = (int)data[pos + 2];
+                pos += 3;
+                float[] sub = new float[length];
+                System.Array.Copy(data, pos, sub, 0, length);
+                datas[i] = sub;
+                pos += length;
+            }
+            if (pos != data_count)
+                Debug.LogError("CB_UpdateBatch: bad record lengths");
+
+            RunInMainThread((ws) =>
+            {
+                for (int i = 0; i < record_count; i++)
+                    ws.ApplyPendingUpdate(indexes[i], kinds[i], datas[i]);
+            });
+        }
+
         static void CB_ApproxPlane(float[] points, int coord_count, float[] plane)
         {
             /* callback from python, runs in the python thread */
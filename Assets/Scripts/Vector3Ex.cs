@@ -311,6 +311,20 @@ namespace VRSketch3
             var normal = new Vector3((float)eigenvectors.Array[0][pick],
                                      (float)eigenvectors.Array[1][pick],
                                      (float)eigenvectors.Array[2][pick]);
+
+            /* the sign of the eigenvector is arbitrary: orient it along the
+               normal given by Newell's method for the winding order of the
+               vertices, like planefit.fit_plane() on the Python side */
+            Vector3 newell = Vector3.zero;
+            Vector3 prev = vertices[vertices.Length - 1] - center;
+            foreach (var v in vertices)
+            {
+                Vector3 p = v - center;
+                newell += Vector3.Cross(prev, p);
+                prev = p;
+            }
+            if (Vector3.Dot(normal, newell) < 0f)
+                normal = -normal;
             return new Plane(normal, center);
         }
     }
@@ -27,6 +27,7 @@ public class WorldScript : MonoBehaviour
         Stem = 251,
         DashedStem = 252,
         SelectedStem = 253,
+        MergedGroup = 260,
     };
 
 
@@ -101,10 +102,17 @@ public class WorldScript : MonoBehaviour
             if (prefab == null)
             {
                 world_objects[index] = null;
+                /* keep the list no longer than the indexes in use: Python
+                 * gives the lowest free indexes first (see indexalloc.py) */
+                int count = world_objects.Count;
+                while (count > 0 && world_objects[count - 1] == null)
+                    count--;
+                world_objects.RemoveRange(count, world_objects.Count - count);
                 return;
             }
 
             wo = Instantiate(prefab, parent: transform);
+            wo.gameObject.SetActive(true);
             wo.name = prefab.name + " " + index;
             wo.kind = kind;
             world_objects[index] = wo;
@@ -180,7 +188,7 @@ public class WorldScript : MonoBehaviour
             Kind kind = (Kind)i;
             string s = "WorldObj/" + kind.ToString();
             WorldObject prefab = null;
-            if (kind != Kind.Destroyed)
+            if (kind != Kind.Destroyed && kind != Kind.MergedGroup)
             {
                 GameObject go = Resources.Load<GameObject>(s);
                 if (go == null)
@@ -196,6 +204,7 @@ public class WorldScript : MonoBehaviour
             }
             world_prefabs[kind] = prefab;
         }
+        world_prefabs[Kind.MergedGroup] = BuildMergedGroupPrefab();
 
         world_objects = new List<WorldObject>();
 
@@ -212,6 +221,24 @@ public class WorldScript : MonoBehaviour
         Gt_onControllersUpdate(new Controller[0]);
     }
 
+    WorldObject BuildMergedGroupPrefab()
+    {
+        /* there is no prefab in Resources for this kind; we build an inactive
+         * template object that uses the materials of ColoredPolygon and Stem */
+        WorldObject polygon = world_prefabs[Kind.ColoredPolygon];
+        WorldObject stem = world_prefabs[Kind.Stem];
+        if (polygon == null || stem == null)
+            return null;
+
+        var go = new GameObject("MergedGroup");
+        go.SetActive(false);
+        go.transform.SetParent(transform, false);
+        var merged = go.AddComponent<MergedGroupObject>();
+        merged.face_material = polygon.GetComponent<MeshRenderer>().sharedMaterials[0];
+        merged.edge_material = stem.GetComponentInChildren<MeshRenderer>().sharedMaterial;
+        return merged;
+    }
+
     void UpdateActiveControllers(Controller[] controllers)
     {
         /* 'active_controllers = controllers' but trying to keep the order: even if a new
@@ -14,21 +14,61 @@ def find_module(filename):
     return result_module
 
 
+def keep_old_file(filename):
+    # renames an existing 'filename' to 'filename~'
+    if os.path.exists(filename):
+        try:
+            os.unlink(filename + '~')
+        except OSError:
+            pass
+        os.rename(filename, filename + '~')
+
+
+def compact(args):
+    import document
+    temp = args.target + '.tmp'
+    num_steps = document.compact_history(args.source, temp, keep_steps=args.keep_steps,
+                                         binary=True if args.binary else None)
+    keep_old_file(args.target)
+    os.rename(temp, args.target)
+    print args.target, 'written, %d step(s).' % (num_steps,)
+
+
 def main():
     parser = argparse.ArgumentParser(description='Convert between VR file formats.')
     parser.add_argument('source', metavar='source', type=str, help='source file')
-    parser.add_argument('target', metavar='target', type=str, help='target file')
+    parser.add_argument('target', metavar='target', type=str, nargs='?',
+                        help='target file (with --compact, the default is the source file)')
+    parser.add_argument('--binary', action='store_true',
+                        help='write a .vrsketch target in the binary format (default: JSON lines)')
+    parser.add_argument('--compact', action='store_true',
+                        help='rewrite the history of a .vrsketch file as a single step, '
+                             'with the ids renumbered (the format is kept unless --binary)')
+    parser.add_argument('--keep-steps', metavar='N', type=int, default=0,
+                        help='with --compact, keep the last N steps after the single step')
     args = parser.parse_args()
+    if args.keep_steps and not args.compact:
+        parser.error('--keep-steps is only for --compact')
+    if args.target is None:
+        if not args.compact:
+            parser.error('a target file is required')
+        args.target = args.source
     src_module = find_module(args.source)
     tgt_module = find_module(args.target)
+    options = {}
+    if args.binary:
+        if tgt_module.__name__ != '_vrconv.vrsketch':
+            parser.error('--binary is only for .vrsketch targets')
+        options['binary'] = True
 
     Face._UPDATE_PLANE = False
+    if args.compact:
+        if (src_module.__name__ != '_vrconv.vrsketch' or
+                tgt_module.__name__ != '_vrconv.vrsketch'):
+            parser.error('--compact is only for .vrsketch files')
+        compact(args)
+        return
     model = src_module.load(args.source)
-    if os.path.exists(args.target):
-        try:
-            os.unlink(args.target + '~')
-        except OSError:
-            pass
-        os.rename(args.target, args.target + '~')
-    tgt_module.save(model, args.target)
+    keep_old_file(args.target)
+    tgt_module.save(model, args.target, **options)
     print args.target, 'written.'
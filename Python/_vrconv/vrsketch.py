@@ -6,11 +6,11 @@ def load(filename):
     return document.VRSketchFile(filename).model
 
 
-def save(model, filename):
+def save(model, filename, binary=False):
     step = ModelStep(model, "Conversion")
     step.fe_add += model.all_edges()
     step.fe_add += model.all_faces()
 
     with open(filename, 'wb') as f:
-        document.write_header(f)
-        document.write_model_step(f, step)
+        document.write_header(f, binary=binary)
+        document.write_model_step(f, step, binary=binary)
@@ -1,44 +1,229 @@
 import os
+import time
+import json
+import array
+import struct
 import weakref
-import util, model, controller, worldobj, document
+import util, model, controller, worldobj, document, lod, perf, indexalloc
 from util import Vector3
+from worldobj import write_floats
 
 
 KIND_DESTROYED = 0
+KIND_BATCH = -1
+
+# If True, handle_frame() sends all the updates of a frame with a single
+# call to fn_update(), using KIND_BATCH; PythonThread.CB_Update() on the
+# Unity side splits it again.  If False, fn_update() is called once per
+# object, like before.
+BATCH_UPDATES = True
+
+# If True, the groups that cannot be edited at the moment are each sent
+# as a single MergedGroup world object, instead of one world object per
+# edge and per face.
+MERGE_INACTIVE_GROUPS = True
+MERGED_MODES = ("subgroup", "elsewhere")
+
+# execute_step() only queues the step: handle_frame() consolidates the
+# pending steps for at most this many seconds per frame, and applies and
+# records each one when it is finished (see run_pending_steps()).  None
+# means finishing them all in the same frame, like before.
+CONSOLIDATE_BUDGET = 0.008
+
+# A pending step that doesn't apply any more when its turn comes is
+# dropped; this is counted in frame_stats["steps_dropped"] and shown as a
+# hint next to the first controller during this many frames.
+DROPPED_HINT_FRAMES = 180
+
+# If True, the performance counters of every frame (App.perf_counters) are
+# appended as one line of JSON to the file named like the document plus
+# PERF_LOG_SUFFIX.  This can also be toggled from the menu.  The lines
+# are kept in memory and written every PERF_LOG_FLUSH_FRAMES frames, and
+# when the log is turned off, so that the frames measured don't include
+# the disk I/O.
+PERF_LOG = False
+PERF_LOG_SUFFIX = '.perf.jsonl'
+PERF_LOG_FLUSH_FRAMES = 300
+
+_ffi = None
+_PACK_HEADER = struct.Struct('=3f')
+
+
+class UpdateBatch(object):
+    # Collects the updates of a frame into a single array of 32-bit
+    # floats.  Each update becomes a record: the index, the kind and the
+    # length of the data, followed by the data itself.  Integers up to
+    # 2**24 are exact as 32-bit floats, which is plenty for the indexes.
+    # The world objects write their data directly into the array with
+    # writeraw(), unless their raw data was already computed; the array is
+    # kept and reused for the following frames.
+
+    def __init__(self):
+        self.buffer = array.array('f')
+        self.pos = 0
+        self.count = 0
+
+    def _reserve(self, size):
+        missing = self.pos + size - len(self.buffer)
+        if missing > 0:
+            self.buffer.extend(array.array('f', [0.0]) * max(missing, len(self.buffer)))
+
+    def add(self, index, worldobj, raw=None):
+        # 'raw' is the result of worldobj.getrawdata(), if already known
+        buf = self.buffer
+        pos = self.pos
+        try:
+            if raw is None:
+                end = worldobj.writeraw(buf, pos + 3)
+            else:
+                end = write_floats(buf, pos + 3, raw)
+            _PACK_HEADER.pack_into(buf, pos * 4, index, worldobj._kind, end - pos - 3)
+        except struct.error:
+            # the buffer is only grown when it turns out to be too small
+            self._reserve(3 + (worldobj.rawsize() if raw is None else len(raw)))
+            return self.add(index, worldobj, raw)
+        self.pos = end
+        self.count += 1
+
+    def add_remove(self, index):
+        self._reserve(3)
+        _PACK_HEADER.pack_into(self.buffer, self.pos * 4, index, KIND_DESTROYED, 0)
+        self.pos += 3
+        self.count += 1
+
+    def send(self, fn_update):
+        # the index argument is the number of records, for the C# side
+        if self.count > 0:
+            if _ffi is None:
+                fn_update(self.count, KIND_BATCH, self.buffer[:self.pos], self.pos)
+            else:
+                data = _ffi.from_buffer(self.buffer)
+                fn_update(self.count, KIND_BATCH, _ffi.cast("float *", data), self.pos)
+        self.pos = 0
+        self.count = 0
+
+def decode_batch(count, data):
+    # the reverse of UpdateBatch, as done in PythonThread.CB_Update();
+    # returns a list of (index, kind, raw)
+    result = []
+    pos = 0
+    for i in range(count):
+        index, kind, length = int(data[pos]), int(data[pos + 1]), int(data[pos + 2])
+        pos += 3
+        result.append((index, kind, list(data[pos:pos + length])))
+        pos += length
+    assert pos == len(data)
+    return result
 
 
 class App(object):
 
     def __init__(self, initial_filename):
-        self.freelists = {}
-        self.pending_removes = {}
+        self.indexes = indexalloc.IndexAllocator()
         self.pending_updates_seen = set()
         self.pending_updates = []
-        self.destroy_later = []
-        self.num_world_objs = 0
+        self.pending_raw = {}       # {world object in pending_updates: raw data}
+        self.flashed = []
+        self.flashed_seen = set()
+        self.flash_counts = {}
+        self.flash_slots = {}
         self.model2worldobj = {}
+        self.model2raw = {}
+        self.merged_groups = {}     # {group: MergedGroup}
+        self.group_lod = {}         # {group: level of detail}, for merged_groups
+        self.head = None
+        self.dirty_groups = set()
+        self.skipped_updates = 0
+        self.frame_stats = {}
+        self.update_batch = UpdateBatch()
         self.manual_tokens = weakref.WeakKeyDictionary()
         self.next_manual_token = 1
-        self.selected_edges = set()
-        self.selected_subgroups = set()
         self.gray_out_subgroups = False
+        self.pending_steps = []
+        self.consolidating = None   # consolidate_iter() of pending_steps[0]
+        self.step_previews = {}     # {pending step: [world objects]}
+        self.dropped_steps = 0      # in this frame
+        self.dropped_hint = None    # (text, number of frames left)
+        self.temporary_step = None
+        self.perf_counters = {}
+        self.show_perf = False
+        self.log_perf = PERF_LOG
+        self.perf_log = None
+        self.perf_log_lines = []
+        self.file = None
         self.open(initial_filename)
         self.ctrlmgr = controller.ControllersMgr(self)
 
     def open(self, filename):
+        # the pending steps are applied and recorded in the old document;
+        # they can only be left over if a temporary step is applied
+        self.run_pending_steps(None)
+        while self.cancel_pending_step():
+            pass
+        self._close_perf_log()
+        if self.file is not None:
+            self.file.close()
         self.file = document.VRSketchFile(filename)
         self.model = self.file.model
         self.curgroup = self.model.root_group
+        self.selected_edges = set()
+        self.selected_subgroups = set()
+        # the selection as it is currently displayed, see selection_updated()
+        self.shown_selected_edges = set()
+        self.shown_selected_subgroups = set()
+        self.shown_context = None
+        self.selected_pairs = util.VertexPairDict()   # {(v1, v2): count}
         self.model_updated()
 
-    def display(self, worldobj):
+    def display(self, worldobj, raw=None):
+        # 'raw' is the result of worldobj.getrawdata(), if already known
         if worldobj not in self.pending_updates_seen:
             self.pending_updates_seen.add(worldobj)
             self.pending_updates.append(worldobj)
+        if raw is not None:
+            self.pending_raw[worldobj] = raw
 
     def flash(self, worldobj):
-        self.display(worldobj)
-        self.destroy_later.append(worldobj)
+        # 'worldobj' is only displayed until the next frame, unless it is
+        # flashed again.  It goes into the flash slot (tool, kind, ordinal),
+        # which is reused from frame to frame: see _update_flash_slots().
+        if worldobj in self.flashed_seen:
+            return
+        self.flashed_seen.add(worldobj)
+        tool_kind = (self.ctrlmgr.selected_tool, worldobj._kind)
+        ordinal = self.flash_counts.get(tool_kind, 0)
+        self.flash_counts[tool_kind] = ordinal + 1
+        self.flashed.append((tool_kind + (ordinal,), worldobj))
+
+    def _update_flash_slots(self):
+        # A slot that was flashed in the previous frame keeps its index, and
+        # its new world object is only sent if the raw data is different.
+        # The raw data computed here is sent as it is, without encoding the
+        # world object again.  The slots that are not flashed any more are
+        # destroyed.
+        slots = {}
+        for key, wo in self.flashed:
+            raw = wo.getrawdata()
+            old = self.flash_slots.pop(key, None)
+            if old is not None and old[0]._index is not None:
+                old_wo, old_raw = old
+                if old_wo is not wo:
+                    wo._index = old_wo._index
+                    old_wo._index = None
+                    self.indexes.transfer(wo._index, wo)
+                if raw == old_raw:
+                    self.skipped_updates += 1
+                else:
+                    self.display(wo, raw)
+            else:
+                self.display(wo, raw)
+            slots[key] = (wo, raw)
+        for wo, raw in self.flash_slots.values():
+            self.destroy(wo)
+        self.flash_slots = slots
+        del self.flashed[:]
+        self.flashed_seen.clear()
+        self.flash_counts.clear()
 
     def destroy(self, worldobj):
         kind = worldobj._kind
@@ -47,32 +232,37 @@ class App(object):
             index = worldobj._index
             if index is not None:
                 worldobj._index = None
-                self.pending_removes.setdefault(kind, []).append(index)
-
-    def _add_edge_or_face(self, edge_or_face):
-        if edge_or_face.group is self.curgroup:
-            mode = "current"
-        elif edge_or_face.group in self.selected_subgroups:
-            mode = "selected_subgroup"
-        elif self.gray_out_subgroups or not edge_or_face.group.issubgroup(self.curgroup):
-            mode = "elsewhere"
+                self.indexes.release(index, kind)
+
+    def _group_mode(self, group):
+        if group is self.curgroup:
+            return "current"
+        elif group in self.selected_subgroups:
+            return "selected_subgroup"
+        elif self.gray_out_subgroups or not group.issubgroup(self.curgroup):
+            return "elsewhere"
         else:
-            mode = "subgroup"
+            return "subgroup"
+
+    def _is_merged(self, group):
+        return MERGE_INACTIVE_GROUPS and self._group_mode(group) in MERGED_MODES
+
+    def _make_worldobj(self, edge_or_face):
+        mode = self._group_mode(edge_or_face.group)
 
         if isinstance(edge_or_face, model.Edge):
+            # every read of v1 or v2 builds a new Vector3: read them once
+            v1 = edge_or_face.v1
+            v2 = edge_or_face.v2
             wo = None
-            if edge_or_face.group is self.curgroup:
-                for e1 in self.selected_edges:
-                    if ((e1.v1 == edge_or_face.v1 and e1.v2 == edge_or_face.v2) or
-                        (e1.v1 == edge_or_face.v2 and e1.v2 == edge_or_face.v1)):
-                        wo = worldobj.SelectedStem(edge_or_face.v1, edge_or_face.v2, 0x800080, 0xFF00FF)
-                        break
+            if edge_or_face.group is self.curgroup and self.selected_pairs.get(v1, v2):
+                wo = worldobj.SelectedStem(v1, v2, 0x800080, 0xFF00FF)
             if wo is None:
                 color = {"current": None,
                          "subgroup": 0x808080,
                          "selected_subgroup": 0x800080,
                          "elsewhere": 0x606060}[mode]
-                wo = worldobj.Stem(edge_or_face.v1, edge_or_face.v2, color)
+                wo = worldobj.Stem(v1, v2, color)
         elif isinstance(edge_or_face, model.Face):
             vertices = [edge.v1 for edge in edge_or_face.edges]
             if mode == "current" or mode == "subgroup":
@@ -87,37 +277,202 @@ class App(object):
                 wo = worldobj.ColoredPolygon(vertices, 0x757575)
         else:
             raise AssertionError(repr(edge_or_face))
-        self.model2worldobj[edge_or_face] = wo
-        self.display(wo)
+        return wo
+
+    def _redisplay(self, old_elements, new_elements):
+        # Replace the world objects of the edges and faces 'old_elements'
+        # with new world objects for 'new_elements'.  We remember the kind
+        # and raw data last displayed for every edge and face; if a new
+        # world object would be identical to an old one, we keep the old
+        # one and its index instead of destroying it and sending the same
+        # data again.
+        #
+        # The elements of the groups shown as a MergedGroup don't have
+        # their own world object; their group is marked as dirty instead,
+        # and _update_merged_groups() will rebuild it.
+        reusable = {}
+        for fe in old_elements:
+            wo = self.model2worldobj.pop(fe, None)
+            if wo is None:
+                self.dirty_groups.add(fe.group)
+                continue
+            key = self.model2raw.pop(fe)
+            reusable.setdefault(key, []).append(wo)
+        for fe in new_elements:
+            if self._is_merged(fe.group):
+                self.dirty_groups.add(fe.group)
+                continue
+            wo = self._make_worldobj(fe)
+            key = (wo._kind, tuple(wo.getrawdata()))
+            olds = reusable.get(key)
+            if olds:
+                wo = olds.pop()
+                self.skipped_updates += 1
+            else:
+                self.display(wo)
+            self.model2worldobj[fe] = wo
+            self.model2raw[fe] = key
+        for olds in reusable.values():
+            for wo in olds:
+                self.destroy(wo)
+
+    def _make_merged_group(self, group, mode, level):
+        edge_color = 0x808080 if mode == "subgroup" else 0x606060
+        face_color = None if mode == "subgroup" else 0x757575
+        if level == lod.LOD_BOX:
+            box = self.model.get_bounding_box(group)
+            vertices_list, edges = lod.box_geometry(box)
+            faces = [(face_color, vertices) for vertices in vertices_list]
+        elif level == lod.LOD_HULL:
+            vertices_list = group.cached('lod_hull',
+                                         lambda: lod.hull_faces(self.model.get_faces(group)))
+            faces = [(face_color, vertices) for vertices in vertices_list]
+            edges = [(vertices[i - 1], vertices[i]) for vertices in vertices_list
+                                                    for i in range(len(vertices))]
+        else:
+            faces = []
+            for face in self.model.get_faces(group):
+                color = face_color
+                if mode == "subgroup":
+                    color = face.physics.color
+                    if color == 0xffffff:
+                        color = None
+                faces.append((color, [edge.v1 for edge in face.edges]))
+            edges = [(edge.v1, edge.v2) for edge in self.model.get_edges(group)]
+        return worldobj.MergedGroup(faces, edges, edge_color)
+
+    def _lod_distance(self, group):
+        # the distance in meters from the head to the group, made larger
+        # for the groups outside the current group
+        box = self.model.get_bounding_box(group)
+        distance = lod.box_distance(self.head, box) * self.model_scale
+        if self._group_mode(group) == "elsewhere":
+            distance *= lod.ELSEWHERE_FACTOR
+        return distance
+
+    def _update_lod(self):
+        # Find the merged groups whose level of detail should change, and
+        # mark the nearest ones as dirty for _update_merged_groups(), up to
+        # lod.MAX_SWAPS_PER_FRAME of them.  The others wait for the next
+        # frames.
+        if self.head is None:
+            return 0, 0
+        swaps = []
+        for group, level in self.group_lod.items():
+            if group in self.dirty_groups:
+                continue
+            distance = self._lod_distance(group)
+            new_level = lod.choose_level(distance, level)
+            if new_level != level:
+                swaps.append((distance, group, new_level))
+        swaps.sort(key=lambda swap: swap[0])
+        done = swaps[:lod.MAX_SWAPS_PER_FRAME]
+        for distance, group, new_level in done:
+            self.group_lod[group] = new_level
+            self.dirty_groups.add(group)
+        return len(done), len(swaps) - len(done)
+
+    def _update_merged_groups(self):
+        # Called once per frame, after the model has been updated.  Every
+        # dirty group is switched to the representation that it should have
+        # now: a single MergedGroup if it is not editable at the moment, or
+        # one world object per element otherwise.  A MergedGroup whose data
+        # didn't change is not sent again.
+        groups = self.model.get_groups()
+        dirty_groups = self.dirty_groups
+        self.dirty_groups = set()
+        for group in dirty_groups:
+            old = self.merged_groups.pop(group, None)
+            level = self.group_lod.pop(group, None)
+            if group in groups:
+                elements = self.model.get_edges(group) + self.model.get_faces(group)
+                if self._is_merged(group):
+                    self._redisplay([fe for fe in elements if fe in self.model2worldobj], ())
+                    if elements:
+                        if level is None:
+                            if self.head is None:
+                                level = lod.LOD_FULL
+                            else:
+                                level = lod.choose_level(self._lod_distance(group))
+                        self.group_lod[group] = level
+                        wo = self._make_merged_group(group, self._group_mode(group), level)
+                        if old is not None and old.raw == wo.raw:
+                            wo = old
+                            old = None
+                            self.skipped_updates += 1
+                        else:
+                            self.display(wo)
+                        self.merged_groups[group] = wo
+                else:
+                    self._redisplay((), [fe for fe in elements if fe not in self.model2worldobj])
+            if old is not None:
+                self.destroy(old)
+
+    def _add_edge_or_face(self, edge_or_face):
+        self._redisplay((), [edge_or_face])
 
     def _remove_edge_or_face(self, edge_or_face):
-        wo = self.model2worldobj.pop(edge_or_face)
-        self.destroy(wo)
+        self._redisplay([edge_or_face], ())
 
     def model_updated(self):
-        lst = self.model2worldobj.values()
-        self.model2worldobj.clear()
-        for wo in lst:
-            self.destroy(wo)
-        for fe in self.model.all_edges():
-            self._add_edge_or_face(fe)
-        for fe in self.model.all_faces():
-            self._add_edge_or_face(fe)
+        self.dirty_groups.update(self.merged_groups)
+        self._redisplay(list(self.model2worldobj),
+                        self.model.all_edges() + self.model.all_faces())
 
     def selection_updated(self, also_faces=False):
-        edges = self.model.all_edges()
-        if also_faces:
-            faces = self.model.all_faces()
-        else:
-            faces = ()
-        for edge in edges:
-            self._remove_edge_or_face(edge)
-        for face in faces:
-            self._remove_edge_or_face(face)
-        for edge in edges:
-            self._add_edge_or_face(edge)
-        for face in faces:
-            self._add_edge_or_face(face)
+        # Displays the changes in 'selected_edges' and 'selected_subgroups'
+        # since the previous call.  Only the edges with the same vertices
+        # as the edges that were selected or unselected, and the edges and
+        # faces of the subgroups that were selected or unselected, are
+        # displayed again.  If the current group or gray_out_subgroups
+        # changed, all the edges are, and all the faces if 'also_faces'.
+        added = self.selected_edges - self.shown_selected_edges
+        removed = self.shown_selected_edges - self.selected_edges
+        for edge in added:
+            pair = (edge.v1, edge.v2)
+            self.selected_pairs[pair] = self.selected_pairs.get(*pair, default=0) + 1
+        for edge in removed:
+            count = self.selected_pairs.get(edge.v1, edge.v2)
+            if count > 1:
+                self.selected_pairs[edge.v1, edge.v2] = count - 1
+            else:
+                self.selected_pairs.pop(edge.v1, edge.v2)
+        changed_groups = self.selected_subgroups ^ self.shown_selected_subgroups
+        self.shown_selected_edges = set(self.selected_edges)
+        self.shown_selected_subgroups = set(self.selected_subgroups)
+
+        context = (self.curgroup, self.gray_out_subgroups)
+        if context != self.shown_context:
+            self.shown_context = context
+            elements = self.model.all_edges()
+            if also_faces:
+                elements = elements + self.model.all_faces()
+            self._redisplay(elements, elements)
+            return
+
+        elements = []
+        if added or removed:
+            pairs = self._edge_pairs(self.curgroup)
+            seen = set()
+            for edge in added | removed:
+                for e in pairs.get(edge.v1, edge.v2, ()):
+                    if e not in seen:
+                        seen.add(e)
+                        elements.append(e)
+        for group in changed_groups:
+            elements += self.model.get_edges(group)
+            elements += self.model.get_faces(group)
+        if elements:
+            self._redisplay(elements, elements)
+
+    def _edge_pairs(self, group):
+        # {(v1, v2): [edges of 'group' between v1 and v2]}
+        def compute():
+            pairs = util.VertexPairDict()
+            for edge in self.model.get_edges(group):
+                pairs.setdefault(edge.v1, edge.v2, []).append(edge)
+            return pairs
+        return group.cached('edge_pairs', compute)
 
     def _remove_all_selection(self):
         self.selected_edges.clear()
@@ -135,54 +490,223 @@ class App(object):
         return self.model.get_faces(self.curgroup)
 
     def execute_step(self, model_step):
-        model_step.consolidate(self)
-        model_step.apply(self)
-        self.file.record_undoable_action(model_step)
+        # the step is consolidated, applied and recorded by the next
+        # run_pending_steps(), after the steps that are already pending
+        self.pending_steps.append(model_step)
+
+    def run_pending_steps(self, budget=None):
+        # Consolidates the pending steps in order, for at most 'budget'
+        # seconds (None: until they are all done), and applies and records
+        # each one as soon as it is finished.  Returns the number of steps
+        # finished.  Nothing is done while a temporary step is applied,
+        # because the model must not change during consolidation.
+        finished = 0
+        if self.temporary_step is not None:
+            return finished
+        if budget is not None:
+            deadline = time.time() + budget
+        while self.pending_steps:
+            model_step = self.pending_steps[0]
+            if self.consolidating is None:
+                if not model_step.still_applies():
+                    # it was made before an earlier pending step was applied,
+                    # and something that it removes is gone
+                    self.dropped_steps += 1
+                    self.dropped_hint = (u'"%s" cancelled: the model changed' % (model_step.name,),
+                                         DROPPED_HINT_FRAMES)
+                    self._hide_preview(self.pending_steps.pop(0))
+                    continue
+                self.consolidating = model_step.consolidate_iter()
+            t0 = time.time()
+            try:
+                for phase in self.consolidating:
+                    t1 = time.time()
+                    perf.add_time('consolidate_' + phase, t1 - t0)
+                    t0 = t1
+                    if budget is not None and t1 > deadline:
+                        self._show_previews()
+                        return finished
+            except Exception:
+                # the generator is dead: the step is half-consolidated and
+                # must not be applied by the next call
+                self.consolidating = None
+                self._hide_preview(self.pending_steps.pop(0))
+                raise
+            perf.add_time('consolidate_finish', time.time() - t0)
+            self.consolidating = None
+            self._hide_preview(self.pending_steps.pop(0))
+            with perf.timed('apply_step'):
+                model_step.apply(self)
+                self.file.record_undoable_action(model_step)
+            finished += 1
+        return finished
+
+    def cancel_pending_step(self):
+        # cancels the most recently executed step that is still pending;
+        # returns False if there is none
+        if not self.pending_steps:
+            return False
+        if len(self.pending_steps) == 1:
+            self.consolidating = None
+        self._hide_preview(self.pending_steps.pop())
+        return True
+
+    def _show_previews(self):
+        # A pending step is previewed by displaying the edges and faces that
+        # it adds, as they are at this point of the consolidation.  The ones
+        # that it removes stay displayed until it is applied.
+        for model_step in self.pending_steps:
+            if model_step not in self.step_previews:
+                wos = [self._make_worldobj(fe) for fe in model_step.fe_add]
+                for wo in wos:
+                    self.display(wo)
+                self.step_previews[model_step] = wos
+
+    def _hide_preview(self, model_step):
+        for wo in self.step_previews.pop(model_step, ()):
+            self.destroy(wo)
 
     def execute_temporary_step(self, model_step):
         model_step.consolidate_temporary()
         model_step.apply(self)
+        self.temporary_step = model_step
+
+    def cancel_temporary_step(self, model_step):
+        model_step.reversed().apply(self)
+        self.temporary_step = None
 
     def scale_ctrl(self, distance):
         return distance / self.model_scale
 
-    def _really_update(self, worldobj):
+    def _really_update(self, worldobj, batch):
         kind = worldobj._kind
         if kind == KIND_DESTROYED:
             return
         index = worldobj._index
         if index is None:
-            freelist = self.pending_removes.get(kind)
-            if freelist:
-                index = freelist.pop()
-            else:
-                index = self.num_world_objs
-                self.num_world_objs += 1
+            index = self.indexes.allocate(worldobj)
             worldobj._index = index
-        raw = worldobj.getrawdata()
-        fn_update(index, kind, raw, len(raw))
+        raw = self.pending_raw.get(worldobj)
+        if batch is None:
+            if raw is None:
+                raw = worldobj.getrawdata()
+            fn_update(index, kind, raw, len(raw))
+            perf.count('fn_update_calls')
+            perf.count('floats_sent', len(raw))
+        else:
+            batch.add(index, worldobj, raw)
 
     def handle_frame(self, num_controllers, controllers):
+        t0 = time.time()
+        perf.reset()
         self.ctrlmgr.handle_controllers(num_controllers, controllers)
+        overlay = self._flash_perf_overlay()
+        steps_done = self.run_pending_steps(CONSOLIDATE_BUDGET)
+        self._flash_dropped_hint()
+        self._update_flash_slots()
+        lod_swaps, lod_pending = self._update_lod()
+        self._update_merged_groups()
+
+        batch = self.update_batch if BATCH_UPDATES else None
+
+        # in idle frames, move some world objects to lower free indexes;
+        # the perf overlay changes in every frame and doesn't count
+        compacted = 0
+        if all(go is overlay for go in self.pending_updates):
+            for wo in self.indexes.compact():
+                self.display(wo)
+                compacted += 1
 
         # send updates... first all new or modified objects,
         # possibly reusing some indexes that are to be freed
+        updates = 0
         for go in self.pending_updates:
-            self._really_update(go)
+            if go._kind != KIND_DESTROYED:
+                self._really_update(go, batch)
+                updates += 1
         self.pending_updates_seen.clear()
         del self.pending_updates[:]
+        self.pending_raw.clear()
 
         # then, we really free the indexes that are still marked as such
-        for freelist in self.pending_removes.values():
-            for index in freelist:
+        removes = 0
+        for index in self.indexes.take_removes():
+            if batch is None:
                 fn_update(index, KIND_DESTROYED, [], 0)
-        self.pending_removes.clear()
-
-        # finally, we move 'destroy_later' to 'pending_removes' for
-        # the next frame
-        for go in reversed(self.destroy_later):
-            self.destroy(go)
-        del self.destroy_later[:]
+                perf.count('fn_update_calls')
+            else:
+                batch.add_remove(index)
+            removes += 1
+
+        # 'skipped' is the number of world objects that _redisplay() did
+        # not send again because they did not change
+        self.frame_stats = {"updates": updates, "removes": removes,
+                            "skipped": self.skipped_updates,
+                            "lod_swaps": lod_swaps, "lod_pending": lod_pending,
+                            "steps_done": steps_done,
+                            "steps_pending": len(self.pending_steps),
+                            "steps_dropped": self.dropped_steps,
+                            "compacted": compacted}
+        self.skipped_updates = 0
+        self.dropped_steps = 0
+
+        if batch is not None:
+            if batch.count:
+                perf.count('fn_update_calls')
+                perf.count('floats_sent', batch.pos)
+            batch.send(fn_update)
+
+        counters = dict(self.frame_stats)
+        counters.update(perf.counters)
+        counters.update(self.indexes.stats())
+        counters["flash_slots"] = len(self.flash_slots)
+        counters["writes_queued"] = self.file.writes_queued()
+        counters["frame_ms"] = (time.time() - t0) * 1000.0
+        self.perf_counters = counters
+        if self.log_perf:
+            self._write_perf_log(counters)
+
+    def _flash_perf_overlay(self):
+        # the counters of the previous frame, next to the first controller;
+        # returns the flashed TextHint, or None
+        if self.show_perf and self.perf_counters and self.ctrlmgr.controllers:
+            position = self.ctrlmgr.controllers[0].position
+            end2 = position + Vector3(0, 0, self.scale_ctrl(0.1))
+            overlay = worldobj.TextHint(position, end2,
+                                        perf.format_counters(self.perf_counters))
+            self.flash(overlay)
+            return overlay
+        return None
+
+    def _flash_dropped_hint(self):
+        if self.dropped_hint is not None:
+            text, frames_left = self.dropped_hint
+            if self.ctrlmgr.controllers:
+                position = self.ctrlmgr.controllers[0].position
+                end2 = position - Vector3(0, 0, self.scale_ctrl(0.1))
+                self.flash(worldobj.TextHint(position, end2, text))
+            self.dropped_hint = (text, frames_left - 1) if frames_left > 1 else None
+
+    def _write_perf_log(self, counters):
+        entry = dict(counters)
+        entry["time"] = getattr(self, 'current_time', None)
+        self.perf_log_lines.append(json.dumps(entry, sort_keys=True) + '\n')
+        if len(self.perf_log_lines) >= PERF_LOG_FLUSH_FRAMES:
+            self._flush_perf_log()
+
+    def _flush_perf_log(self):
+        if self.perf_log_lines:
+            if self.perf_log is None:
+                self.perf_log = open(self.file.filename + PERF_LOG_SUFFIX, 'a')
+            self.perf_log.writelines(self.perf_log_lines)
+            self.perf_log.flush()
+            del self.perf_log_lines[:]
+
+    def _close_perf_log(self):
+        self._flush_perf_log()
+        if self.perf_log is not None:
+            self.perf_log.close()
+            self.perf_log = None
 
     def handle_click(self, id):
         if id.startswith(u"tool_"):
@@ -193,10 +717,14 @@ class App(object):
             getattr(self, '_handle_click_' + str(id))()
 
     def _handle_click_undo(self):
-        self.file.undo_once(self)
+        # a step that is still pending is cancelled instead
+        if not self.cancel_pending_step():
+            self.file.undo_once(self)
 
     def _handle_click_redo(self):
-        self.file.redo_once(self)
+        # the pending steps will clear the redo list
+        if not self.pending_steps:
+            self.file.redo_once(self)
 
     def new_submenu(self, lst):
         self.current_menu_ctrl.show_menu(lst, force=True)
@@ -215,6 +743,14 @@ class App(object):
                 lst.append((u'open_%s' % fullfn, text))
         self.new_submenu(lst)
 
+    def _handle_click_perf(self):
+        self.show_perf = not self.show_perf
+
+    def _handle_click_perflog(self):
+        self.log_perf = not self.log_perf
+        if not self.log_perf:
+            self._close_perf_log()
+
     def _handle_click_edit(self):
         #print self.selected_subgroups
         m = len(self.selected_edges) + len(self.selected_subgroups)
@@ -272,13 +808,11 @@ class App(object):
 
 
 def initialize_functions(ffi, _fn_update, _fn_approx_plane, _fn_show_menu):
-    global fn_update
+    global fn_update, _ffi
     fn_update = _fn_update
+    _ffi = ffi
 
-    def _approx_plane(coords):
-        result = ffi.new("float[4]")
-        _fn_approx_plane(coords, len(coords), result)
-        return result
-    util._approx_plane = _approx_plane
+    # '_fn_approx_plane' is not used any more: planes are fitted in-process
+    # by util._approx_plane(), without a round trip through C# for every face
 
     controller._show_menu = _fn_show_menu
@@ -0,0 +1,86 @@
+"""Batched distance computations for selection.find_closest_*().
+
+For every group we keep packed numpy arrays (edge endpoints, edge
+direction vectors, squared lengths, face planes) in 'group.caches', and
+compute the distances from a position to all the candidates in a single
+pass.  If numpy is not available, ENABLED is False and selection.py uses
+its pure Python loops.
+"""
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+ENABLED = numpy is not None
+
+
+class GroupArrays(object):
+
+    def __init__(self, model, group):
+        coords = model.get_vertex_coords(group).reshape(-1, 3)
+        edges = model.get_edges(group)
+        self.edges = list(edges)
+        i1 = numpy.array([edge._i1 for edge in edges], dtype=numpy.intp)
+        i2 = numpy.array([edge._i2 for edge in edges], dtype=numpy.intp)
+        self.edge_p1 = coords[i1]
+        self.edge_dir = coords[i2] - self.edge_p1
+        self.edge_length2 = (self.edge_dir * self.edge_dir).sum(axis=1)
+
+        faces = model.get_faces(group)
+        self.faces = list(faces)
+        planes = numpy.empty((len(faces), 4))
+        for i, face in enumerate(faces):
+            normal = face.plane.normal
+            planes[i] = (normal.x, normal.y, normal.z, face.plane.distance)
+        self.face_normals = planes[:, :3]
+        self.face_distances = planes[:, 3]
+
+    def edge_measures(self, position):
+        # same as Edge.measure_distance(), for all edges: returns two arrays
+        p2 = numpy.array(position.tolist()) - self.edge_p1
+        dot = (p2 * self.edge_dir).sum(axis=1)
+        length2 = self.edge_length2
+        nonzero = length2 != 0.0
+        frac = numpy.zeros(len(length2))
+        frac[nonzero] = dot[nonzero] / length2[nonzero]
+        diff = p2 - self.edge_dir * frac[:, None]
+        return frac, numpy.sqrt((diff * diff).sum(axis=1))
+
+    def face_signed_distances(self, position):
+        return self.face_normals.dot(position.tolist()) + self.face_distances
+
+
+def get_group_arrays(model, group):
+    return group.cached('batchselect', lambda: GroupArrays(model, group))
+
+def vertex_distances(coords, position):
+    diff = coords.reshape(-1, 3) - position.tolist()
+    return numpy.sqrt((diff * diff).sum(axis=1))
+
+
+def closest_in_order(distances, distance_min, accept):
+    """Equivalent to this loop, but only looking at the few candidates that
+    are close enough:
+
+        for i in range(len(distances)):
+            if distances[i] < distance_min and accept(i):
+                distance_min = distances[i] * 1.01
+                best = i
+
+    Returns (distance_min, best), where 'best' is None if nothing matched.
+    """
+    bound = distance_min * 1.05
+    while True:
+        best = None
+        d_min = peak = distance_min
+        candidates = numpy.flatnonzero(distances < bound)
+        for i, d in zip(candidates.tolist(), distances[candidates].tolist()):
+            if d < d_min and accept(i):
+                d_min = d * 1.01
+                best = i
+                peak = max(peak, d_min)
+        # if 'd_min' was ever above 'bound', we might have skipped a
+        # candidate that the loop would have accepted: try again
+        if peak <= bound or len(candidates) == len(distances):
+            return d_min, best
+        bound = peak * 2.0
@@ -0,0 +1,103 @@
+"""Cost of ModelStep.consolidate_subdivide_edges() as the group grows.
+
+The scenes are stacks of square grids of edges.  Each step adds a
+rectangle at the lowest level which crosses a dozen of the existing
+edges, like drawing on a large face.  The old version, which tests every
+new edge against every edge of the group, is kept here for comparison.
+Run with
+
+    python -m bench.bench_consolidate_edges
+
+from the Python directory.
+"""
+import time
+from util import Vector3, EPSILON
+from model import Model, ModelStep, Edge, Face
+
+
+def old_consolidate_subdivide_edges_group(self, group):
+    # the previous implementation, without a broad phase
+    for fe in self.fe_add:
+        if isinstance(fe, Edge) and fe.group is group:
+            for edge in self.model.get_edges(group):
+                if edge in self.fe_remove:
+                    continue
+                point = edge.intersect_edge(fe)
+                if point is None:
+                    continue
+                if abs(point - edge.v1) > 2 * EPSILON and abs(point - edge.v2) > 2 * EPSILON:
+                    self._remove_edge_and_add_copy(edge)
+    #
+    progress = False
+    all_edges = self._all_active_edges(group)
+    for i, fe in enumerate(self.fe_add):
+        if isinstance(fe, Edge) and fe.group is group:
+            for edge in all_edges:
+                point = edge.intersect_edge(fe)
+                if point is None:
+                    continue
+                if abs(point - fe.v1) > 2 * EPSILON and abs(point - fe.v2) > 2 * EPSILON:
+                    del self.fe_add[i]
+                    fe1 = Edge(group, fe.v1, point)
+                    fe2 = Edge(group, point, fe.v2)
+                    self.fe_add.append(fe1)
+                    self.fe_add.append(fe2)
+                    progress = True
+                    break
+    return progress
+
+
+def grids(n, levels, spacing=0.5):
+    model = Model()
+    step = ModelStep(model, "Grids")
+    group = model.root_group
+    for k in range(levels):
+        z = k * spacing
+        for i in range(n + 1):
+            for j in range(n):
+                # not using add_edge(), which looks for an existing edge first
+                step.fe_add.append(Edge(group, Vector3(i, j, z), Vector3(i, j + 1, z)))
+                step.fe_add.append(Edge(group, Vector3(j, i, z), Vector3(j + 1, i, z)))
+    step._apply_to_model()
+    return model
+
+
+def draw_rectangle(model, size=3):
+    step = ModelStep(model, "Rectangle")
+    group = model.root_group
+    v = [Vector3(0.25, 0.25, 0), Vector3(size + 0.25, 0.25, 0),
+         Vector3(size + 0.25, size + 0.25, 0), Vector3(0.25, size + 0.25, 0)]
+    for m in range(4):
+        step.add_edge(group, v[m - 1], v[m])
+    return step
+
+
+def time_consolidate(model, subdivide):
+    step = draw_rectangle(model)
+    t0 = time.time()
+    while subdivide(step, model.root_group):
+        pass
+    return time.time() - t0, len(step.fe_add)
+
+
+def main():
+    print '%8s %12s %12s %12s %8s' % ('edges', 'bvh build', 'bvh', 'all pairs', 'fe_add')
+    for n, levels in [(5, 2), (10, 2), (15, 2), (20, 5), (40, 4), (50, 10)]:
+        model = grids(n, levels)
+        num_edges = len(model.get_edges(model.root_group))
+        t0 = time.time()
+        model.get_edge_bvh(model.root_group)
+        t_build = time.time() - t0
+        t_new, count_new = time_consolidate(model, ModelStep.consolidate_subdivide_edges_group)
+        if num_edges <= 2000:
+            t_old, count_old = time_consolidate(model, old_consolidate_subdivide_edges_group)
+            assert count_old == count_new
+            old = '%10.1fms' % (t_old * 1000,)
+        else:
+            old = '-'
+        print '%8d %10.1fms %10.1fms %12s %8d' % (num_edges, t_build * 1000, t_new * 1000,
+                                                 old, count_new)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Cost of selection.find_closest_face() as the number of faces grows.
+
+The scenes are stacks of shelves: many parallel horizontal faces, which
+all have their plane close to the controller.  Run with
+
+    python -m bench.bench_facebvh
+
+from the Python directory.
+"""
+import time
+import random
+import batchselect, facebvh, selection
+from util import Vector3
+from model import Model, ModelStep, Edge, Face
+
+
+class FakeApp(object):
+    model_scale = 1.0
+
+    def __init__(self, model):
+        self.model = model
+
+    def scale_ctrl(self, distance):
+        return distance / self.model_scale
+
+
+def shelves(n, levels, size=0.3, spacing=0.04):
+    model = Model()
+    step = ModelStep(model, "Shelves")
+    group = model.root_group
+    for k in range(levels):
+        z = k * spacing
+        for i in range(n):
+            for j in range(n):
+                x = i * size
+                y = j * size
+                v = [Vector3(x, y, z), Vector3(x + size * 0.9, y, z),
+                     Vector3(x + size * 0.9, y + size * 0.9, z), Vector3(x, y + size * 0.9, z)]
+                # not using add_edge(), which looks for an existing edge first
+                edges = [Edge(group, v[m - 1], v[m]) for m in range(4)]
+                step.fe_add += edges
+                step.fe_add.append(Face(edges))
+    step._apply_to_model()
+    return model
+
+
+def time_queries(app, positions, bvh, batch):
+    facebvh.ENABLED = bvh
+    batchselect.ENABLED = batch
+    try:
+        t0 = time.time()
+        for position in positions:
+            selection.find_closest_face(app, position)
+        return (time.time() - t0) * 1e6 / len(positions)
+    finally:
+        facebvh.ENABLED = True
+        batchselect.ENABLED = batchselect.numpy is not None
+
+
+def main():
+    random.seed(42)
+    print '%8s %12s %12s %12s' % ('faces', 'bvh', 'numpy scan', 'python scan')
+    for n, levels in [(5, 4), (10, 4), (10, 16), (20, 16), (40, 16)]:
+        app = FakeApp(shelves(n, levels))
+        positions = [Vector3(random.uniform(0, n * 0.3), random.uniform(0, n * 0.3),
+                             random.uniform(0, levels * 0.04)) for i in range(200)]
+        app.model.get_face_bvh(app.model.root_group)
+        t_bvh = time_queries(app, positions, True, False)
+        t_numpy = time_queries(app, positions, False, True) if batchselect.numpy else float('nan')
+        t_python = time_queries(app, positions[:20], False, False)
+        print '%8d %10.1fus %10.1fus %10.1fus' % (n * n * levels, t_bvh, t_numpy, t_python)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Size and load time of the two .vrsketch formats.
+
+For every scene, the same single step is written as JSON lines, in the
+binary format without compression, and in the binary format with zlib.
+Two load times are given for each: 'parse' only decodes the steps, and
+'load' is the complete document.VRSketchFile(), which also builds the
+model.  A second table gives the load time of a long history of small
+steps, with and without snapshot records.  Run with
+
+    python -m bench.bench_fileformat
+
+from the Python directory.
+"""
+import os
+import time
+import shutil
+import tempfile
+
+import document
+from model import ModelStep, Edge
+from util import Vector3
+from bench import scenes
+
+
+def write(filename, step, binary, compress=True):
+    with open(filename, 'wb') as f:
+        document.write_header(f, binary=binary)
+        if binary:
+            document.write_binary_model_step(f, step, compress=compress)
+        else:
+            document.write_model_step(f, step)
+
+def parse(filename):
+    with open(filename, 'rb') as f:
+        data = f.read()
+    for step in document.enum_steps(data):
+        pass
+
+def best_time(func, filename, repeat=3):
+    best = None
+    for i in range(repeat):
+        t0 = time.time()
+        func(filename)
+        elapsed = time.time() - t0
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def write_history(filename, binary, num_steps, snapshot_every):
+    # a new document with 'num_steps' steps that each add a box of 12
+    # edges and remove one edge of the previous box.  The edges are built
+    # directly instead of with add_edge(), which looks for existing edges.
+    document.NEW_FILES_BINARY = binary
+    document.SNAPSHOT_EVERY_STEPS = snapshot_every
+    document.SNAPSHOT_EVERY_BYTES = None
+    doc = document.VRSketchFile(filename)
+    group = doc.model.root_group
+    previous = []
+    for i in range(num_steps):
+        step = ModelStep(doc.model, "Box %d" % i)
+        x = float(i)
+        corners = [Vector3(x + dx, dy, dz) for dz in (0, 1) for dy in (0, 1) for dx in (0, 0.5)]
+        for a, b in [(0, 1), (2, 3), (4, 5), (6, 7), (0, 2), (1, 3),
+                     (4, 6), (5, 7), (0, 4), (1, 5), (2, 6), (3, 7)]:
+            step.fe_add.append(Edge(group, corners[a], corners[b]))
+        if previous:
+            step.fe_remove.add(previous[0])
+        step._apply_to_model()
+        doc.record_undoable_action(step)
+        previous = [fe for fe in step.fe_add]
+
+def bench_history(tmpdir):
+    saved = (document.NEW_FILES_BINARY, document.SNAPSHOT_EVERY_STEPS,
+             document.SNAPSHOT_EVERY_BYTES)
+    try:
+        print
+        print '%-20s %-12s %10s %10s' % ('history', 'format', 'bytes', 'load')
+        for num_steps in [500, 2000]:
+            for fmt, binary in [("json", False), ("binary", True)]:
+                for snapshot_every in [None, 200]:
+                    filename = os.path.join(tmpdir, 'history_%d_%s_%s.vrsketch' % (
+                        num_steps, fmt, snapshot_every))
+                    write_history(filename, binary, num_steps, snapshot_every)
+                    t_load = best_time(document.VRSketchFile, filename)
+                    label = '%d steps' % num_steps
+                    if snapshot_every:
+                        label += ', snap/%d' % snapshot_every
+                    print '%-20s %-12s %10d %8.1fms' % (
+                        label, fmt, os.path.getsize(filename), t_load * 1000.0)
+    finally:
+        (document.NEW_FILES_BINARY, document.SNAPSHOT_EVERY_STEPS,
+         document.SNAPSHOT_EVERY_BYTES) = saved
+
+
+def main():
+    tmpdir = tempfile.mkdtemp(prefix='vrsketch-bench-')
+    try:
+        print '%-20s %-12s %10s %10s %10s' % ('scene', 'format', 'bytes', 'parse', 'load')
+        for scene_name, n in [("box_grid", 10), ("box_grid", 20),
+                              ("coplanar_faces", 60), ("nested_groups", 4)]:
+            model, step = scenes.make_model(scenes.SCENES[scene_name], n)
+            for fmt, binary, compress in [("json", False, False),
+                                          ("binary", True, False),
+                                          ("binary+zlib", True, True)]:
+                filename = os.path.join(tmpdir, '%s_%d_%s.vrsketch' % (scene_name, n, fmt))
+                write(filename, step, binary, compress)
+                t_parse = best_time(parse, filename)
+                t_load = best_time(document.VRSketchFile, filename)
+                print '%-20s %-12s %10d %8.1fms %8.1fms' % (
+                    '%s %d' % (scene_name, n), fmt, os.path.getsize(filename),
+                    t_parse * 1000.0, t_load * 1000.0)
+        bench_history(tmpdir)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""Micro-benchmarks of the predicates of the 'geom' kernel.
+
+Each predicate is compared with the previous implementation, based on
+Vector3, Line and SinglePoint objects, which is kept here (it is also
+used by test/test_geom.py as a reference).  Run with
+
+    python -m bench.bench_geom
+
+from the Python directory.
+"""
+import time
+import random
+import geom
+from util import Vector3, SinglePoint, Line, EPSILON, EmptyIntersection
+
+
+def old_eq(v1, v2):
+    return abs(v1 - v2) < EPSILON
+
+def old_between(p, p1, p2):
+    p12 = p2 - p1
+    f = p12.dot(p)
+    g = p12.dot(p1)
+    h = p12.dot(p2)
+    if g > h:
+        g, h = h, g
+    return g - EPSILON < f < h + EPSILON
+
+def old_measure_distance(v1, v2, position):
+    p1 = v2 - v1
+    p2 = position - v1
+    dot = p1.dot(p2)
+    length2 = p1.dot(p1)
+    frac = dot / length2 if length2 else 0.0
+    return frac, abs(p2 - p1 * frac)
+
+def old_point_on_segment(v1, v2, point):
+    frac, distance = old_measure_distance(v1, v2, point)
+    return -EPSILON < frac < 1 + EPSILON and distance < EPSILON
+
+def _old_supporting_line(v1, v2):
+    middle = (v1 + v2) * 0.5
+    v = v1 - v2
+    length = abs(v)
+    if length < EPSILON:
+        return SinglePoint(middle)
+    return Line(middle, v / length)
+
+def old_intersect_edge(a1, a2, b1, b2):
+    line1 = _old_supporting_line(a1, a2)
+    line2 = _old_supporting_line(b1, b2)
+    try:
+        sp = line1.intersect(line2)
+    except EmptyIntersection:
+        return None
+    if isinstance(sp, SinglePoint):
+        point = sp.position
+        if old_between(point, a1, a2) and old_between(point, b1, b2):
+            return point
+    return None
+
+def old_signed_distance(normal, d, p):
+    return normal.dot(p) + d
+
+def old_point_in_polygon(u, v, point, vertices):
+    pt = (u.dot(point), v.dot(point))
+    uvs = [(u.dot(p), v.dot(p)) for p in vertices]
+    uv2 = uvs[0]
+    side = 0
+    for i in range(len(uvs) - 1, -1, -1):
+        uv1 = uvs[i]
+        if (uv1[1] < pt[1]) != (uv2[1] < pt[1]):
+            x = uv1[0] + (uv2[0] - uv1[0]) * (pt[1] - uv1[1]) / (uv2[1] - uv1[1])
+            if x < pt[0]:
+                side += -1 if uv1[1] < uv2[1] else 1
+        uv2 = uv1
+    return side != 0
+
+
+def random_point():
+    return Vector3(random.uniform(0, 1), random.uniform(0, 1), random.uniform(0, 1))
+
+def t(v):
+    return (v.x, v.y, v.z)
+
+
+def time_per_call(func, args_list, repeat=5):
+    best = None
+    for i in range(repeat):
+        t0 = time.time()
+        for args in args_list:
+            func(*args)
+        elapsed = time.time() - t0
+        if best is None or elapsed < best:
+            best = elapsed
+    return best * 1e9 / len(args_list)
+
+
+def main():
+    random.seed(42)
+    n = 20000
+    pts = [random_point() for i in range(4 * n)]
+    quads = [pts[4 * i: 4 * i + 4] for i in range(n)]
+    # half of the segment pairs are coplanar, and most of these intersect
+    for q in quads[::2]:
+        q[3] = q[0] + (q[1] - q[0]) * 0.7 + (q[2] - q[0]) * 0.6
+    polygon = [Vector3(0, 0, 0), Vector3(1, 0, 0), Vector3(1, 1, 0), Vector3(0.5, 0.4, 0),
+               Vector3(0, 1, 0)]
+    u = Vector3(1, 0, 0)
+    v = Vector3(0, 1, 0)
+    normal = Vector3(0, 0, 1)
+    tpolygon = [t(p) for p in polygon]
+
+    rows = [
+        ('__eq__', old_eq, [(q[0], q[1]) for q in quads],
+                   Vector3.__eq__, [(q[0], q[1]) for q in quads]),
+        ('between', old_between, [(q[0], q[1], q[2]) for q in quads],
+                    geom.between, [(t(q[0]), t(q[1]), t(q[2])) for q in quads]),
+        ('measure_distance', old_measure_distance, [(q[0], q[1], q[2]) for q in quads],
+                    geom.measure_distance, [(t(q[0]), t(q[1]), t(q[2])) for q in quads]),
+        ('point_on_segment', old_point_on_segment, [(q[0], q[1], q[2]) for q in quads],
+                    geom.point_on_segment, [(t(q[0]), t(q[1]), t(q[2])) for q in quads]),
+        ('intersect_edge', old_intersect_edge, [tuple(q) for q in quads],
+                    geom.intersect_segments, [tuple(t(p) for p in q) for q in quads]),
+        ('signed_distance', old_signed_distance, [(normal, 0.5, q[0]) for q in quads],
+                    geom.signed_distance, [((0., 0., 1.), 0.5, t(q[0])) for q in quads]),
+        ('point_in_polygon', old_point_in_polygon, [(u, v, q[0], polygon) for q in quads],
+                    geom.point_in_polygon, [((1., 0., 0.), (0., 1., 0.), t(q[0]), tpolygon)
+                                            for q in quads]),
+    ]
+    print '%-18s %10s %10s %8s' % ('predicate', 'old', 'kernel', 'speedup')
+    for name, old_func, old_args, new_func, new_args in rows:
+        t_old = time_per_call(old_func, old_args)
+        t_new = time_per_call(new_func, new_args)
+        print '%-18s %8.0fns %8.0fns %7.1fx' % (name, t_old, t_new, t_old / t_new)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Bucket-length distribution and lookup time of GeometryDict.
+
+Compares the 3-D grid-cell hash of util.GeometryDict with the previous
+hash, which projected every key on a single direction.  Run with
+
+    python -m bench.bench_geometrydict
+
+from the Python directory.
+"""
+import math
+import time
+import random
+from util import Vector3, GeometryDict, EPSILON
+
+
+class ProjectedGeometryDict(object):
+    # the previous implementation, kept here for comparison: every key
+    # is stored in the two buckets floor(h) and floor(h) + 1, where h is the
+    # projection of the key on a fixed direction
+    def __init__(self):
+        self._dict = {}
+
+    def _v_hash0(self, v):
+        return v.x * 5e4 + v.y * 4.19812e4 + v.z * 3.8219e4
+
+    def _find_entry(self, v):
+        h = math.floor(self._v_hash0(v))
+        for h1 in (h, h + 1.0):
+            for entry in self._dict.get(h1, ()):
+                if entry[0] == v:
+                    return entry
+        return None
+
+    def __contains__(self, v):
+        return self._find_entry(v) is not None
+
+    def __setitem__(self, v, value):
+        entry = self._find_entry(v)
+        if entry is not None:
+            entry[1] = value
+            return
+        entry = [v, value]
+        h = math.floor(self._v_hash0(v))
+        self._dict.setdefault(h, []).append(entry)
+        self._dict.setdefault(h + 1.0, []).append(entry)
+
+    def __len__(self):
+        seen = set()
+        for lst in self._dict.values():
+            seen.update(map(id, lst))
+        return len(seen)
+
+    def _bucket_lengths(self):
+        return [len(lst) for lst in self._dict.values()]
+
+
+def building_grid(nx=30, ny=30, nz=8, spacing=0.6, height=2.7):
+    # the corners of a grid of rooms, floor after floor
+    return [Vector3(i * spacing, j * spacing, k * height)
+            for i in range(nx + 1) for j in range(ny + 1) for k in range(nz + 1)]
+
+def facade(width=40.0, height=20.0, step=0.1):
+    # a finely subdivided vertical facade, in the x-z plane
+    nw = int(width / step)
+    nh = int(height / step)
+    return [Vector3(i * step, 0.0, k * step) for i in range(nw + 1) for k in range(nh + 1)]
+
+def tilted_slab(n=50, step=0.02):
+    # a grid lying in the plane orthogonal to the direction used by the old
+    # hash; every point of it falls into the same few buckets
+    normal = Vector3(5e4, 4.19812e4, 3.8219e4).normalized()
+    u = normal.some_normal_vector().normalized()
+    v = normal.cross(u)
+    return [u * (i * step) + v * (j * step) for i in range(n) for j in range(n)]
+
+
+def bucket_stats(lengths):
+    lengths = sorted(lengths)
+    total = float(sum(lengths))
+    # average length of the bucket that a random key lands in
+    weighted = sum(l * l for l in lengths) / total
+    return {"buckets": len(lengths),
+            "max": lengths[-1],
+            "p99": lengths[int(len(lengths) * 0.99)],
+            "mean_seen": weighted}
+
+def measure(dict_cls, points, probes):
+    d = dict_cls()
+    t0 = time.time()
+    for i, v in enumerate(points):
+        d[v] = i
+    t1 = time.time()
+    for v in probes:
+        v in d
+    t2 = time.time()
+    stats = bucket_stats(d._bucket_lengths())
+    stats["insert_us"] = (t1 - t0) * 1e6 / len(points)
+    stats["lookup_us"] = (t2 - t1) * 1e6 / len(probes)
+    assert len(d) == len(points)
+    return stats
+
+
+def main():
+    random.seed(42)
+    scenes = [("building grid", building_grid()),
+              ("facade", facade()),
+              ("tilted slab", tilted_slab())]
+    for name, points in scenes:
+        probes = [v + Vector3(random.uniform(-0.5, 0.5) * EPSILON,
+                              random.uniform(-0.5, 0.5) * EPSILON,
+                              random.uniform(-0.5, 0.5) * EPSILON)
+                  for v in random.sample(points, min(2000, len(points)))]
+        print '%s: %d points' % (name, len(points))
+        for label, cls in [("projected", ProjectedGeometryDict),
+                           ("3-D cells", GeometryDict)]:
+            s = measure(cls, points, probes)
+            print ('    %-10s buckets=%-7d max=%-6d p99=%-4d mean seen=%-9.1f '
+                   'insert=%.1fus lookup=%.1fus' % (
+                label, s["buckets"], s["max"], s["p99"], s["mean_seen"],
+                s["insert_us"], s["lookup_us"]))
+
+
+if __name__ == '__main__':
+    main()
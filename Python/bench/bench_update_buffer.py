@@ -0,0 +1,122 @@
+"""Benchmark of serializing the world objects sent to Unity.
+
+Three ways of sending a frame are compared:
+
+  * per-object: one fn_update() call per object with its getrawdata()
+    list, like when app.BATCH_UPDATES is False;
+  * list batch: the getrawdata() lists concatenated into a single list,
+    converted once;
+  * writeraw batch: app.UpdateBatch, where every object writes its data
+    directly into a reused array of floats with writeraw().
+
+There is no Unity process.  The stub fn_update() converts its data to an
+array of 32-bit floats, which is roughly what cffi does when it passes a
+Python list as a 'float[]' argument; the cost on the C# side is not
+measured.  The frames are 10000 Stem and Polygon updates, and the first
+frame after opening box grids of various sizes.  Run with
+
+    python -m bench.bench_update_buffer
+
+from the Python directory.
+"""
+import os
+import time
+import array
+import random
+import shutil
+import tempfile
+
+import app as app_module
+import controller
+from util import Vector3
+from worldobj import Stem, ColoredPolygon
+from bench import scenes, suite
+
+
+def fn_update(index, kind, raw, length):
+    if not isinstance(raw, array.array):
+        array.array('f', raw)
+    fn_update.calls += 1
+
+def show_menu(index, text):
+    pass
+
+
+def send_per_object(objects):
+    for i, wo in enumerate(objects):
+        raw = wo.getrawdata()
+        fn_update(i, wo._kind, raw, len(raw))
+
+def send_list_batch(objects):
+    data = []
+    for i, wo in enumerate(objects):
+        raw = wo.getrawdata()
+        data.append(i)
+        data.append(wo._kind)
+        data.append(len(raw))
+        data += raw
+    fn_update(len(objects), app_module.KIND_BATCH, data, len(data))
+
+def make_send_writeraw_batch():
+    batch = app_module.UpdateBatch()
+    def send_writeraw_batch(objects):
+        for i, wo in enumerate(objects):
+            batch.add(i, wo)
+        batch.send(fn_update)
+    return send_writeraw_batch
+
+def best_time(func, objects, repeat=10):
+    best = None
+    for i in range(repeat):
+        fn_update.calls = 0
+        t0 = time.time()
+        func(objects)
+        elapsed = time.time() - t0
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def random_vector():
+    return Vector3(random.uniform(-5, 5), random.uniform(-5, 5), random.uniform(0, 3))
+
+def stems_and_polygons(count):
+    objects = []
+    for i in range(count // 2):
+        objects.append(Stem(random_vector(), random_vector(), 0x808080))
+        objects.append(ColoredPolygon([random_vector() for j in range(4)], 0x757575))
+    return objects
+
+def box_grid_frame(tmpdir, n):
+    # the world objects sent by the first frame after opening a box grid
+    model, step = scenes.make_model(scenes.box_grid, n)
+    filename = os.path.join(tmpdir, 'grid_%d.vrsketch' % (n,))
+    suite.write_vrsketch(filename, step)
+    app = app_module.App(filename)
+    return list(app.pending_updates)
+
+
+def main():
+    random.seed(42)
+    app_module.fn_update = fn_update
+    controller._show_menu = show_menu
+    tmpdir = tempfile.mkdtemp(prefix='vrsketch-bench-')
+    try:
+        frames = [('stems+polygons', stems_and_polygons(10000))]
+        for n in [10, 20]:
+            frames.append(('box_grid %d' % (n,), box_grid_frame(tmpdir, n)))
+
+        print '%-16s %8s %12s %12s %12s' % ('frame', 'objects', 'per-object',
+                                            'list batch', 'writeraw')
+        for name, objects in frames:
+            t1 = best_time(send_per_object, objects)
+            t2 = best_time(send_list_batch, objects)
+            t3 = best_time(make_send_writeraw_batch(), objects)
+            print '%-16s %8d %10.1fms %10.1fms %10.1fms' % (name, len(objects), t1 * 1000.0,
+                                                           t2 * 1000.0, t3 * 1000.0)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
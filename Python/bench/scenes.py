@@ -0,0 +1,102 @@
+"""Parametric scene generators for the benchmarks.
+
+Every generator takes a Model and returns a ModelStep that has not been
+applied yet: make_model() applies it, and bench/suite.py also writes it
+out to build .vrsketch files.  The edges and faces are built directly
+instead of with ModelStep.add_edge(), which looks for an existing edge
+first and would make building big scenes quadratic.
+"""
+from util import Vector3
+from model import Model, ModelStep, Group, Edge, Face
+
+
+def _add_polygon(step, group, vertices):
+    edges = [Edge(group, vertices[i - 1], vertices[i]) for i in range(len(vertices))]
+    step.fe_add += edges
+    step.fe_add.append(Face(edges))
+
+def _add_box(step, group, corner, size):
+    # 12 edges and 6 faces; the edges are not shared between the faces,
+    # like the boxes drawn with the rectangle and push/pull tools before
+    # consolidation
+    x0, y0, z0 = corner.x, corner.y, corner.z
+    x1, y1, z1 = x0 + size.x, y0 + size.y, z0 + size.z
+    p = [Vector3(x0, y0, z0), Vector3(x1, y0, z0), Vector3(x1, y1, z0), Vector3(x0, y1, z0),
+         Vector3(x0, y0, z1), Vector3(x1, y0, z1), Vector3(x1, y1, z1), Vector3(x0, y1, z1)]
+    for indices in [(0, 3, 2, 1), (4, 5, 6, 7), (0, 1, 5, 4),
+                    (1, 2, 6, 5), (2, 3, 7, 6), (3, 0, 4, 7)]:
+        _add_polygon(step, group, [p[i] for i in indices])
+
+
+def box_grid(model, n, size=1.0, gap=0.5):
+    """n x n boxes on the ground, in the root group."""
+    step = ModelStep(model, "Box grid")
+    pitch = size + gap
+    for i in range(n):
+        for j in range(n):
+            _add_box(step, model.root_group, Vector3(i * pitch, j * pitch, 0.0),
+                     Vector3(size, size, size * (1 + (i + j) % 3)))
+    return step
+
+def nested_groups(model, depth, fanout=3, size=1.0):
+    """A tree of groups of the given depth, each containing one box and
+    'fanout' subgroups."""
+    step = ModelStep(model, "Nested groups")
+    def fill(group, level, origin):
+        _add_box(step, group, origin, Vector3(size, size, size))
+        if level < depth:
+            span = (fanout + 1) ** (depth - level - 1) * size * 2
+            for k in range(fanout):
+                fill(Group(group), level + 1, origin + Vector3(span * (k + 1), 0, size * 2))
+    fill(model.root_group, 0, Vector3(0.0, 0.0, 0.0))
+    return step
+
+def polyline(model, n, step_length=0.1):
+    """A single long zig-zag polyline of n edges, in the root group."""
+    step = ModelStep(model, "Polyline")
+    points = [Vector3(i * step_length, (i % 2) * step_length, (i // 50) * step_length)
+              for i in range(n + 1)]
+    for i in range(n):
+        step.fe_add.append(Edge(model.root_group, points[i], points[i + 1]))
+    return step
+
+def coplanar_faces(model, n, size=0.2):
+    """n x n squares in the same horizontal plane, sharing their edges."""
+    step = ModelStep(model, "Coplanar faces")
+    group = model.root_group
+    def p(i, j):
+        return Vector3(i * size, j * size, 0.0)
+    horizontal = {}
+    vertical = {}
+    for i in range(n + 1):
+        for j in range(n + 1):
+            if i < n:
+                horizontal[i, j] = Edge(group, p(i, j), p(i + 1, j))
+            if j < n:
+                vertical[i, j] = Edge(group, p(i, j), p(i, j + 1))
+    step.fe_add += horizontal.values()
+    step.fe_add += vertical.values()
+    for i in range(n):
+        for j in range(n):
+            # the faces go around counter-clockwise; the edges are
+            # oriented to match, so some of them are reversed copies
+            edges = [horizontal[i, j], vertical[i + 1, j],
+                     Edge(group, p(i + 1, j + 1), p(i, j + 1)),
+                     Edge(group, p(i, j + 1), p(i, j))]
+            step.fe_add += edges[2:]
+            step.fe_add.append(Face(edges))
+    return step
+
+
+SCENES = {
+    'box_grid': box_grid,
+    'nested_groups': nested_groups,
+    'polyline': polyline,
+    'coplanar_faces': coplanar_faces,
+}
+
+def make_model(generator, *args):
+    model = Model()
+    step = generator(model, *args)
+    step._apply_to_model()
+    return model, step
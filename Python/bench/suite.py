@@ -0,0 +1,268 @@
+"""Benchmark suite for the model and selection layers.
+
+Runs timed scenarios over the scenes of bench/scenes.py and prints one
+line per measurement.  With --json, the results are also written in a
+machine-readable form, which can be compared between versions.  Run with
+
+    python -m bench.suite [--quick] [--json results.json] [scenario...]
+
+from the Python directory.  There is no Unity process: app.fn_update and
+controller._show_menu are replaced by stubs that only count the calls.
+The planes of the faces are fitted in-process by util._approx_plane.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+import app as app_module
+import controller
+import document
+import face_reduction
+import selection
+from util import Vector3
+from model import ModelStep, Edge
+from bench import scenes
+
+
+class FakeApp(object):
+    # the minimum needed by the selection functions
+    model_scale = 1.0
+
+    def __init__(self, model):
+        self.model = model
+        self.curgroup = model.root_group
+
+    def scale_ctrl(self, distance):
+        return distance / self.model_scale
+
+
+class Results(object):
+
+    def __init__(self):
+        self.entries = []
+
+    def add(self, scenario, scene, size, seconds, calls=1, **extra):
+        entry = {"scenario": scenario, "scene": scene, "size": size,
+                 "seconds": seconds, "calls": calls,
+                 "per_call_us": seconds * 1e6 / calls}
+        entry.update(extra)
+        self.entries.append(entry)
+        print '%-20s %-16s %8s %12.1fus/call %6d calls' % (
+            scenario, scene, size, entry["per_call_us"], calls)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       stderr=subprocess.STDOUT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def random_positions(model, count):
+    vmin, vmax = model.get_bounding_box(model.root_group, 0.1)
+    return [Vector3(random.uniform(vmin.x, vmax.x),
+                    random.uniform(vmin.y, vmax.y),
+                    random.uniform(vmin.z, vmax.z)) for i in range(count)]
+
+def write_vrsketch(filename, step, binary=False):
+    with open(filename, 'wb') as f:
+        document.write_header(f, binary=binary)
+        document.write_model_step(f, step, binary=binary)
+
+
+# ---------- scenarios ----------
+
+def bench_consolidate(results, sizes):
+    # split the top face of a box with a diagonal, in a grid of boxes
+    for n in sizes:
+        model, _ = scenes.make_model(scenes.box_grid, n)
+        group = model.root_group
+        model.get_edge_bvh(group)
+        repeat = 5
+        t0 = time.time()
+        for i in range(repeat):
+            step = ModelStep(model, "Diagonal")
+            step.add_edge(group, Vector3(0, 0, 1), Vector3(1, 1, 1))
+            step.consolidate(None)
+        results.add("consolidate", "box_grid", n, time.time() - t0, repeat,
+                    edges=len(model.get_edges(group)))
+
+def bench_find_closest(results, sizes):
+    for scene_name, generator in [("box_grid", scenes.box_grid),
+                                  ("coplanar_faces", scenes.coplanar_faces),
+                                  ("nested_groups", scenes.nested_groups)]:
+        for n in sizes[scene_name]:
+            model, _ = scenes.make_model(generator, n)
+            app = FakeApp(model)
+            positions = random_positions(model, 200)
+            selection.find_closest(app, positions[0])    # build the caches
+            t0 = time.time()
+            for position in positions:
+                selection.find_closest(app, position)
+            results.add("find_closest", scene_name, n, time.time() - t0, len(positions),
+                        faces=len(model.all_faces()), edges=len(model.all_edges()))
+
+def bench_potential_new_face(results, sizes):
+    for n in sizes:
+        model, _ = scenes.make_model(scenes.polyline, n)
+        group = model.root_group
+        positions = random_positions(model, 50)
+        t0 = time.time()
+        face_reduction.all_potential_planes(model, group)
+        results.add("potential_planes", "polyline", n, time.time() - t0)
+        t0 = time.time()
+        for position in positions:
+            face_reduction.potential_new_face(model, group, position)
+        results.add("potential_new_face", "polyline", n, time.time() - t0, len(positions))
+
+def bench_edge_access(results, sizes):
+    # Reading v1 and v2 of the edges of the model builds new Vector3s from
+    # the VertexTable of the group, which is slower than reading them from
+    # edges that are not in the model (as all edges were before the
+    # VertexTable).  coords() returns tuples instead.
+    for n in sizes:
+        model, _ = scenes.make_model(scenes.box_grid, n)
+        edges = model.all_edges()
+        detached = [Edge(edge.group, edge.v1, edge.v2) for edge in edges]
+        repeat = 5
+        for scenario, lst, read in [
+                ("edge_v1_v2", edges, lambda edge: (edge.v1, edge.v2)),
+                ("edge_v1_v2_detached", detached, lambda edge: (edge.v1, edge.v2)),
+                ("edge_coords", edges, Edge.coords)]:
+            t0 = time.time()
+            for i in range(repeat):
+                for edge in lst:
+                    read(edge)
+            results.add(scenario, "box_grid", n, time.time() - t0, repeat * len(lst))
+
+def bench_load(results, sizes, tmpdir, binary=False):
+    scenario = "load_binary" if binary else "load"
+    for scene_name, generator in [("box_grid", scenes.box_grid),
+                                  ("coplanar_faces", scenes.coplanar_faces)]:
+        for n in sizes[scene_name]:
+            model, step = scenes.make_model(generator, n)
+            filename = os.path.join(tmpdir, '%s_%d.vrsketch' % (scene_name, n))
+            write_vrsketch(filename, step, binary=binary)
+            t0 = time.time()
+            document.VRSketchFile(filename)
+            results.add(scenario, scene_name, n, time.time() - t0,
+                        file_bytes=os.path.getsize(filename))
+
+def bench_handle_frame(results, sizes, tmpdir):
+    update_calls = [0]
+    def fn_update(index, kind, raw, length):
+        update_calls[0] += 1
+    def show_menu(index, text):
+        pass
+    app_module.fn_update = fn_update
+    controller._show_menu = show_menu
+
+    for n in sizes:
+        model, step = scenes.make_model(scenes.box_grid, n)
+        filename = os.path.join(tmpdir, 'frame_%d.vrsketch' % (n,))
+        write_vrsketch(filename, step)
+        update_calls[0] = 0
+        t0 = time.time()
+        app = app_module.App(filename)
+        frame = [0.0] * 4 + [1.0, 0.0, 0.0, 1.7, 0.0]
+        app.handle_frame(1, frame)
+        results.add("open_first_frame", "box_grid", n, time.time() - t0,
+                    fn_update_calls=update_calls[0])
+        #
+        # one controller hovering around with the select tool
+        positions = random_positions(app.model, 100)
+        update_calls[0] = 0
+        skipped = 0
+        t0 = time.time()
+        for i, position in enumerate(positions):
+            frame = [position.x, position.y, position.z, 0.0,
+                     1.0, i / 90.0, 0.0, 1.7, 0.0]
+            app.handle_frame(1, frame)
+            skipped += app.frame_stats["skipped"]
+        results.add("handle_frame", "box_grid", n, time.time() - t0, len(positions),
+                    fn_update_calls=update_calls[0], skipped_updates=skipped)
+
+
+SIZES = {
+    "full": {
+        "consolidate": [4, 10, 20],
+        "find_closest": {"box_grid": [4, 10, 20], "coplanar_faces": [10, 30],
+                         "nested_groups": [3, 5]},
+        "potential_new_face": [50, 200],
+        "edge_access": [10, 20],
+        "load": {"box_grid": [10, 20], "coplanar_faces": [30]},
+        "load_binary": {"box_grid": [10, 20], "coplanar_faces": [30]},
+        "handle_frame": [5, 15],
+    },
+    "quick": {
+        "consolidate": [3],
+        "find_closest": {"box_grid": [3], "coplanar_faces": [5], "nested_groups": [2]},
+        "potential_new_face": [30],
+        "edge_access": [3],
+        "load": {"box_grid": [3], "coplanar_faces": [5]},
+        "load_binary": {"box_grid": [3], "coplanar_faces": [5]},
+        "handle_frame": [3],
+    },
+}
+
+SCENARIOS = ["consolidate", "find_closest", "potential_new_face", "edge_access", "load",
+             "load_binary", "handle_frame"]
+
+
+def run(scenarios, quick=False):
+    random.seed(42)
+    sizes = SIZES["quick" if quick else "full"]
+    results = Results()
+    tmpdir = tempfile.mkdtemp(prefix='vrsketch-bench-')
+    try:
+        for name in scenarios:
+            if name == "consolidate":
+                bench_consolidate(results, sizes[name])
+            elif name == "find_closest":
+                bench_find_closest(results, sizes[name])
+            elif name == "potential_new_face":
+                bench_potential_new_face(results, sizes[name])
+            elif name == "edge_access":
+                bench_edge_access(results, sizes[name])
+            elif name == "load":
+                bench_load(results, sizes[name], tmpdir)
+            elif name == "load_binary":
+                bench_load(results, sizes[name], tmpdir, binary=True)
+            elif name == "handle_frame":
+                bench_handle_frame(results, sizes[name], tmpdir)
+            else:
+                raise ValueError("unknown scenario: %r" % (name,))
+    finally:
+        shutil.rmtree(tmpdir)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of the model and selection layers.')
+    parser.add_argument('scenarios', metavar='scenario', nargs='*', default=SCENARIOS,
+                        help='scenarios to run (default: all of %s)' % (', '.join(SCENARIOS),))
+    parser.add_argument('--quick', action='store_true', help='use small scenes only')
+    parser.add_argument('--json', metavar='FILE', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = run(args.scenarios, quick=args.quick)
+    if args.json:
+        data = {"revision": git_revision(),
+                "python": sys.version.split()[0],
+                "quick": args.quick,
+                "time": time.strftime('%Y-%m-%dT%H:%M:%S'),
+                "results": results.entries}
+        with open(args.json, 'w') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+            f.write('\n')
+        print args.json, 'written.'
+
+
+if __name__ == '__main__':
+    main()
@@ -128,8 +128,10 @@ class ControllersMgr(object):
                     key = 'edit'
                 text = u"\u2714 " + text
             yield (key, text)
-        uactions = self.app.file.undoable_actions
-        ractions = self.app.file.redoable_actions
+        uactions = self.app.file.undoable_actions + self.app.pending_steps
+        ractions = self.app.file.redoable_actions if not self.app.pending_steps else []
         yield ('undo', ('Undo %s' % uactions[-1].name) if uactions else '(Undo)')
         yield ('redo', ('Redo %s' % ractions[-1].name) if ractions else '(Redo)')
         yield ('open', 'Open document...')
+        yield ('perf', (u"\u2714 " if self.app.show_perf else u"") + u"Show performance")
+        yield ('perflog', (u"\u2714 " if self.app.log_perf else u"") + u"Log performance")
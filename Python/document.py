@@ -1,11 +1,62 @@
 import os
+import sys
 import json
-from model import Edge, Face, Model, ModelStep, Group, Physics
+import zlib
+import mmap
+import Queue
+import threading
+import array
+import bisect
+import struct
+import perf
+from model import Edge, Face, Model, ModelStep, Group, Physics, update_planes
 from util import Vector3
 
 HEADER = "vrsketch"
 VERSION = "0.1"
 
+# The binary format starts with BINARY_MAGIC and a version byte, and then
+# contains one record per step or snapshot; see write_binary_model_step().
+# It is detected when loading.  New documents use it if NEW_FILES_BINARY.
+BINARY_MAGIC = "\x89VRSKETCH\r\n\x1a\n"
+BINARY_VERSION = 1
+NEW_FILES_BINARY = False
+
+# in the binary format, the steps whose encoding is at least this many
+# bytes are compressed with zlib, if that makes them smaller
+COMPRESS_MIN_SIZE = 512
+
+# After a step, a snapshot record with the complete model is written if at
+# least SNAPSHOT_EVERY_STEPS steps, or SNAPSHOT_EVERY_BYTES bytes of steps,
+# were written since the previous one (None to disable either rule).
+# Loading starts from the latest valid snapshot and replays only the steps
+# after it; the steps before it are reconstructed if they are undone.
+SNAPSHOT_EVERY_STEPS = 200
+SNAPSHOT_EVERY_BYTES = 1024 * 1024
+
+# If LAZY_HISTORY, only the last LAZY_HISTORY_KEEP steps are kept as
+# ModelSteps in 'undoable_actions'.  The older ones are only kept as their
+# positions in the file, and decoded again if they are undone, so that the
+# memory used depends on the model and not on the length of the history.
+LAZY_HISTORY = False
+LAZY_HISTORY_KEEP = 50
+
+_FLAG_ZLIB = 0x01
+_FLAG_SNAPSHOT = 0x02
+
+# The records are encoded and written by a writer thread, which is fed by
+# a queue of at most WRITER_QUEUE_SIZE records; recording a step waits if
+# the queue is full.  The file is flushed after every record if
+# WRITER_FLUSH is 'always', or only when the queue is empty if it is
+# 'idle'.  If WRITER_FSYNC, every flush is followed by an fsync, so that
+# the records survive a crash of the system and not only of the process.
+WRITER_QUEUE_SIZE = 64
+WRITER_FLUSH = 'idle'
+WRITER_FSYNC = False
+
+# the exceptions raised when decoding a corrupted record
+_DECODE_ERRORS = (ValueError, KeyError, IndexError, TypeError, zlib.error)
+
 
 class VRSketchFile(object):
 
@@ -14,108 +65,198 @@ class VRSketchFile(object):
         self.model = Model()
         self.undoable_actions = []
         self.redoable_actions = []
+        self.snapshots = []     # positions of the snapshot records
+        self.invalid_snapshots = []    # positions of the ones that were ignored
+        self._writer = None     # created by _get_writer()
+        self._snapshot_after = None    # the step followed by the latest snapshot
         if os.path.exists(filename):
             with self.openfile('rb') as f:
                 self._load_data(f)
         else:
+            self.binary = NEW_FILES_BINARY
             with self.openfile('wb+') as f:
-                write_header(f)
+                write_header(f, binary=self.binary)
             self.populate_initial_model()
 
     def openfile(self, mode):
         return open(self.filename, mode)
 
-    def _enum_json(self, f):
-        f.seek(0)
-        while True:
-            pos = f.tell()
-            line = f.readline()
-            if not line:
-                break
-            if not line.endswith('\n'):
-                raise ValueError("file contains a non-terminated line")
-            line = line.strip()
-            if line:
-                yield (pos, json.loads(line))
+    def _decode_snapshot(self, data, pos):
+        # returns None if the snapshot record is invalid
+        try:
+            return _decode_snapshot(_read_record(data, pos, self.binary), self.binary)
+        except _DECODE_ERRORS:
+            if pos not in self.invalid_snapshots:
+                self.invalid_snapshots.append(pos)
+            return None
 
+    def _decode_step(self, data, pos):
+        return _decode_step(_read_record(data, pos, self.binary), self.binary)
 
     def _load_data(self, f):
         # assumes an empty 'self.model' and 'self.undoable_actions',
-        # and fill them by loading the file
-        enum = self._enum_json(f)
-        _, header = next(enum)
-        if header.get("a") != HEADER:
-            raise ValueError(header.get("a"))
-        #
-        def find_group_name(grname):
+        # and fill them by loading the file, in either format
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._load_mapped(data)
+        finally:
+            data.close()
+
+    def _load_mapped(self, data):
+        # The model is built from the latest valid snapshot, if any, and
+        # only the steps after it are replayed.  The steps before it are
+        # left to _reconstruct_older_steps().
+        self.binary = _is_binary(data)
+        records = [(pos, is_snapshot)
+                   for pos, is_snapshot, raw in _enum_records(data, self.binary)]
+        snapshot = None
+        for index in range(len(records) - 1, -1, -1):
+            pos, is_snapshot = records[index]
+            if is_snapshot:
+                snapshot = self._decode_snapshot(data, pos)
+                if snapshot is not None:
+                    break
+        else:
+            index = -1
+        builder = _ModelBuilder(self.model)
+        if snapshot is not None:
+            builder.load_snapshot(snapshot)
+            positions = array.array('l', [pos for pos, is_snapshot in records[:index]
+                                          if not is_snapshot])
+            if positions:
+                self.undoable_actions.append(_OlderSteps(snapshot[0], positions))
+        self.snapshots = [pos for pos, is_snapshot in records[:index + 1] if is_snapshot]
+        for pos, is_snapshot in records[index + 1:]:
+            if not is_snapshot:
+                model_step = builder.build_step(pos, *self._decode_step(data, pos))
+                model_step._apply_to_model()
+                self.undoable_actions.append(model_step)
+        builder.finish()
+        self._forget_older_steps()
+
+    def _reconstruct_older_steps(self):
+        # Replaces the _OlderSteps at the start of 'undoable_actions' with
+        # the ModelSteps after the latest valid snapshot before its last
+        # step.  The model must be in the state after its last step, i.e.
+        # all the following steps have been undone.  The edges and faces
+        # that are still in the model are reused; the others are built again.
+        older = self.undoable_actions[0]
+        positions = older.positions
+        replaced = []
+        with self.openfile('rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
             try:
-                group = subgroups_by_gid[grname]
-            except KeyError:
-                if "/" in grname:
-                    parent_name, name = grname.rsplit("/", 1)
-                    parent_group = find_group_name(parent_name)
-                else:
-                    name = grname
-                    parent_group = self.model.root_group
-                group = subgroups_by_gid[grname] = Group(parent_group, gid=int(name))
-            return group
-        subgroups_by_gid = {}
-        #
-        edges_by_eid = {}
-        faces_by_fid = {}
-        for pos, entry in enum:
-            model_step = ModelStep(self.model, entry["a"])
-            model_step.file_position = pos
+                builder = _ModelBuilder(self.model)
+                builder.add_model_objects()
+                start = 0
+                for snapshot_pos in reversed(self.snapshots):
+                    if snapshot_pos < positions[-1]:
+                        snapshot = self._decode_snapshot(data, snapshot_pos)
+                        if snapshot is not None:
+                            # the edges and faces at the time of the snapshot,
+                            # for the steps that remove them
+                            name, counters, group_paths, edges, faces = snapshot
+                            builder.build_step(None, name, [], [], edges, faces, reuse=True)
+                            start = bisect.bisect(positions, snapshot_pos)
+                            if start > 0:
+                                replaced.append(_OlderSteps(name, positions[:start]))
+                            break
+                for pos in positions[start:]:
+                    replaced.append(builder.build_step(pos, *self._decode_step(data, pos),
+                                                       reuse=True))
+                builder.finish()
+            finally:
+                data.close()
+        self.undoable_actions[0:1] = replaced
 
-            if "remove" in entry:
-                for remove_id in entry["remove"]:
-                    if remove_id.startswith('e'):
-                        eid = int(remove_id[1:])
-                        item = edges_by_eid[eid]
-                    elif remove_id.startswith('f'):
-                        fid = int(remove_id[1:])
-                        item = faces_by_fid[fid]
-                    else:
-                        raise ValueError(remove_id)
-                    model_step.fe_remove.add(item)
-
-            if "add" in entry:
-                for add1 in entry["add"]:
-                    add_id = add1["id"]
-                    if add_id.startswith('e'):
-                        eid = int(add_id[1:])
-                        v1 = Vector3(*add1["v1"])
-                        v2 = Vector3(*add1["v2"])
-                        if "group" in add1:
-                            group = find_group_name(add1["group"])
-                        else:
-                            group = self.model.root_group
-                        item = Edge(group, v1, v2, eid=eid)
-                        edges_by_eid[eid] = item
-                    elif add_id.startswith('f'):
-                        fid = int(add_id[1:])
-                        edges = []
-                        for edge_id in add1["edges"]:
-                            assert edge_id.startswith('e')
-                            eid = int(edge_id[1:])
-                            edges.append(edges_by_eid[eid])
-                        physics = Physics(color=add1.get("color"))
-                        item = Face(edges, fid=fid, physics=physics)
-                        faces_by_fid[fid] = item
-                    else:
-                        raise ValueError(add_id)
-                    model_step.fe_add.append(item)
-
-            model_step._apply_to_model()
-            self.undoable_actions.append(model_step)
+    def _forget_older_steps(self):
+        # with LAZY_HISTORY, moves the ModelSteps before the last
+        # LAZY_HISTORY_KEEP ones to the _OlderSteps at the start
+        if not LAZY_HISTORY:
+            return
+        actions = self.undoable_actions
+        start = 1 if actions and isinstance(actions[0], _OlderSteps) else 0
+        excess = len(actions) - start - LAZY_HISTORY_KEEP
+        if excess <= 0:
+            return
+        if start == 0:
+            actions.insert(0, _OlderSteps(None, array.array('l')))
+            start = 1
+        # the steps still in the writer queue are kept until they are written
+        for i in range(start, start + excess):
+            if actions[i].file_position is None:
+                excess = i - start
+                break
+        if excess <= 0:
+            return
+        older = actions[0]
+        forgotten = actions[start:start + excess]
+        older.positions.extend([model_step.file_position for model_step in forgotten])
+        older.name = forgotten[-1].name
+        del actions[start:start + excess]
 
 
+    def _get_writer(self):
+        # the file stays open for writing from the first change
+        if self._writer is None:
+            self._writer = _Writer(self.openfile('rb+'), self.binary, self.snapshots)
+        return self._writer
+
+    def wait_for_writes(self):
+        """Waits until all the steps recorded so far are written and flushed."""
+        if self._writer is not None:
+            with perf.timed("write_wait"):
+                self._writer.wait()
+
+    def writes_queued(self):
+        # the number of records that the writer thread has not written yet
+        if self._writer is None:
+            return 0
+        return self._writer.unwritten
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.wait()
+            self._writer.f.close()
+            self._writer = None
+
     def _record_undoable_action(self, model_step):
-        with self.openfile('rb+') as f:
-            f.seek(0, 2)
-            model_step.file_position = f.tell()
-            write_model_step(f, model_step)
+        # only captures the step; the writer thread encodes and writes it,
+        # and then sets its 'file_position'
+        writer = self._get_writer()
+        model_step.file_position = None
+        with perf.timed("capture_step"):
+            writer.put((model_step, _capture_step(model_step)))
         self.undoable_actions.append(model_step)
+        if self._snapshot_due(writer.end):
+            with perf.timed("capture_snapshot"):
+                writer.put((None, _capture_snapshot(self.model, model_step.name)))
+            self._snapshot_after = model_step
+        self._forget_older_steps()
+
+    def _snapshot_due(self, end):
+        # counts the steps recorded after the latest snapshot, and the size
+        # of those already written
+        last = self.snapshots[-1] if self.snapshots else -1
+        steps = 0
+        start = end
+        for model_step in reversed(self.undoable_actions):
+            if isinstance(model_step, _OlderSteps):
+                positions = model_step.positions
+                k = bisect.bisect(positions, last)
+                if k < len(positions):
+                    steps += len(positions) - k
+                    start = positions[k]
+                break
+            if model_step is self._snapshot_after:
+                break
+            if model_step.file_position is not None:
+                if model_step.file_position < last:
+                    break
+                start = model_step.file_position
+            steps += 1
+        return ((SNAPSHOT_EVERY_STEPS is not None and steps >= SNAPSHOT_EVERY_STEPS) or
+                (SNAPSHOT_EVERY_BYTES is not None and end - start >= SNAPSHOT_EVERY_BYTES))
 
 
     def record_undoable_action(self, model_step):
@@ -123,15 +264,20 @@ class VRSketchFile(object):
         self._record_undoable_action(model_step)
 
     def undo_once(self, app):
+        # waits for the writer thread: the step must be written before the
+        # file can be truncated at its position
+        self.wait_for_writes()
+        if self.undoable_actions and isinstance(self.undoable_actions[-1], _OlderSteps):
+            self._reconstruct_older_steps()
         if self.undoable_actions:
             model_step = self.undoable_actions[-1]
-            with self.openfile('rb+') as f:
-                f.seek(model_step.file_position)
-                model_step_rev = model_step.reversed()
-                model_step_rev.apply(app)
-                f.truncate()
+            model_step_rev = model_step.reversed()
+            model_step_rev.apply(app)
+            self._get_writer().truncate(model_step.file_position)
             self.undoable_actions.pop()
             self.redoable_actions.append(model_step)
+            while self.snapshots and self.snapshots[-1] > model_step.file_position:
+                self.snapshots.pop()
 
     def redo_once(self, app):
         if self.redoable_actions:
@@ -156,58 +302,814 @@ class VRSketchFile(object):
         self.record_undoable_action(step)
 
 
+class _Writer(object):
+    # Encodes and writes the records of a VRSketchFile in a thread.  The
+    # items of the queue are (model_step, result of _capture_step()), or
+    # (None, result of _capture_snapshot()).  The thread stops when the
+    # queue is empty and put() starts a new one, so that no thread is left
+    # waiting when the process exits.
+
+    def __init__(self, f, binary, snapshots):
+        self.f = f
+        self.binary = binary
+        self.snapshots = snapshots      # the list of VRSketchFile
+        f.seek(0, 2)
+        self.end = f.tell()             # where the next record goes
+        self.queue = Queue.Queue(WRITER_QUEUE_SIZE)
+        self.lock = threading.Lock()
+        self.running = False
+        self.error = None
+        self.unwritten = 0              # items put but not done yet
+
+    def put(self, item):
+        self._check_error()
+        with self.lock:
+            self.unwritten += 1
+        try:
+            self.queue.put_nowait(item)
+        except Queue.Full:
+            with perf.timed("write_queue_full"):
+                self.queue.put(item)
+        with self.lock:
+            if not self.running:
+                self.running = True
+                thread = threading.Thread(target=self._run, name="vrsketch writer")
+                thread.start()
+
+    def _run(self):
+        while True:
+            with self.lock:
+                if self.queue.empty():
+                    self.running = False
+                    return
+            model_step, captured = self.queue.get()
+            try:
+                if self.error is None:
+                    self._write(model_step, captured)
+            except Exception:
+                self.error = sys.exc_info()
+            finally:
+                with self.lock:
+                    self.unwritten -= 1
+                self.queue.task_done()
+
+    def _write(self, model_step, captured):
+        pos = self.end
+        self.f.seek(pos)
+        _write_captured(self.f, captured, model_step is None, self.binary)
+        self.end = self.f.tell()
+        if model_step is not None:
+            model_step.file_position = pos
+        else:
+            self.snapshots.append(pos)
+        if WRITER_FLUSH == 'always' or self.queue.empty():
+            self._flush()
+
+    def _flush(self):
+        self.f.flush()
+        if WRITER_FSYNC:
+            os.fsync(self.f.fileno())
+
+    def _check_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error[0], error[1], error[2]
+
+    def wait(self):
+        # waits until the queue is empty; the thread does not touch the
+        # file any more after that
+        self.queue.join()
+        self._check_error()
+        self._flush()
+
+    def truncate(self, pos):
+        self.wait()
+        self.f.seek(pos)
+        self.f.truncate()
+        self.end = pos
+        self._flush()
+
+
+class _OlderSteps(object):
+    # Stands in 'undoable_actions' for the first steps of the file, which
+    # are not loaded or were forgotten.  'positions' is an array with the
+    # position of each of them in the file.  VRSketchFile.undo_once()
+    # reconstructs them when it reaches it.  'name' is the name of the last
+    # of these steps.
+
+    def __init__(self, name, positions):
+        self.name = name
+        self.positions = positions
+
+
+class _ModelBuilder(object):
+    # Builds the ModelSteps of decoded step records, and the Edges, Faces
+    # and Groups that they refer to by id.
+
+    def __init__(self, model):
+        self.model = model
+        self.groups_by_path = {}
+        self.edges_by_eid = {}
+        self.faces_by_fid = {}
+        self.new_faces = []     # their planes are computed in one batch by finish()
+
+    def add_model_objects(self):
+        # makes the groups, edges and faces currently in the model known
+        root_group = self.model.root_group
+        seen = set()
+        for group in list(self.model.group_edges) + list(self.model.group_faces):
+            while group is not root_group and group not in seen:
+                seen.add(group)
+                self.groups_by_path[_group_path(group, root_group)] = group
+                group = group.parent
+        for edge in self.model.all_edges():
+            self.edges_by_eid[edge.eid] = edge
+        for face in self.model.all_faces():
+            self.faces_by_fid[face.fid] = face
+
+    def group(self, path):
+        if path is None:
+            return self.model.root_group
+        try:
+            return self.groups_by_path[path]
+        except KeyError:
+            if "/" in path:
+                parent_path, name = path.rsplit("/", 1)
+                parent_group = self.group(parent_path)
+            else:
+                name = path
+                parent_group = self.model.root_group
+            group = self.groups_by_path[path] = Group(parent_group, gid=int(name))
+            return group
+
+    def build_step(self, pos, name, remove_eids, remove_fids, edges, faces, reuse=False):
+        # if 'reuse', the edges and faces added whose ids are already known
+        # are not built again
+        model_step = ModelStep(self.model, name)
+        model_step.file_position = pos
+
+        for eid in remove_eids:
+            model_step.fe_remove.add(self.edges_by_eid[eid])
+        for fid in remove_fids:
+            model_step.fe_remove.add(self.faces_by_fid[fid])
+
+        for eid, grname, v1, v2 in edges:
+            item = self.edges_by_eid.get(eid) if reuse else None
+            if item is None:
+                item = Edge(self.group(grname), v1, v2, eid=eid)
+                self.edges_by_eid[eid] = item
+            model_step.fe_add.append(item)
+        for fid, eids, color in faces:
+            item = self.faces_by_fid.get(fid) if reuse else None
+            if item is None:
+                physics = Physics(color=color)
+                item = Face([self.edges_by_eid[eid] for eid in eids], fid=fid,
+                            physics=physics, update_plane=False)
+                self.faces_by_fid[fid] = item
+                self.new_faces.append(item)
+            model_step.fe_add.append(item)
+        return model_step
+
+    def load_snapshot(self, snapshot):
+        name, counters, group_paths, edges, faces = snapshot
+        for path in group_paths:
+            self.group(path)
+        self.build_step(None, name, [], [], edges, faces)._apply_to_model()
+        # the ids of the edges, faces and groups removed before the snapshot
+        # must not be given again
+        edge_number, face_number, group_number = counters
+        Edge._NUMBER = max(Edge._NUMBER, edge_number)
+        Face._NUMBER = max(Face._NUMBER, face_number)
+        Group._NUMBER = max(Group._NUMBER, group_number)
+
+    def finish(self):
+        update_planes(self.new_faces)
+        del self.new_faces[:]
+
+
 def _emit_json(f, entry):
     line = json.dumps(entry, sort_keys=True)
     assert '\n' not in line
     line += '\n'
     f.write(line)
 
-def write_header(f):
-    _emit_json(f, {"a": HEADER, "version": VERSION})
-    f.write('\n')
+def write_header(f, binary=False):
+    if binary:
+        f.write(BINARY_MAGIC + chr(BINARY_VERSION))
+    else:
+        _emit_json(f, {"a": HEADER, "version": VERSION})
+        f.write('\n')
 
-def write_model_step(f, model_step):
-    entry = {"a": model_step.name}
+def _group_path(group, root_group):
+    # "3/7" for the group 7 inside the group 3 inside the root group
+    items = []
+    while group is not root_group:
+        items.append(str(group.gid))
+        group = group.parent
+    return '/'.join(reversed(items))
 
-    if model_step.fe_remove:
-        remove_ids = []
-        for fe in model_step.fe_remove:
-            if isinstance(fe, Edge):
-                remove_ids.append("e%d" % fe.eid)
-            elif isinstance(fe, Face):
-                remove_ids.append("f%d" % fe.fid)
+def _capture_step(model_step):
+    # Returns the data of 'model_step' in the same form as
+    # decode_binary_step(): (name, remove_eids, remove_fids, edges, faces).
+    # It no longer refers to the model, so it can be encoded in the writer
+    # thread while the model changes.
+    root_group = model_step.model.root_group
+    remove_eids = []
+    remove_fids = []
+    for fe in model_step.fe_remove:
+        if isinstance(fe, Edge):
+            remove_eids.append(fe.eid)
+        elif isinstance(fe, Face):
+            remove_fids.append(fe.fid)
+        else:
+            raise TypeError(type(fe))
+    remove_eids.sort()
+    remove_fids.sort()
+    paths = {root_group: None}
+    edges = []
+    faces = []
+    for fe in model_step.fe_add:
+        if isinstance(fe, Edge):
+            if fe.group not in paths:
+                paths[fe.group] = _group_path(fe.group, root_group)
+            edges.append((fe.eid, paths[fe.group], fe.v1, fe.v2))
+        elif isinstance(fe, Face):
+            color = fe.physics.color
+            faces.append((fe.fid, [edge.eid for edge in fe.edges],
+                          color if color != 0xffffff else None))
+        else:
+            raise TypeError(type(fe))
+    return model_step.name, remove_eids, remove_fids, edges, faces
+
+def _all_group_paths(model):
+    root_group = model.root_group
+    groups = set()
+    for group in list(model.group_edges) + list(model.group_faces):
+        while group is not root_group and group not in groups:
+            groups.add(group)
+            group = group.parent
+    return sorted(_group_path(group, root_group) for group in groups)
+
+def _capture_snapshot(model, name):
+    # Returns the data of a snapshot of 'model' in the same form as
+    # decode_binary_snapshot(): (name, counters, group paths, edges, faces).
+    # 'name' is the name of the last step before the snapshot.
+    model_step = ModelStep(model, name)
+    model_step.fe_add += model.all_edges()
+    model_step.fe_add += model.all_faces()
+    name, remove_eids, remove_fids, edges, faces = _capture_step(model_step)
+    return (name, [Edge._NUMBER, Face._NUMBER, Group._NUMBER],
+            _all_group_paths(model), edges, faces)
+
+def _write_captured(f, captured, snapshot, binary, compress=True):
+    if binary:
+        if snapshot:
+            _write_binary_record(f, _encode_snapshot_data(captured), _FLAG_SNAPSHOT, compress)
+        else:
+            _write_binary_record(f, _encode_step_data(captured), 0, compress)
+    elif snapshot:
+        _emit_json(f, _json_snapshot_entry(captured))
+    else:
+        _emit_json(f, _json_step_entry(captured))
+
+def write_model_step(f, model_step, binary=False):
+    _write_captured(f, _capture_step(model_step), False, binary)
+
+def write_snapshot(f, model, name, binary=False):
+    """Writes a snapshot record of the whole 'model'.  'name' is the name of
+    the last step."""
+    _write_captured(f, _capture_snapshot(model, name), True, binary)
+
+def _json_step_entry(captured):
+    name, remove_eids, remove_fids, edges, faces = captured
+    entry = {"a": name}
+
+    if remove_eids or remove_fids:
+        entry["remove"] = (["e%d" % eid for eid in remove_eids] +
+                           ["f%d" % fid for fid in remove_fids])
+
+    if edges or faces:
+        adds = []
+        for eid, path, v1, v2 in edges:
+            d = {"id": "e%d" % eid,
+                 "v1": v1.tolist(),
+                 "v2": v2.tolist()}
+            if path is not None:
+                d["group"] = path
+            adds.append(d)
+        for fid, eids, color in faces:
+            d = {"id": "f%d" % fid,
+                 "edges": ["e%d" % eid for eid in eids]}
+            if color is not None:
+                d["color"] = color
+            adds.append(d)
+        entry["add"] = adds
+    return entry
+
+def _json_snapshot_entry(captured):
+    name, counters, group_paths, edges, faces = captured
+    entry = _json_step_entry((name, [], [], edges, faces))
+    entry["counters"] = list(counters)
+    entry["groups"] = group_paths
+    return {"snapshot": entry}
+
+# A snapshot is a JSON line {"snapshot": {...}}, where the dict has the same
+# "a" and "add" as a step, plus "counters", the next Edge, Face and Group
+# ids, and "groups", the paths of all the groups.  Unlike the step entries,
+# the line starts with '{"snapshot"', which is checked without parsing it.
+
+def _enum_json_records(data):
+    # yields (position, is_snapshot, line) for the lines after the header
+    pos = 0
+    header = None
+    while pos < len(data):
+        end = data.find('\n', pos)
+        if end < 0:
+            raise ValueError("file contains a non-terminated line")
+        line = data[pos:end].strip()
+        if line:
+            if header is None:
+                header = json.loads(line)
+                if header.get("a") != HEADER:
+                    raise ValueError(header.get("a"))
             else:
-                raise TypeError(type(fe))
-        entry["remove"] = remove_ids
-
-    if model_step.fe_add:
-        adds1 = []
-        adds2 = []
-        root_group = model_step.model.root_group
-        repr_group = {}
+                yield pos, line.startswith('{"snapshot"'), line
+        pos = end + 1
+    if header is None:
+        raise ValueError("empty file")
+
+def _decode_json_entry(entry):
+    # returns the step in the same form as decode_binary_step()
+    remove_eids = []
+    remove_fids = []
+    for remove_id in entry.get("remove", ()):
+        if remove_id.startswith('e'):
+            remove_eids.append(int(remove_id[1:]))
+        elif remove_id.startswith('f'):
+            remove_fids.append(int(remove_id[1:]))
+        else:
+            raise ValueError(remove_id)
+    edges = []
+    faces = []
+    for add1 in entry.get("add", ()):
+        add_id = add1["id"]
+        if add_id.startswith('e'):
+            edges.append((int(add_id[1:]), add1.get("group"),
+                          Vector3(*add1["v1"]), Vector3(*add1["v2"])))
+        elif add_id.startswith('f'):
+            eids = []
+            for edge_id in add1["edges"]:
+                assert edge_id.startswith('e')
+                eids.append(int(edge_id[1:]))
+            faces.append((int(add_id[1:]), eids, add1.get("color")))
+        else:
+            raise ValueError(add_id)
+    return entry["a"], remove_eids, remove_fids, edges, faces
+
+def _decode_json_step(line):
+    return _decode_json_entry(json.loads(line))
+
+def _decode_json_snapshot(line):
+    # returns (name, counters, group paths, edges, faces)
+    entry = json.loads(line)["snapshot"]
+    name, remove_eids, remove_fids, edges, faces = _decode_json_entry(entry)
+    edge_number, face_number, group_number = entry["counters"]
+    return (name, [int(edge_number), int(face_number), int(group_number)],
+            list(entry["groups"]), edges, faces)
+
+
+
+# ---------- binary format ----------
+#
+# After the header, every step is a record:
+#
+#     varint      length of the payload
+#     byte        flags: _FLAG_ZLIB if the payload is compressed,
+#                 _FLAG_SNAPSHOT for a snapshot record (see below)
+#     payload
+#
+# The payload contains, in order:
+#
+#     string      the name of the step
+#     varint      number of group paths, followed by the paths as strings;
+#                 the edges refer to them as 1, 2, ..., and to the root
+#                 group as 0
+#     ids         the edges removed
+#     ids         the faces removed
+#     ids         the edges added
+#     varints     the group of every edge added
+#     float64s    the coordinates of the edges added, 6 per edge
+#     ids         the faces added
+#     varints     the number of edges of every face added
+#     ids         the edges of all the faces added, one after the other
+#     varints     the color of every face added, plus 1; 0 is the default
+#
+# A string is a varint length followed by UTF-8.  'varints' is a block: the
+# number of values, the number of bytes, and the values as unsigned LEB128
+# varints.  'ids' is a varints block of the differences between each id and
+# the previous one, zigzag-encoded.  The float64s are little-endian.  A
+# record does not depend on the previous ones, so they can be decoded
+# independently.
+#
+# The payload of a snapshot record contains:
+#
+#     varints     the next Edge, Face and Group ids
+#     varint      number of groups, followed by all their paths as strings
+#     step        a step payload as above, adding all the edges and faces
+#     uint32      the CRC-32 of all the above, little-endian
+
+def _encode_uvarint(n, out):
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+def _decode_uvarint(data, pos):
+    result = 0
+    shift = 0
+    try:
+        while True:
+            b = data[pos]
+            pos += 1
+            result |= (b & 0x7f) << shift
+            if b < 0x80:
+                return result, pos
+            shift += 7
+    except IndexError:
+        raise ValueError("truncated varint")
+
+def _encode_varints(values, out):
+    block = bytearray()
+    for n in values:
+        _encode_uvarint(n, block)
+    _encode_uvarint(len(values), out)
+    _encode_uvarint(len(block), out)
+    out += block
+
+def _decode_varints(data, pos):
+    count, pos = _decode_uvarint(data, pos)
+    size, pos = _decode_uvarint(data, pos)
+    end = pos + size
+    if end > len(data):
+        raise ValueError("truncated varints block")
+    if size == count:
+        # all the values are below 0x80
+        return list(data[pos:end]), end
+    values = []
+    while pos < end:
+        n, pos = _decode_uvarint(data, pos)
+        values.append(n)
+    if len(values) != count:
+        raise ValueError("corrupted varints block")
+    return values, end
+
+def _encode_ids(ids, out):
+    deltas = []
+    prev = 0
+    for n in ids:
+        d = n - prev
+        deltas.append((d << 1) if d >= 0 else ((-d << 1) - 1))
+        prev = n
+    _encode_varints(deltas, out)
+
+def _decode_ids(data, pos):
+    deltas, pos = _decode_varints(data, pos)
+    ids = []
+    prev = 0
+    for z in deltas:
+        prev += (z >> 1) if not (z & 1) else -((z + 1) >> 1)
+        ids.append(prev)
+    return ids, pos
+
+def _encode_string(s, out):
+    b = s.encode('utf-8')
+    _encode_uvarint(len(b), out)
+    out += b
+
+def _decode_string(data, pos):
+    size, pos = _decode_uvarint(data, pos)
+    end = pos + size
+    if end > len(data):
+        raise ValueError("truncated string")
+    return str(data[pos:end]).decode('utf-8'), end
+
+def encode_binary_step(model_step):
+    """Returns the payload of the record for 'model_step', uncompressed."""
+    return _encode_step_data(_capture_step(model_step))
+
+def _encode_step_data(captured):
+    # the payload for the result of _capture_step()
+    name, remove_eids, remove_fids, edges, faces = captured
+    out = bytearray()
+    _encode_string(name, out)
+    #
+    group_numbers = {None: 0}
+    group_paths = []
+    for eid, path, v1, v2 in edges:
+        if path not in group_numbers:
+            group_paths.append(path)
+            group_numbers[path] = len(group_paths)
+    _encode_uvarint(len(group_paths), out)
+    for path in group_paths:
+        _encode_string(path, out)
+    #
+    _encode_ids(remove_eids, out)
+    _encode_ids(remove_fids, out)
+    #
+    _encode_ids([edge[0] for edge in edges], out)
+    _encode_varints([group_numbers[edge[1]] for edge in edges], out)
+    coords = array.array('d')
+    for eid, path, v1, v2 in edges:
+        coords.extend((v1.x, v1.y, v1.z, v2.x, v2.y, v2.z))
+    if sys.byteorder != 'little':
+        coords.byteswap()
+    out += coords.tostring()
+    #
+    _encode_ids([face[0] for face in faces], out)
+    _encode_varints([len(face[1]) for face in faces], out)
+    _encode_ids([eid for face in faces for eid in face[1]], out)
+    _encode_varints([0 if face[2] is None else face[2] + 1 for face in faces], out)
+    return out
+
+def decode_binary_step(payload):
+    """Returns (name, remove_eids, remove_fids, edges, faces) from the payload
+    of a record, uncompressed.  'edges' is a list of (eid, group path or
+    None, v1, v2) and 'faces' a list of (fid, eids, color or None)."""
+    data = bytearray(payload)
+    pos = 0
+    name, pos = _decode_string(data, pos)
+    num_paths, pos = _decode_uvarint(data, pos)
+    group_paths = [None]
+    for i in range(num_paths):
+        path, pos = _decode_string(data, pos)
+        group_paths.append(path)
+    remove_eids, pos = _decode_ids(data, pos)
+    remove_fids, pos = _decode_ids(data, pos)
+    #
+    eids, pos = _decode_ids(data, pos)
+    groups, pos = _decode_varints(data, pos)
+    end = pos + 48 * len(eids)
+    if end > len(data):
+        raise ValueError("truncated step record")
+    coords = array.array('d')
+    coords.fromstring(str(data[pos:end]))
+    if sys.byteorder != 'little':
+        coords.byteswap()
+    pos = end
+    edges = []
+    for i, eid in enumerate(eids):
+        k = 6 * i
+        edges.append((eid, group_paths[groups[i]],
+                      Vector3(coords[k], coords[k + 1], coords[k + 2]),
+                      Vector3(coords[k + 3], coords[k + 4], coords[k + 5])))
+    #
+    fids, pos = _decode_ids(data, pos)
+    counts, pos = _decode_varints(data, pos)
+    face_eids, pos = _decode_ids(data, pos)
+    colors, pos = _decode_varints(data, pos)
+    if pos != len(data):
+        raise ValueError("corrupted step record")
+    faces = []
+    start = 0
+    for fid, count, color in zip(fids, counts, colors):
+        faces.append((fid, face_eids[start:start + count], color - 1 if color else None))
+        start += count
+    return name, remove_eids, remove_fids, edges, faces
+
+def write_binary_model_step(f, model_step, compress=True):
+    _write_captured(f, _capture_step(model_step), False, True, compress)
+
+def encode_binary_snapshot(model, name):
+    """Returns the payload of a snapshot record, uncompressed."""
+    return _encode_snapshot_data(_capture_snapshot(model, name))
+
+def _encode_snapshot_data(captured):
+    # the payload for the result of _capture_snapshot()
+    name, counters, group_paths, edges, faces = captured
+    out = bytearray()
+    _encode_varints(counters, out)
+    _encode_uvarint(len(group_paths), out)
+    for path in group_paths:
+        _encode_string(path, out)
+    out += _encode_step_data((name, [], [], edges, faces))
+    out += struct.pack('<I', zlib.crc32(str(out)) & 0xffffffff)
+    return out
+
+def decode_binary_snapshot(payload):
+    """Returns (name, counters, group paths, edges, faces) from the payload
+    of a snapshot record, uncompressed.  Raises ValueError if the record is
+    corrupted."""
+    data = bytearray(payload)
+    if len(data) < 4:
+        raise ValueError("truncated snapshot record")
+    crc, = struct.unpack('<I', str(data[-4:]))
+    if crc != zlib.crc32(str(data[:-4])) & 0xffffffff:
+        raise ValueError("bad checksum in snapshot record")
+    counters, pos = _decode_varints(data, 0)
+    if len(counters) != 3:
+        raise ValueError("corrupted snapshot record")
+    num_paths, pos = _decode_uvarint(data, pos)
+    group_paths = []
+    for i in range(num_paths):
+        path, pos = _decode_string(data, pos)
+        group_paths.append(path)
+    name, remove_eids, remove_fids, edges, faces = decode_binary_step(data[pos:-4])
+    return name, counters, group_paths, edges, faces
+
+def write_binary_snapshot(f, model, name, compress=True):
+    _write_captured(f, _capture_snapshot(model, name), True, True, compress)
+
+def _write_binary_record(f, payload, flags, compress):
+    if compress and len(payload) >= COMPRESS_MIN_SIZE:
+        packed = zlib.compress(str(payload))
+        if len(packed) < len(payload):
+            payload = packed
+            flags |= _FLAG_ZLIB
+    header = bytearray()
+    _encode_uvarint(len(payload), header)
+    header.append(flags)
+    f.write(str(header))
+    f.write(str(payload))
+
+def _enum_binary_records(data, pos):
+    # yields (position, flags, payload) for the records in 'data', without
+    # decompressing the payloads
+    while pos < len(data):
+        header = bytearray(data[pos:pos + 11])
+        size, hlen = _decode_uvarint(header, 0)
+        if hlen >= len(header):
+            raise ValueError("truncated record header")
+        flags = header[hlen]
+        start = pos + hlen + 1
+        end = start + size
+        if end > len(data):
+            raise ValueError("truncated step record")
+        yield pos, flags, data[start:end]
+        pos = end
+
+def _enum_binary_file_records(data):
+    # yields (position, is_snapshot, (flags, payload)) for the records
+    # after the header
+    version = data[len(BINARY_MAGIC):len(BINARY_MAGIC) + 1]
+    if not version:
+        raise ValueError("truncated file header")
+    if version != chr(BINARY_VERSION):
+        raise ValueError("unsupported binary version %r" % (version,))
+    for pos, flags, payload in _enum_binary_records(data, len(BINARY_MAGIC) + 1):
+        yield pos, bool(flags & _FLAG_SNAPSHOT), (flags, payload)
+
+def _decode_binary_record(raw):
+    # 'raw' is (flags, payload) from _enum_binary_file_records()
+    flags, payload = raw
+    if flags & _FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+    if flags & _FLAG_SNAPSHOT:
+        return decode_binary_snapshot(payload)
+    return decode_binary_step(payload)
+
+
+# ---------- reading either format ----------
+#
+# 'data' is the content of a file, as a string or an mmap.  The records are
+# found without being decoded; a raw record is a line for JSON and a tuple
+# (flags, payload) for the binary format.
+
+def _is_binary(data):
+    return data[:len(BINARY_MAGIC)] == BINARY_MAGIC
+
+def _enum_records(data, binary):
+    # yields (position, is_snapshot, raw record)
+    if binary:
+        return _enum_binary_file_records(data)
+    return _enum_json_records(data)
+
+def _read_record(data, pos, binary):
+    # the raw record at 'pos'
+    if binary:
+        pos, flags, payload = next(_enum_binary_records(data, pos))
+        return flags, payload
+    return data[pos:data.find('\n', pos)].strip()
+
+def _decode_step(raw, binary):
+    # returns (name, remove_eids, remove_fids, edges, faces)
+    if binary:
+        return _decode_binary_record(raw)
+    return _decode_json_step(raw)
+
+def _decode_snapshot(raw, binary):
+    # returns (name, counters, group paths, edges, faces)
+    if binary:
+        return _decode_binary_record(raw)
+    return _decode_json_snapshot(raw)
+
+def enum_steps(data):
+    """Yields (position, name, remove_eids, remove_fids, edges, faces) for
+    all the steps in 'data', the content of a file in either format,
+    skipping the snapshots."""
+    binary = _is_binary(data)
+    for pos, is_snapshot, raw in _enum_records(data, binary):
+        if not is_snapshot:
+            yield (pos,) + _decode_step(raw, binary)
+
+
+# ---------- compaction ----------
+
+def _model_key(model, eid_map=None, fid_map=None, path_map=None):
+    # a comparable summary of the model, with the ids translated by the
+    # maps {old eid: new eid}, {old fid: new fid} and {old group path: new
+    # group path} if they are given
+    root_group = model.root_group
+    def translate(mapping, key):
+        return mapping[key] if mapping is not None else key
+    edges = sorted((translate(eid_map, edge.eid),
+                    translate(path_map, _group_path(edge.group, root_group)),
+                    tuple(edge.v1.tolist() + edge.v2.tolist()))
+                   for edge in model.all_edges())
+    faces = sorted((translate(fid_map, face.fid),
+                    tuple(translate(eid_map, edge.eid) for edge in face.edges),
+                    face.physics.color)
+                   for face in model.all_faces())
+    return edges, faces
+
+def compact_history(source, target, keep_steps=0, binary=None):
+    """Writes to 'target' a minimal history for the document 'source': one
+    "Compacted" step that builds the model as it was before the last
+    'keep_steps' steps, followed by these steps.  The ids of the edges, faces
+    and groups are renumbered from 1.  'binary' is the format of 'target',
+    by default the same as 'source'.  Loading 'target' is checked to give
+    the same model as 'source'.  Returns the number of steps written."""
+    with open(source, 'rb') as f:
+        data = f.read()
+    if binary is None:
+        binary = _is_binary(data)
+    steps = list(enum_steps(data))
+    del data
+    split = max(len(steps) - keep_steps, 0)
+
+    model = Model()
+    builder = _ModelBuilder(model)
+    for step in steps[:split]:
+        builder.build_step(*step)._apply_to_model()
+    base = ModelStep(model, "Compacted")
+    edges = sorted(model.all_edges(), key=lambda edge: edge.eid)
+    faces = sorted(model.all_faces(), key=lambda face: face.fid)
+    base.fe_add = edges + faces
+    tail = []
+    for step in steps[split:]:
+        model_step = builder.build_step(*step)
+        model_step._apply_to_model()
+        tail.append(model_step)
         for fe in model_step.fe_add:
             if isinstance(fe, Edge):
-                d = {"id": "e%d" % fe.eid,
-                     "v1": fe.v1.tolist(),
-                     "v2": fe.v2.tolist()}
-                if fe.group is not root_group:
-                    if fe.group not in repr_group:
-                        gr = fe.group
-                        items = []
-                        while gr is not root_group:
-                            items.append(str(gr.gid))
-                            gr = gr.parent
-                        repr_group[fe.group] = '/'.join(reversed(items))
-                    d["group"] = repr_group[fe.group]
-                adds1.append(d)
-        for fe in model_step.fe_add:
-            if isinstance(fe, Face):
-                edges = ["e%d" % e.eid for e in fe.edges]
-                d = {"id": "f%d" % fe.fid,
-                     "edges": edges}
-                if fe.physics.color != 0xffffff:
-                    d["color"] = fe.physics.color
-                adds1.append(d)
-        entry["add"] = adds1 + adds2
-
-    _emit_json(f, entry)
+                edges.append(fe)
+            else:
+                faces.append(fe)
+
+    # renumber, in the order in which the edges, faces and groups appear
+    eid_map = {}
+    for edge in edges:
+        if edge.eid not in eid_map:
+            eid_map[edge.eid] = len(eid_map) + 1
+    fid_map = {}
+    for face in faces:
+        if face.fid not in fid_map:
+            fid_map[face.fid] = len(fid_map) + 1
+    root_group = model.root_group
+    groups = []
+    seen = set([root_group])
+    for edge in edges:
+        group = edge.group
+        ancestors = []
+        while group not in seen:
+            seen.add(group)
+            ancestors.append(group)
+            group = group.parent
+        groups += reversed(ancestors)
+    old_paths = [_group_path(group, root_group) for group in groups]
+    for edge in edges:
+        edge.eid = eid_map[edge.eid]
+    for face in faces:
+        face.fid = fid_map[face.fid]
+    for i, group in enumerate(groups):
+        group.gid = i + 1
+    path_map = {'': ''}
+    for group, old_path in zip(groups, old_paths):
+        path_map[old_path] = _group_path(group, root_group)
+
+    with open(target, 'wb') as f:
+        write_header(f, binary=binary)
+        if base.fe_add:
+            write_model_step(f, base, binary=binary)
+        for model_step in tail:
+            write_model_step(f, model_step, binary=binary)
+
+    expected = _model_key(VRSketchFile(source).model, eid_map, fid_map, path_map)
+    try:
+        same = _model_key(VRSketchFile(target).model) == expected
+    except _DECODE_ERRORS:
+        same = False
+    if not same:
+        os.unlink(target)
+        raise ValueError("%s: the compacted history does not give the same model"
+                         % (source,))
+    return len(tail) + (1 if base.fe_add else 0)
@@ -1,21 +1,26 @@
-from util import EPSILON, Plane, GeometryDict
+from util import EPSILON, Vector3, Plane, GeometryDict
 import model
+import geom
 
 
+def _compute_potential_planes(model, group):
+    # the coordinates are read once per edge, as tuples, and Vector3s are
+    # only built for the pairs of edges that meet
+    result = GeometryDict()
+    ends = [edge.coords() for edge in model.get_edges(group)]
+    for a1, a2 in ends:
+        for b1, b2 in ends:
+            if geom.equal(a2, b1) or geom.equal(a2, b2):
+                v2 = Vector3(*a2)
+                normal = (v2 - Vector3(*a1)).cross(Vector3(*b2) - Vector3(*b1))
+                normal_length = abs(normal)
+                if normal_length > EPSILON:
+                    normal /= normal_length
+                    result[Plane.from_point_and_normal(v2, normal)] = True
+    return result.keys()
+
 def all_potential_planes(model, group):
-    if "potential_planes" not in group.caches:
-        result = GeometryDict()
-        medges = model.get_edges(group)
-        for edge1 in medges:
-            for edge2 in medges:
-                if edge1.v2 == edge2.v1 or edge1.v2 == edge2.v2:
-                    normal = (edge1.v2 - edge1.v1).cross(edge2.v2 - edge2.v1)
-                    normal_length = abs(normal)
-                    if normal_length > EPSILON:
-                        normal /= normal_length
-                        result[Plane.from_point_and_normal(edge1.v2, normal)] = True
-        group.caches["potential_planes"] = result.keys()
-    return group.caches["potential_planes"]
+    return group.cached("potential_planes", lambda: _compute_potential_planes(model, group))
 
 def potential_new_face(model, group, point, max_distance=EPSILON):
     best_vertices = None
@@ -40,8 +45,7 @@ def can_add_new_face_in_plane(model, group, point, plane):
     # build a list of edges in that plane, and sort it by distance to the point
     planar_edges = []
     for edge in model.get_edges(group):
-        if (plane.distance_to_point(edge.v1) < EPSILON and
-            plane.distance_to_point(edge.v2) < EPSILON):
+        if edge.in_plane(plane):
             planar_edges.append(edge)
     planar_edges.sort(key=lambda edge: edge.distance_to_point(point))
 
@@ -0,0 +1,229 @@
+"""Bounding volume hierarchies over the faces or the edges of a group.
+
+FaceBVH is used by selection.find_closest_face() to find the few faces
+whose bounding box is close enough to a position, instead of calling
+Face.point_is_inside() on every face whose plane is close enough.
+EdgeBVH is used by ModelStep.consolidate_subdivide_edges_group() to find
+the pairs of edges that may intersect.  The trees are dynamic AABB trees:
+ModelStep._apply_to_model() inserts and removes items incrementally,
+refitting only the ancestors of the changed leaves.  The face boxes are
+not expanded in the tree itself; instead, query() takes the margin to
+use, because the selection distance depends on the current model scale.
+"""
+from util import EPSILON
+import geom
+
+ENABLED = True
+
+
+class _Node(object):
+    __slots__ = ['lo', 'hi', 'parent', 'left', 'right', 'item', 'order']
+
+    def __init__(self, lo, hi, item=None, order=0):
+        self.lo = lo
+        self.hi = hi
+        self.parent = None
+        self.left = None
+        self.right = None
+        self.item = item
+        self.order = order
+
+
+def _face_box(face):
+    xs, ys, zs = zip(*[edge.coords()[0] for edge in face.edges])
+    return (min(xs), min(ys), min(zs)), (max(xs), max(ys), max(zs))
+
+def edge_margin(edge):
+    # Edge.intersect_edge() can return a point that is a bit outside the
+    # edges: by EPSILON away from the supporting line, and by up to
+    # EPSILON/length along it, because of the tolerance in Vector3.between()
+    p1, p2 = edge.coords()
+    return _edge_margin(p1, p2)
+
+def _edge_margin(p1, p2):
+    length = geom.distance(p1, p2)
+    return 2 * EPSILON + EPSILON / max(length, EPSILON)
+
+def _edge_box(edge):
+    p1, p2 = edge.coords()
+    x1, y1, z1 = p1
+    x2, y2, z2 = p2
+    m = _edge_margin(p1, p2)
+    return ((min(x1, x2) - m, min(y1, y2) - m, min(z1, z2) - m),
+            (max(x1, x2) + m, max(y1, y2) + m, max(z1, z2) + m))
+
+def _union(lo1, hi1, lo2, hi2):
+    return ((min(lo1[0], lo2[0]), min(lo1[1], lo2[1]), min(lo1[2], lo2[2])),
+            (max(hi1[0], hi2[0]), max(hi1[1], hi2[1]), max(hi1[2], hi2[2])))
+
+def _half_area(lo, hi):
+    dx = hi[0] - lo[0]
+    dy = hi[1] - lo[1]
+    dz = hi[2] - lo[2]
+    return dx * dy + dy * dz + dz * dx
+
+
+class BVH(object):
+    # base class; subclasses define item_box(item), returning (lo, hi)
+
+    def __init__(self, items=()):
+        self.rebuild(items)
+
+    def __len__(self):
+        return len(self._leaves)
+
+    def rebuild(self, items):
+        self._leaves = {}     # {item: leaf node}
+        self._next_order = 0
+        self._inserts_since_rebuild = 0
+        nodes = []
+        for item in items:
+            nodes.append(self._make_leaf(item))
+        self.root = self._build(nodes)
+        if self.root is not None:
+            self.root.parent = None
+
+    def _make_leaf(self, item):
+        lo, hi = self.item_box(item)
+        # 'order' follows the order of the items in the model, which is
+        # the order in which they were added
+        leaf = _Node(lo, hi, item, self._next_order)
+        self._next_order += 1
+        self._leaves[item] = leaf
+        return leaf
+
+    def _build(self, nodes):
+        # top-down construction, splitting at the median of the longest axis
+        if not nodes:
+            return None
+        if len(nodes) == 1:
+            return nodes[0]
+        lo, hi = nodes[0].lo, nodes[0].hi
+        for node in nodes:
+            lo, hi = _union(lo, hi, node.lo, node.hi)
+        extents = [hi[i] - lo[i] for i in range(3)]
+        axis = extents.index(max(extents))
+        nodes.sort(key=lambda node: node.lo[axis] + node.hi[axis])
+        middle = len(nodes) // 2
+        parent = _Node(lo, hi)
+        parent.left = self._build(nodes[:middle])
+        parent.right = self._build(nodes[middle:])
+        parent.left.parent = parent
+        parent.right.parent = parent
+        return parent
+
+    def _refit(self, node):
+        while node is not None:
+            node.lo, node.hi = _union(node.left.lo, node.left.hi,
+                                      node.right.lo, node.right.hi)
+            node = node.parent
+
+    def insert(self, item):
+        if item in self._leaves:
+            return
+        self._inserts_since_rebuild += 1
+        if self._inserts_since_rebuild > max(len(self._leaves), 16):
+            # many incremental inserts degrade the tree: rebuild it from scratch
+            items = sorted(self._leaves, key=lambda i: self._leaves[i].order)
+            items.append(item)
+            self.rebuild(items)
+            return
+        leaf = self._make_leaf(item)
+        if self.root is None:
+            self.root = leaf
+            return
+        # descend, choosing the child whose box grows the least
+        node = self.root
+        while node.item is None:
+            lo1, hi1 = _union(node.left.lo, node.left.hi, leaf.lo, leaf.hi)
+            lo2, hi2 = _union(node.right.lo, node.right.hi, leaf.lo, leaf.hi)
+            cost1 = _half_area(lo1, hi1) - _half_area(node.left.lo, node.left.hi)
+            cost2 = _half_area(lo2, hi2) - _half_area(node.right.lo, node.right.hi)
+            node = node.left if cost1 <= cost2 else node.right
+        # replace 'node' with a new parent of 'node' and 'leaf'
+        old_parent = node.parent
+        lo, hi = _union(node.lo, node.hi, leaf.lo, leaf.hi)
+        parent = _Node(lo, hi)
+        parent.parent = old_parent
+        parent.left = node
+        parent.right = leaf
+        node.parent = parent
+        leaf.parent = parent
+        if old_parent is None:
+            self.root = parent
+        else:
+            if old_parent.left is node:
+                old_parent.left = parent
+            else:
+                old_parent.right = parent
+            self._refit(old_parent)
+
+    def remove(self, item):
+        leaf = self._leaves.pop(item, None)
+        if leaf is None:
+            return
+        parent = leaf.parent
+        if parent is None:
+            self.root = None
+            return
+        sibling = parent.left if parent.right is leaf else parent.right
+        grandparent = parent.parent
+        sibling.parent = grandparent
+        if grandparent is None:
+            self.root = sibling
+        else:
+            if grandparent.left is parent:
+                grandparent.left = sibling
+            else:
+                grandparent.right = sibling
+            self._refit(grandparent)
+
+    def query_box(self, lo, hi, margin=0.0):
+        """Return the items whose bounding box, expanded by 'margin',
+        overlaps the box (lo, hi).  They are returned in the same order as
+        in the model."""
+        if self.root is None:
+            return []
+        x0 = lo[0] - margin
+        y0 = lo[1] - margin
+        z0 = lo[2] - margin
+        x1 = hi[0] + margin
+        y1 = hi[1] + margin
+        z1 = hi[2] + margin
+        result = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            nlo = node.lo
+            nhi = node.hi
+            if (x1 < nlo[0] or x0 > nhi[0] or
+                y1 < nlo[1] or y0 > nhi[1] or
+                z1 < nlo[2] or z0 > nhi[2]):
+                continue
+            if node.item is not None:
+                result.append(node)
+            else:
+                stack.append(node.left)
+                stack.append(node.right)
+        result.sort(key=lambda node: node.order)
+        return [node.item for node in result]
+
+    def query(self, position, margin):
+        """Return the items whose bounding box, expanded by 'margin', contains
+        'position'.  They are returned in the same order as in the model."""
+        p = (position.x, position.y, position.z)
+        return self.query_box(p, p, margin)
+
+
+class FaceBVH(BVH):
+    item_box = staticmethod(_face_box)
+
+
+class EdgeBVH(BVH):
+    # the boxes are expanded by edge_margin(), so that two edges for which
+    # Edge.intersect_edge() may return a point always have overlapping boxes
+    item_box = staticmethod(_edge_box)
+
+    def query_edge(self, edge):
+        lo, hi = _edge_box(edge)
+        return self.query_box(lo, hi)
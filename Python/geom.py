@@ -0,0 +1,165 @@
+"""Geometry kernel for the predicates used in inner loops.
+
+The functions here take raw coordinates, as (x, y, z) tuples (or any
+sequence of three floats), and don't allocate Vector3 or Line objects.
+They compare squared distances against EPSILON2 instead of taking square
+roots.  Each one gives the same answer as the Vector3-based code that
+it replaces, which is mentioned in its comment.
+"""
+import math
+from util import EPSILON
+
+EPSILON2 = EPSILON * EPSILON
+
+
+def distance2(a, b):
+    dx = a[0] - b[0]
+    dy = a[1] - b[1]
+    dz = a[2] - b[2]
+    return dx * dx + dy * dy + dz * dz
+
+def distance(a, b):
+    return math.sqrt(distance2(a, b))
+
+def equal(a, b):
+    # Vector3.__eq__
+    return distance2(a, b) < EPSILON2
+
+def signed_distance(normal, d, p):
+    # Plane.signed_distance_to_point
+    return normal[0] * p[0] + normal[1] * p[1] + normal[2] * p[2] + d
+
+def between(p, p1, p2):
+    # Vector3.between: is 'p' between the planes orthogonal to p1-p2
+    # that go through p1 and p2?
+    x = p2[0] - p1[0]
+    y = p2[1] - p1[1]
+    z = p2[2] - p1[2]
+    f = x * p[0] + y * p[1] + z * p[2]
+    g = x * p1[0] + y * p1[1] + z * p1[2]
+    h = x * p2[0] + y * p2[1] + z * p2[2]
+    if g > h:
+        g, h = h, g
+    return g - EPSILON < f < h + EPSILON
+
+def measure_distance(p1, p2, position):
+    # Edge.measure_distance: returns (fraction along p1-p2, distance from
+    # the line through p1 and p2)
+    ax = p2[0] - p1[0]
+    ay = p2[1] - p1[1]
+    az = p2[2] - p1[2]
+    bx = position[0] - p1[0]
+    by = position[1] - p1[1]
+    bz = position[2] - p1[2]
+    dot = ax * bx + ay * by + az * bz
+    length2 = ax * ax + ay * ay + az * az
+    frac = dot / length2 if length2 else 0.0
+    dx = bx - ax * frac
+    dy = by - ay * frac
+    dz = bz - az * frac
+    return frac, math.sqrt(dx * dx + dy * dy + dz * dz)
+
+def point_on_segment(p1, p2, point):
+    # Edge.point_is_inside
+    ax = p2[0] - p1[0]
+    ay = p2[1] - p1[1]
+    az = p2[2] - p1[2]
+    bx = point[0] - p1[0]
+    by = point[1] - p1[1]
+    bz = point[2] - p1[2]
+    length2 = ax * ax + ay * ay + az * az
+    frac = (ax * bx + ay * by + az * bz) / length2 if length2 else 0.0
+    if not (-EPSILON < frac < 1 + EPSILON):
+        return False
+    dx = bx - ax * frac
+    dy = by - ay * frac
+    dz = bz - az * frac
+    return dx * dx + dy * dy + dz * dz < EPSILON2
+
+
+def _supporting_line(p1, p2):
+    # Edge.supporting_line: returns (middle, axis), where 'axis' is None
+    # for a SinglePoint
+    middle = ((p1[0] + p2[0]) * 0.5, (p1[1] + p2[1]) * 0.5, (p1[2] + p2[2]) * 0.5)
+    vx = p1[0] - p2[0]
+    vy = p1[1] - p2[1]
+    vz = p1[2] - p2[2]
+    length = math.sqrt(vx * vx + vy * vy + vz * vz)
+    if length < EPSILON:
+        return middle, None
+    inv = 1.0 / length
+    return middle, (vx * inv, vy * inv, vz * inv)
+
+def _line_distance2(origin, axis, pt):
+    # squared Line.distance_to_point, or SinglePoint's if 'axis' is None
+    if axis is None:
+        return distance2(pt, origin)
+    wx = pt[0] - origin[0]
+    wy = pt[1] - origin[1]
+    wz = pt[2] - origin[2]
+    fraction = axis[0] * wx + axis[1] * wy + axis[2] * wz
+    dx = pt[0] - (origin[0] + axis[0] * fraction)
+    dy = pt[1] - (origin[1] + axis[1] * fraction)
+    dz = pt[2] - (origin[2] + axis[2] * fraction)
+    return dx * dx + dy * dy + dz * dz
+
+def intersect_segments(a1, a2, b1, b2):
+    # Edge.intersect_edge: returns None if the two segments are not
+    # coplanar, if they miss each other, or if they are colinear.  Returns
+    # the intersection point as a tuple otherwise.
+    from_a, axis_a = _supporting_line(a1, a2)
+    from_b, axis_b = _supporting_line(b1, b2)
+    if axis_a is None:
+        if _line_distance2(from_b, axis_b, from_a) > EPSILON2:
+            return None
+        point = from_a
+    elif axis_b is None:
+        if _line_distance2(from_a, axis_a, from_b) > EPSILON2:
+            return None
+        point = from_b
+    else:
+        other_a = (from_a[0] + axis_a[0], from_a[1] + axis_a[1], from_a[2] + axis_a[2])
+        if (_line_distance2(from_b, axis_b, from_a) < EPSILON2 and
+            _line_distance2(from_b, axis_b, other_a) < EPSILON2):
+            return None     # colinear
+        s = (axis_b[0] * axis_a[0] + axis_b[1] * axis_a[1] + axis_b[2] * axis_a[2])
+        t = 1.0 / float(axis_b[0] * axis_b[0] + axis_b[1] * axis_b[1] + axis_b[2] * axis_b[2])
+        vx = axis_a[0] - axis_b[0] * s * t
+        vy = axis_a[1] - axis_b[1] * s * t
+        vz = axis_a[2] - axis_b[2] * s * t
+        kx = from_a[0] - from_b[0]
+        ky = from_a[1] - from_b[1]
+        kz = from_a[2] - from_b[2]
+        d1 = vx * kx + vy * ky + vz * kz
+        d2 = vx * (kx + axis_a[0]) + vy * (ky + axis_a[1]) + vz * (kz + axis_a[2])
+        if abs(d1 - d2) < EPSILON:
+            return None
+        f = d1 / float(d1 - d2)
+        point = (from_a[0] + axis_a[0] * f, from_a[1] + axis_a[1] * f, from_a[2] + axis_a[2] * f)
+        if _line_distance2(from_b, axis_b, point) > EPSILON2:
+            return None
+    if between(point, a1, a2) and between(point, b1, b2):
+        return point
+    return None
+
+
+def point_in_polygon(u, v, point, vertices):
+    # Face.point_is_inside: 'u' and 'v' are the two axes of the plane of
+    # the polygon, and 'vertices' its list of vertices
+    px = u[0] * point[0] + u[1] * point[1] + u[2] * point[2]
+    py = v[0] * point[0] + v[1] * point[1] + v[2] * point[2]
+    last = vertices[0]
+    x2 = u[0] * last[0] + u[1] * last[1] + u[2] * last[2]
+    y2 = v[0] * last[0] + v[1] * last[1] + v[2] * last[2]
+    side = 0
+    for i in range(len(vertices) - 1, -1, -1):
+        p = vertices[i]
+        x1 = u[0] * p[0] + u[1] * p[1] + u[2] * p[2]
+        y1 = v[0] * p[0] + v[1] * p[1] + v[2] * p[2]
+        if (y1 < py) != (y2 < py):
+            x = x1 + (x2 - x1) * (py - y1) / (y2 - y1)
+            if x < px:
+                side += -1 if y1 < y2 else 1
+        x2 = x1
+        y2 = y1
+    return side != 0
@@ -0,0 +1,137 @@
+"""Allocation of the indexes of the world objects.
+
+The Unity side keeps the world objects in a list, at the index that
+Python gives them (WorldScript.world_objects), so the indexes should
+stay dense.  An index freed during a frame can be given to another world
+object in the same frame, in which case Unity updates or replaces the
+object in place and no removal is sent.  The indexes still free at the
+end of the frame are removed in Unity and go to a free list, where the
+lowest ones are reused first.  When enough of them are free, compact()
+moves the world objects with the highest indexes down, a few per frame.
+"""
+import heapq
+
+
+# If True, an index freed during the current frame can also be reused for
+# a world object of a different kind; Unity then replaces the old object
+# with a new one of the right kind.  If False, only objects of the same
+# kind reuse it.
+CROSS_KIND_REUSE = True
+
+# compact() does nothing unless at least this many indexes below 'top' are
+# free, and it moves at most COMPACT_MAX_MOVES world objects per call
+COMPACT_MIN_FREE = 64
+COMPACT_MAX_MOVES = 64
+
+
+class IndexAllocator(object):
+
+    def __init__(self):
+        self.top = 0                # all the indexes in use are below 'top'
+        self.high_water = 0         # the largest 'top' so far
+        self.owners = {}            # {index: world object}
+        self.pending_removes = {}   # {kind: [indexes freed in this frame]}
+        self.free = set()           # indexes below 'top', removed in Unity
+        self._free_heap = []        # 'free' as a heap, with stale entries
+        self.reused_same_kind = 0
+        self.reused_other_kind = 0
+        self.reused_free = 0
+        self.compacted = 0
+
+    def allocate(self, worldobj):
+        kind = worldobj._kind
+        freelist = self.pending_removes.get(kind)
+        if freelist:
+            index = freelist.pop()
+            self.reused_same_kind += 1
+        else:
+            index = None
+            if CROSS_KIND_REUSE:
+                for freelist in self.pending_removes.values():
+                    if freelist:
+                        index = freelist.pop()
+                        self.reused_other_kind += 1
+                        break
+            if index is None:
+                index = self._pop_lowest_free()
+                if index is not None:
+                    self.reused_free += 1
+                else:
+                    index = self.top
+                    self.top += 1
+                    self.high_water = max(self.high_water, self.top)
+        self.owners[index] = worldobj
+        return index
+
+    def _pop_lowest_free(self):
+        heap = self._free_heap
+        while heap:
+            index = heapq.heappop(heap)
+            if index in self.free:
+                self.free.remove(index)
+                return index
+        return None
+
+    def _lowest_free(self):
+        heap = self._free_heap
+        while heap and heap[0] not in self.free:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def release(self, index, kind):
+        # 'index' was used by a world object of the given kind
+        del self.owners[index]
+        self.pending_removes.setdefault(kind, []).append(index)
+
+    def transfer(self, index, worldobj):
+        # 'index' now belongs to another world object, of the same kind
+        self.owners[index] = worldobj
+
+    def take_removes(self):
+        # returns the indexes freed during this frame and not reused; they
+        # must be removed in Unity, and go to the free list
+        removes = []
+        for freelist in self.pending_removes.values():
+            removes += freelist
+        self.pending_removes.clear()
+        for index in removes:
+            self.free.add(index)
+            heapq.heappush(self._free_heap, index)
+        while self.top > 0 and (self.top - 1) in self.free:
+            self.top -= 1
+            self.free.remove(self.top)
+        return removes
+
+    def compact(self):
+        # Moves the world objects with the highest indexes to the lowest
+        # free indexes.  Returns the list of world objects moved: their
+        # '_index' is changed, and they must be sent again.  Their old
+        # indexes are released like with release().
+        moved = []
+        if len(self.free) < COMPACT_MIN_FREE:
+            return moved
+        index = self.top - 1
+        while len(moved) < COMPACT_MAX_MOVES and index >= 0:
+            worldobj = self.owners.get(index)
+            if worldobj is not None:
+                target = self._lowest_free()
+                if target is None or target > index:
+                    break
+                self._pop_lowest_free()
+                self.release(index, worldobj._kind)
+                self.owners[target] = worldobj
+                worldobj._index = target
+                moved.append(worldobj)
+            index -= 1
+        self.compacted += len(moved)
+        return moved
+
+    def stats(self):
+        return {"index_live": len(self.owners),
+                "index_top": self.top,
+                "index_high_water": self.high_water,
+                "index_free": len(self.free),
+                "index_reused_same_kind": self.reused_same_kind,
+                "index_reused_other_kind": self.reused_other_kind,
+                "index_reused_free": self.reused_free,
+                "index_compacted": self.compacted}
@@ -0,0 +1,126 @@
+"""Level-of-detail representations of the groups.
+
+A group that cannot be edited at the moment is sent as a single
+MergedGroup world object (see App._update_merged_groups()).  When it is
+far from the head, a simplified version is sent instead:
+
+    LOD_BOX     the bounding box of the group
+    LOD_HULL    for each plane, the convex hull of all the faces in that
+                plane, drawn with only its outline; the edges that are not
+                on any face are dropped
+    LOD_FULL    all the faces and edges
+
+The simplified geometry is computed on demand and kept in the group's
+caches, so it is thrown away when the group changes.
+"""
+from util import Vector3
+
+LOD_BOX = 0
+LOD_HULL = 1
+LOD_FULL = 2
+
+# distances from the head to the bounding box of a group, in meters,
+# below which the group is shown at LOD_FULL and at LOD_HULL
+FULL_DISTANCE = 4.0
+HULL_DISTANCE = 15.0
+
+# a group only changes level when it is this fraction past the threshold,
+# so that it doesn't flip at every frame when the head is close to it
+HYSTERESIS = 0.15
+
+# the groups that are not inside the current group are shown with less
+# detail: their distances are multiplied by this
+ELSEWHERE_FACTOR = 2.0
+
+# at most this many groups change level in one frame; the others wait
+MAX_SWAPS_PER_FRAME = 4
+
+
+def box_distance(position, box):
+    # distance from 'position' to the box (vmin, vmax), 0 if inside
+    vmin, vmax = box
+    dx = max(vmin.x - position.x, 0.0, position.x - vmax.x)
+    dy = max(vmin.y - position.y, 0.0, position.y - vmax.y)
+    dz = max(vmin.z - position.z, 0.0, position.z - vmax.z)
+    return (dx * dx + dy * dy + dz * dz) ** 0.5
+
+def _threshold(distance, current, finer_level):
+    # the threshold is moved in favour of the current level
+    if current is None:
+        return distance
+    if current >= finer_level:
+        return distance * (1.0 + HYSTERESIS)
+    return distance * (1.0 - HYSTERESIS)
+
+def choose_level(distance, current=None):
+    """The level for a group at 'distance' that is currently shown at
+    'current' (None if it is not shown yet)."""
+    if distance < _threshold(FULL_DISTANCE, current, LOD_FULL):
+        return LOD_FULL
+    if distance < _threshold(HULL_DISTANCE, current, LOD_HULL):
+        return LOD_HULL
+    return LOD_BOX
+
+
+def box_geometry(box):
+    """Returns (faces, edges) for the box (vmin, vmax): a list of 6 lists
+    of vertices, and a list of 12 pairs of vertices."""
+    vmin, vmax = box
+    p = [Vector3(x, y, z) for z in (vmin.z, vmax.z)
+                          for y in (vmin.y, vmax.y)
+                          for x in (vmin.x, vmax.x)]
+    faces = [[p[i] for i in indices] for indices in [
+        (0, 2, 3, 1), (4, 5, 7, 6), (0, 1, 5, 4),
+        (1, 3, 7, 5), (3, 2, 6, 7), (2, 0, 4, 6)]]
+    edges = [(p[i], p[j]) for i, j in [
+        (0, 1), (2, 3), (4, 5), (6, 7), (0, 2), (1, 3),
+        (4, 6), (5, 7), (0, 4), (1, 5), (2, 6), (3, 7)]]
+    return faces, edges
+
+
+def _convex_hull(points):
+    # Andrew's monotone chain; 'points' is a list of (u, v) tuples.
+    # Returns the hull in counter-clockwise order, without collinear points.
+    points = sorted(set(points))
+    if len(points) < 3:
+        return points
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+    lower = []
+    for pt in points:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], pt) <= 0:
+            lower.pop()
+        lower.append(pt)
+    upper = []
+    for pt in reversed(points):
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], pt) <= 0:
+            upper.pop()
+        upper.append(pt)
+    return lower[:-1] + upper[:-1]
+
+def hull_faces(faces):
+    """Returns a list of lists of vertices: one convex polygon per plane,
+    covering all the 'faces' that are in that plane."""
+    planes = {}
+    for face in faces:
+        normal = face.plane.normal
+        key = (round(normal.x, 3), round(normal.y, 3), round(normal.z, 3),
+               round(face.plane.distance, 3))
+        planes.setdefault(key, []).append(face)
+    result = []
+    for key in sorted(planes):
+        coplanar = planes[key]
+        first = coplanar[0]
+        u = first.planar_v1
+        v = first.planar_v2
+        normal = first.plane.normal
+        d = first.plane.distance
+        points = []
+        for face in coplanar:
+            for edge in face.edges:
+                p = edge.v1
+                points.append((round(u.dot(p), 9), round(v.dot(p), 9)))
+        hull = _convex_hull(points)
+        if len(hull) >= 3:
+            result.append([u * a + v * b - normal * d for a, b in hull])
+    return result
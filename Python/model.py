@@ -1,15 +1,31 @@
 import math
-from util import Vector3, Plane, Line, SinglePoint, EPSILON, EmptyIntersection, GeometryDict
+from util import Vector3, Plane, Line, SinglePoint, EPSILON
+from util import GeometryDict, CellHash
+from vertextable import VertexTable, concat_coords, coords_bounds
+from facebvh import FaceBVH, EdgeBVH
+import geom
+
+
+# {cache name: [hits, misses]}, for all the 'group.caches' lookups done
+# with Group.cached()
+cache_stats = {}
+
+def reset_cache_stats():
+    cache_stats.clear()
+
+# the caches that depend on the subgroups, and not only on the group itself
+HIERARCHICAL_CACHES = ('subgroups',)
 
 
 class Edge(object):
     _NUMBER = 1
+    _i1 = _i2 = None    # indexes in 'group.vertices' while the edge is in the model
 
     def __init__(self, group, v1, v2, eid=None):
         assert isinstance(group, Group)
         self.group = group
-        self.v1 = v1
-        self.v2 = v2
+        self._v1 = v1
+        self._v2 = v2
         if eid is None:
             eid = Edge._NUMBER
         if Edge._NUMBER <= eid:
@@ -19,31 +35,90 @@ class Edge(object):
     def __repr__(self):
         return '<Edge %d: %r - %r>' % (self.eid, self.v1, self.v2)
 
+    # 'v1' and 'v2' are views: if the edge is part of the model, they read the
+    # coordinates from the VertexTable of the group
+
+    def _get_v1(self):
+        if self._i1 is None:
+            return self._v1
+        return self.group.vertices.get(self._i1)
+
+    def _set_v1(self, v):
+        if self._i1 is None:
+            self._v1 = v
+        else:
+            table = self.group.vertices
+            index = table.add(v)
+            table.release(self._i1)
+            self._i1 = index
+
+    def _get_v2(self):
+        if self._i2 is None:
+            return self._v2
+        return self.group.vertices.get(self._i2)
+
+    def _set_v2(self, v):
+        if self._i2 is None:
+            self._v2 = v
+        else:
+            table = self.group.vertices
+            index = table.add(v)
+            table.release(self._i2)
+            self._i2 = index
+
+    v1 = property(_get_v1, _set_v1)
+    v2 = property(_get_v2, _set_v2)
+
+    def _attach(self):
+        # called when the edge is added to the model
+        if self._i1 is None:
+            table = self.group.vertices
+            self._i1 = table.add(self._v1)
+            self._i2 = table.add(self._v2)
+            self._v1 = self._v2 = None
+
+    def _detach(self):
+        # called when the edge is removed from the model
+        if self._i1 is not None:
+            table = self.group.vertices
+            self._v1 = table.get(self._i1)
+            self._v2 = table.get(self._i2)
+            table.release(self._i1)
+            table.release(self._i2)
+            self._i1 = self._i2 = None
+
+    def coords(self):
+        # returns the two ends as (x, y, z) tuples, for the functions of 'geom'
+        if self._i1 is None:
+            v1 = self._v1
+            v2 = self._v2
+            return (v1.x, v1.y, v1.z), (v2.x, v2.y, v2.z)
+        table = self.group.vertices
+        return table.get_tuple(self._i1), table.get_tuple(self._i2)
+
     def measure_distance(self, position):
         # returns (fraction along the edge, distance from the line supporting the edge)
-        v1 = self.v1
-        v2 = self.v2
-        p1 = v2 - v1
-        p2 = position - v1
-        dot = p1.dot(p2)
-        length2 = p1.dot(p1)
-        frac = dot / length2 if length2 else 0.0
-        return frac, abs(p2 - p1 * frac)
+        p1, p2 = self.coords()
+        return geom.measure_distance(p1, p2, (position.x, position.y, position.z))
 
     def distance_to_point(self, point):
         # returns the 3D distance from the point to the edge
-        frac, distance_to_line = self.measure_distance(point)
+        p1, p2 = self.coords()
+        p = (point.x, point.y, point.z)
+        frac, distance_to_line = geom.measure_distance(p1, p2, p)
         if frac <= 0:
-            return abs(self.v1 - point)
+            return geom.distance(p1, p)
         elif frac >= 1:
-            return abs(self.v2 - point)
+            return geom.distance(p2, p)
         else:
             return distance_to_line
 
     def supporting_line(self):
         # Returns the Line containing the edge, or the SinglePoint if the length is ~0
-        middle = (self.v1 + self.v2) * 0.5
-        v = self.v1 - self.v2
+        v1 = self.v1
+        v2 = self.v2
+        middle = (v1 + v2) * 0.5
+        v = v1 - v2
         length = abs(v)
         if length < EPSILON:
             return SinglePoint(middle)
@@ -52,24 +127,31 @@ class Edge(object):
     def intersect_edge(self, other_edge):
         # Return None if the two edges are not coplanar, if they miss each other,
         # or if they are colinear.  Return the intersection point otherwise.
-        line1 = self.supporting_line()
-        line2 = other_edge.supporting_line()
-        try:
-            sp = line1.intersect(line2)
-        except EmptyIntersection:
+        a1, a2 = self.coords()
+        b1, b2 = other_edge.coords()
+        point = geom.intersect_segments(a1, a2, b1, b2)
+        if point is None:
             return None
-        if isinstance(sp, SinglePoint):
-            point = sp.position
-            if point.between(self.v1, self.v2) and point.between(other_edge.v1, other_edge.v2):
-                return point
-        return None
+        return Vector3(*point)
 
     def in_plane(self, plane):
-        return plane.distance_to_point(self.v1) < EPSILON and plane.distance_to_point(self.v2) < EPSILON
+        normal = plane.normal
+        normal = (normal.x, normal.y, normal.z)
+        p1, p2 = self.coords()
+        return (abs(geom.signed_distance(normal, plane.distance, p1)) < EPSILON and
+                abs(geom.signed_distance(normal, plane.distance, p2)) < EPSILON)
 
     def point_is_inside(self, point):
-        frac, distance = self.measure_distance(point)
-        return -EPSILON < frac < 1 + EPSILON and distance < EPSILON
+        p1, p2 = self.coords()
+        return geom.point_on_segment(p1, p2, (point.x, point.y, point.z))
+
+
+def _splits(edge, point):
+    # True if 'point' is further than 2 * EPSILON from both ends of 'edge'
+    p = (point.x, point.y, point.z)
+    p1, p2 = edge.coords()
+    limit = 4 * geom.EPSILON2
+    return geom.distance2(p, p1) > limit and geom.distance2(p, p2) > limit
 
 
 class Physics(object):
@@ -82,7 +164,8 @@ class Face(object):
     _UPDATE_PLANE = True
     group = None
 
-    def __init__(self, edges, fid=None, physics=None):
+    def __init__(self, edges, fid=None, physics=None, update_plane=True):
+        # if 'update_plane' is False, call update_planes() on the new faces
         self.group = edges[0].group
         for edge in edges:
             assert edge.group is self.group
@@ -93,20 +176,24 @@ class Face(object):
             Face._NUMBER = fid + 1
         self.fid = fid
         self.physics = physics or Physics()
-        if Face._UPDATE_PLANE:
+        if update_plane and Face._UPDATE_PLANE:
             self._update_plane()
 
     def __repr__(self):
         return '<Face %d: %r>' % (self.fid, ' - '.join([repr(e.v1) for e in self.edges]))
 
-    def _update_plane(self):
-        # check invariants
+    def _check_edges(self):
         edges = self.edges
         for i in range(len(edges)):
             assert edges[i-1].v2 == edges[i].v1
+
+    def _update_plane(self):
+        self._check_edges()
         # compute the plane that is the best approximation of all vertices
-        self.plane = Plane.from_vertices([edge.v1 for edge in self.edges])
+        self._set_plane(Plane.from_vertices([edge.v1 for edge in self.edges]))
 
+    def _set_plane(self, plane):
+        self.plane = plane
         normal = self.plane.normal
         if abs(normal.y) < max(abs(normal.x), abs(normal.z)):
             plane1 = Vector3(-normal.z, 0., normal.x)
@@ -120,19 +207,55 @@ class Face(object):
 
     def point_is_inside(self, point):
         # NB. the face should be quasi-planar, but not necessarily convex
-        pt = self._project_point_on_plane(point)
-        uvs = [self._project_point_on_plane(edge.v1) for edge in self.edges]
-        uv2 = uvs[0]
-        side = 0
-        for i in range(len(uvs) - 1, -1, -1):
-            uv1 = uvs[i]
-            if (uv1[1] < pt[1]) != (uv2[1] < pt[1]):
-                # (x - uv1[0]) / (uv2[0] - uv1[0]) == (pt[1] - uv1[1]) / (uv2[1] - uv1[1])
-                x = uv1[0] + (uv2[0] - uv1[0]) * (pt[1] - uv1[1]) / (uv2[1] - uv1[1])
-                if x < pt[0]:
-                    side += -1 if uv1[1] < uv2[1] else 1
-            uv2 = uv1
-        return side != 0
+        u = self.planar_v1
+        v = self.planar_v2
+        return geom.point_in_polygon((u.x, u.y, u.z), (v.x, v.y, v.z),
+                                     (point.x, point.y, point.z),
+                                     [edge.coords()[0] for edge in self.edges])
+
+
+def update_planes(faces):
+    # same as calling _update_plane() on each face, but in one batch
+    if not Face._UPDATE_PLANE:
+        return
+    for face in faces:
+        face._check_edges()
+    planes = Plane.from_vertices_list([[edge.v1 for edge in face.edges] for face in faces])
+    for face, plane in zip(faces, planes):
+        face._set_plane(plane)
+
+
+class VertexEdgeIndex(object):
+    # Maps vertices to the edges that start or end there.  Unlike in a
+    # GeometryDict, the vertices are not merged: edges_at(v) returns
+    # exactly the edges 'e' with 'e.v1 == v' or 'e.v2 == v', in the order
+    # in which they were added.  Used during ModelStep.consolidate().
+
+    def __init__(self, edges=()):
+        self._cells = CellHash()     # both ends of every edge
+        self._order = {}             # {edge: insertion number}
+        for edge in edges:
+            self.add_edge(edge)
+
+    def add_edge(self, edge):
+        if edge in self._order:
+            return
+        self._order[edge] = len(self._order)
+        self._cells.add(edge.v1, edge)
+        self._cells.add(edge.v2, edge)
+
+    def remove_edge(self, edge):
+        if self._order.pop(edge, None) is None:
+            return
+        self._cells.remove(edge.v1, edge)
+        self._cells.remove(edge.v2, edge)
+
+    def __len__(self):
+        return len(self._order)
+
+    def edges_at(self, v):
+        found = set(self._cells.find_values(v))
+        return sorted(found, key=self._order.__getitem__)
 
 
 class Model(object):
@@ -171,24 +294,43 @@ class Model(object):
         assert isinstance(group, Group)
         return self.group_faces.setdefault(group, [])
 
+    def iter_groups(self, only_group, group_dict):
+        # the groups visited by all_edges() or all_faces(), in the same order
+        if only_group is None:
+            return list(group_dict)
+        elif isinstance(only_group, set):
+            return only_group
+        return (only_group,)
+
     def get_groups(self):
         result = set(self.group_edges)
         result.update(self.group_faces)
         return result
 
+    def get_vertex_coords(self, group):
+        # returns the flat coordinates array of the group's VertexTable
+        assert isinstance(group, Group)
+        table = group.vertices
+        if table.needs_compact():
+            table.compact(self.get_edges(group))
+        return table.coords()
+
     def all_vertices(self, only_group=None):
-        result = []
-        for edge in self.all_edges(only_group):
-            result.append(edge.v1)
-            result.append(edge.v2)
-        return result
+        # returns a flat array of coordinates (x, y, z) for each distinct
+        # vertex of the edges in 'only_group'
+        if isinstance(only_group, Group):
+            return self.get_vertex_coords(only_group)
+        if only_group is None:
+            only_group = self.group_edges
+        return concat_coords([self.get_vertex_coords(gr1) for gr1 in only_group])
 
     def all_vertices_with_group(self, only_group):
-        result = []
-        for edge, group in self.get_edges_with_group(only_group):
-            result.append((edge.v1, group))
-            result.append((edge.v2, group))
-        return result
+        # returns a list of (flat coordinates array, group)
+        if only_group is None:
+            only_group = set(self.group_edges)
+        elif not isinstance(only_group, set):
+            only_group = (only_group,)
+        return [(self.get_vertex_coords(gr1), gr1) for gr1 in only_group]
 
     def all_edges(self, only_group=None):
         if only_group is not None:
@@ -206,33 +348,42 @@ class Model(object):
             result += value
         return result
 
+    def _compute_bounding_box(self, group):
+        coords = self.all_vertices(group)
+        if not len(coords):
+            return None
+        return coords_bounds(coords)
+
     def get_bounding_box(self, group=None, extra=0.):
-        try:
-            vmin, vmax = group.caches['bounding_box']
-        except KeyError:
-            v_list = self.all_vertices(group)
-            if not v_list:
-                return Vector3(0., 0., 0.), Vector3(0., 0., 0.)
-            vmin = Vector3(min(v.x for v in v_list),
-                           min(v.y for v in v_list),
-                           min(v.z for v in v_list))
-            vmax = Vector3(max(v.x for v in v_list),
-                           max(v.y for v in v_list),
-                           max(v.z for v in v_list))
-            group.caches['bounding_box'] = vmin, vmax
+        box = group.cached('bounding_box', lambda: self._compute_bounding_box(group))
+        if box is None:
+            return Vector3(0., 0., 0.), Vector3(0., 0., 0.)
+        vmin, vmax = box
         return (Vector3(vmin.x - extra, vmin.y - extra, vmin.z - extra),
                 Vector3(vmax.x + extra, vmax.y + extra, vmax.z + extra))
 
+    def get_face_bvh(self, group):
+        # unlike 'group.caches', this is not thrown away when the model
+        # changes, but updated incrementally by ModelStep._apply_to_model()
+        if group.face_bvh is None:
+            group.face_bvh = FaceBVH(self.get_faces(group))
+        return group.face_bvh
+
+    def get_edge_bvh(self, group):
+        # same as get_face_bvh(), for the edges
+        if group.edge_bvh is None:
+            group.edge_bvh = EdgeBVH(self.get_edges(group))
+        return group.edge_bvh
+
+    def _compute_subgroups(self, group):
+        result = set()
+        for gr1 in self.get_groups():
+            if gr1.issubgroup(group):
+                result.add(gr1)
+        return result
+
     def get_subgroups(self, group):
-        try:
-            return group.caches['subgroups']
-        except KeyError:
-            result = set()
-            for gr1 in self.get_groups():
-                if gr1.issubgroup(group):
-                    result.add(gr1)
-            group.caches['subgroups'] = result
-            return result
+        return group.cached('subgroups', lambda: self._compute_subgroups(group))
 
 
 class Group(object):
@@ -241,6 +392,9 @@ class Group(object):
     def __init__(self, parent, gid=None):
         self.parent = parent
         self.caches = {}
+        self.vertices = VertexTable()
+        self.face_bvh = None     # built lazily by Model.get_face_bvh()
+        self.edge_bvh = None     # built lazily by Model.get_edge_bvh()
         if gid is None:
             gid = Group._NUMBER
         if Group._NUMBER <= gid:
@@ -250,6 +404,18 @@ class Group(object):
     def __repr__(self):
         return '<Group %d>' % (self.gid,)
 
+    def cached(self, key, compute):
+        # returns self.caches[key], calling compute() first if it is missing
+        counters = cache_stats.setdefault(key, [0, 0])
+        try:
+            result = self.caches[key]
+        except KeyError:
+            counters[1] += 1
+            result = self.caches[key] = compute()
+        else:
+            counters[0] += 1
+        return result
+
     def issubgroup(self, parentgroup):
         while True:
             if self is parentgroup:
@@ -266,6 +432,7 @@ class ModelStep(object):
         self.name = name
         self.fe_remove = set()
         self.fe_add = []
+        self._edge_indexes = {}    # {group: VertexEdgeIndex}, see _get_edge_index()
 
     def apply(self, app):
         for edge_or_face in self.fe_remove:
@@ -285,25 +452,79 @@ class ModelStep(object):
             app.selection_updated()
 
     def _apply_to_model(self):
-        # - first, remove the caches
-        for group in self.model.get_groups():
-            group.caches.clear()
+        # - first, update or remove the caches of the groups that change
+        self._update_caches()
         #
         fe_remove = self.fe_remove
         for group in self._all_removed_groups():
             edges = self.model.get_edges(group)
-            edges[:] = [edge for edge in edges if edge not in fe_remove]
+            keep = []
+            for edge in edges:
+                if edge in fe_remove:
+                    if group.edge_bvh is not None:
+                        group.edge_bvh.remove(edge)
+                    edge._detach()
+                else:
+                    keep.append(edge)
+            edges[:] = keep
             faces = self.model.get_faces(group)
+            if group.face_bvh is not None:
+                for face in faces:
+                    if face in fe_remove:
+                        group.face_bvh.remove(face)
             faces[:] = [face for face in faces if face not in fe_remove]
         #
         for edge_or_face in self.fe_add:
             if isinstance(edge_or_face, Edge):
+                edge_or_face._attach()
                 self.model.get_edges(edge_or_face.group).append(edge_or_face)
+                if edge_or_face.group.edge_bvh is not None:
+                    edge_or_face.group.edge_bvh.insert(edge_or_face)
             elif isinstance(edge_or_face, Face):
                 self.model.get_faces(edge_or_face.group).append(edge_or_face)
+                if edge_or_face.group.face_bvh is not None:
+                    edge_or_face.group.face_bvh.insert(edge_or_face)
             else:
                 raise AssertionError
 
+    def _update_caches(self):
+        changed = self._all_changed_groups()
+        ancestors = set()
+        for group in changed:
+            group = group.parent
+            while group is not None and group not in ancestors:
+                ancestors.add(group)
+                group = group.parent
+        for group in ancestors - changed:
+            for key in HIERARCHICAL_CACHES:
+                group.caches.pop(key, None)
+        #
+        for group in changed:
+            box = group.caches.get('bounding_box', None)
+            group.caches.clear()
+            if box is not None:
+                box = self._updated_bounding_box(group, box)
+                if box is not None:
+                    group.caches['bounding_box'] = box
+
+    def _updated_bounding_box(self, group, box):
+        # returns the new bounding box of 'group', or None if we can't
+        # tell without recomputing it from all vertices
+        vmin, vmax = box
+        for fe in self.fe_remove:
+            if isinstance(fe, Edge) and fe.group is group:
+                # removing a vertex strictly inside the box cannot shrink it
+                for x, y, z in fe.coords():
+                    if (x <= vmin.x or y <= vmin.y or z <= vmin.z or
+                        x >= vmax.x or y >= vmax.y or z >= vmax.z):
+                        return None
+        for fe in self.fe_add:
+            if isinstance(fe, Edge) and fe.group is group:
+                for x, y, z in fe.coords():
+                    vmin = Vector3(min(vmin.x, x), min(vmin.y, y), min(vmin.z, z))
+                    vmax = Vector3(max(vmax.x, x), max(vmax.y, y), max(vmax.z, z))
+        return vmin, vmax
+
     def reversed(self):
         ms = ModelStep(self.model, self.name)
         ms.fe_remove.update(self.fe_add)
@@ -311,19 +532,54 @@ class ModelStep(object):
         return ms
 
     def add_edge(self, group, v1, v2, paired_with=None):
-        for edge in self.model.get_edges(group):
-            if edge.v1 == v1 and edge.v2 == v2 and edge not in self.fe_remove:
-                return edge
-        for edge in self.fe_add:
-            if isinstance(edge, Edge) and edge.v1 == v1 and edge.v2 == v2 and edge.group is group:
-                return edge
+        index = self._edge_indexes.get(group)
+        if index is not None:
+            for edge in self._active_edges_at(group, v1):
+                if edge.v1 == v1 and edge.v2 == v2:
+                    return edge
+        else:
+            for edge in self.model.get_edges(group):
+                if edge.v1 == v1 and edge.v2 == v2 and edge not in self.fe_remove:
+                    return edge
+            for edge in self.fe_add:
+                if isinstance(edge, Edge) and edge.v1 == v1 and edge.v2 == v2 and edge.group is group:
+                    return edge
         edge = Edge(group, v1, v2, None if paired_with is None else paired_with.eid)
-        self.fe_add.append(edge)
+        self._add_new_edge(edge)
         return edge
 
-    def add_face(self, edges, paired_with=None):
+    def _add_new_edge(self, edge):
+        self.fe_add.append(edge)
+        index = self._edge_indexes.get(edge.group)
+        if index is not None:
+            index.add_edge(edge)
+
+    def _get_edge_index(self, group):
+        # Returns the VertexEdgeIndex of the active edges of 'group'.  It is
+        # kept up to date by the ModelStep methods that add or remove edges
+        # during consolidate(), but not if 'fe_add' or 'fe_remove' are
+        # modified directly: call _reset_edge_indexes() after that.
+        try:
+            return self._edge_indexes[group]
+        except KeyError:
+            edges = [edge for edge in self.model.get_edges(group)
+                          if edge not in self.fe_remove]
+            edges += [fe for fe in self.fe_add
+                         if isinstance(fe, Edge) and fe.group is group]
+            index = self._edge_indexes[group] = VertexEdgeIndex(edges)
+            return index
+
+    def _reset_edge_indexes(self):
+        self._edge_indexes.clear()
+
+    def _active_edges_at(self, group, v):
+        # the active edges of 'group' that start or end at 'v'
+        return [edge for edge in self._get_edge_index(group).edges_at(v)
+                     if edge not in self.fe_remove]
+
+    def add_face(self, edges, paired_with=None, update_plane=True):
         physics = paired_with.physics if paired_with is not None else None
-        face = Face(edges, physics=physics)
+        face = Face(edges, physics=physics, update_plane=update_plane)
         self.fe_add.append(face)
         return face
 
@@ -339,9 +595,11 @@ class ModelStep(object):
         for edge in move_edges:
             edges_old2new[edge] = self.add_edge(change_group(edge.group), map_v(edge.v1), map_v(edge.v2),
                                                 paired_with=edge)
+        new_faces = []
         for face in move_faces:
             edges = [edges_old2new.get(edge, edge) for edge in face.edges]
-            self.add_face(edges, paired_with=face)
+            new_faces.append(self.add_face(edges, paired_with=face, update_plane=False))
+        update_planes(new_faces)
 
     def move_vertices(self, old2new, move_edges, move_faces):
         def map_v(v):
@@ -440,7 +698,7 @@ class ModelStep(object):
         assert edge not in self.fe_remove
         self.fe_remove.add(edge)
         copy = Edge(edge.group, edge.v1, edge.v2)
-        self.fe_add.append(copy)
+        self._add_new_edge(copy)
         #
         for face in self._all_active_faces(edge.group):
             if edge in face.edges:
@@ -454,34 +712,50 @@ class ModelStep(object):
                 self.fe_add.append(Face(edges, physics=face.physics))
         return copy
 
-    def consolidate_subdivide_edges_group(self, group):
+    def _subdivide_edges_group_iter(self, group):
+        # The candidate pairs of edges come from EdgeBVHs: the one of the
+        # model's edges, which is updated incrementally, and a temporary one
+        # for the new edges.  Only the edges with overlapping boxes can
+        # intersect.  This is a generator that yields after every new edge
+        # checked, True if it was subdivided; see consolidate_iter().
+        model_bvh = self.model.get_edge_bvh(group)
+        #
         # find edges in the existing model that need to be split, and remove-readd them
         for fe in self.fe_add:
             if isinstance(fe, Edge) and fe.group is group:
-                for edge in self.model.get_edges(group):
+                for edge in model_bvh.query_edge(fe):
                     if edge in self.fe_remove:
                         continue
                     point = edge.intersect_edge(fe)
                     if point is None:
                         continue
-                    if abs(point - edge.v1) > 2 * EPSILON and abs(point - edge.v2) > 2 * EPSILON:
+                    if _splits(edge, point):
                         self._remove_edge_and_add_copy(edge)
+                yield False
         #
         # find pairs (fe, edge), where the 'edge' cuts 'fe' in two
-        progress = False
-        all_edges = self._all_active_edges(group)
+        new_bvh = EdgeBVH([fe for fe in self.fe_add
+                              if isinstance(fe, Edge) and fe.group is group])
         for i, fe in enumerate(self.fe_add):
             if isinstance(fe, Edge) and fe.group is group:
-                for edge in all_edges:
+                progress = False
+                candidates = [edge for edge in model_bvh.query_edge(fe)
+                                   if edge not in self.fe_remove]
+                seen = set(candidates)
+                candidates += [edge for edge in new_bvh.query_edge(fe)
+                                    if edge not in seen]
+                for edge in candidates:
                     point = edge.intersect_edge(fe)
                     if point is None:
                         continue
-                    if abs(point - fe.v1) > 2 * EPSILON and abs(point - fe.v2) > 2 * EPSILON:
+                    if _splits(fe, point):
                         del self.fe_add[i]
+                        if group in self._edge_indexes:
+                            self._edge_indexes[group].remove_edge(fe)
                         fe1 = Edge(group, fe.v1, point)
                         fe2 = Edge(group, point, fe.v2)
-                        self.fe_add.append(fe1)
-                        self.fe_add.append(fe2)
+                        self._add_new_edge(fe1)
+                        self._add_new_edge(fe2)
                         for fef in self.fe_add:
                             if isinstance(fef, Face):
                                 try:
@@ -492,6 +766,13 @@ class ModelStep(object):
                                     fef.edges[index] = fe1
                                     fef.edges.insert(index + 1, fe2)
                         progress = True
+                        break    # 'fe' is gone; fe1 and fe2 are checked later
+                yield progress
+
+    def consolidate_subdivide_edges_group(self, group):
+        progress = False
+        for p in self._subdivide_edges_group_iter(group):
+            progress |= p
         return progress
 
     def consolidate_subdivide_edges(self):
@@ -531,7 +812,6 @@ class ModelStep(object):
             if e.point_is_inside(middle):
                 return False
         seen_points = GeometryDict()
-        all_edges = self._all_active_edges(face.group)
         choices = []
 
         while True:
@@ -553,10 +833,12 @@ class ModelStep(object):
                     x = v_ortho.dot(v_next)
                     tails.append((math.atan2(x, y), v))
 
-            for e in all_edges:
-                if e.v1 == head:
+            h = (head.x, head.y, head.z)
+            for e in self._active_edges_at(face.group, head):
+                p1, p2 = e.coords()
+                if geom.equal(p1, h):
                     see(e.v2)
-                elif e.v2 == head:
+                elif geom.equal(p2, h):
                     see(e.v1)
             tails.sort()
 
@@ -596,50 +878,91 @@ class ModelStep(object):
         self.add_face(edges2, paired_with=face)
         return True
 
-    def consolidate_subdivide_faces_group(self, group):
-        progress = False
+    def _subdivide_faces_group_iter(self, group):
+        # a generator that yields after every new edge or face checked,
+        # True if it subdivided a face; see consolidate_iter()
         all_faces = self._all_active_faces(group)
-        all_edges = self._all_active_edges(group)
         for fe in self.fe_add:
             if fe.group is not group:
                 continue
+            progress = False
             if isinstance(fe, Edge):
                 for face in all_faces:
                     progress |= self._consolidate_subdivide_face(face, fe)
             elif isinstance(fe, Face):
-                for edge in all_edges:
+                # only the edges that touch a vertex of the face can split it
+                edges = []
+                for e in fe.edges:
+                    for edge in self._active_edges_at(group, e.v1):
+                        if edge not in edges:
+                            edges.append(edge)
+                for edge in edges:
                     progress |= self._consolidate_subdivide_face(fe, edge)
+            yield progress
+
+    def consolidate_subdivide_faces_group(self, group):
+        progress = False
+        for p in self._subdivide_faces_group_iter(group):
+            progress |= p
         return progress
 
+    def _normalize_added_and_removed(self):
+        # kill faces that are both added and removed
+        add_remain = []
+        for fe in self.fe_add:
+            if fe in self.fe_remove:
+                self.fe_remove.remove(fe)
+            else:
+                add_remain.append(fe)
+        self.fe_add = add_remain
+
     def consolidate_subdivide_faces(self):
+        self._reset_edge_indexes()
         progress = False
         for group in self._all_changed_groups():
             progress |= self.consolidate_subdivide_faces_group(group)
-        #
-        # normalize: kill faces that are both added and removed
+        self._reset_edge_indexes()
         if progress:
-            add_remain = []
-            for fe in self.fe_add:
-                if fe in self.fe_remove:
-                    self.fe_remove.remove(fe)
-                else:
-                    add_remain.append(fe)
-            self.fe_add = add_remain
+            self._normalize_added_and_removed()
         return progress
 
     def consolidate(self, app):
+        for _ in self.consolidate_iter():
+            pass
+
+    def consolidate_iter(self):
+        # Does the same as consolidate(), as a generator that yields often,
+        # so that the caller can spread the work over several frames: see
+        # App.run_pending_steps().  It yields the name of the phase that
+        # did the work since the previous yield.  The model must not change
+        # until the generator is exhausted.
         #self._dump()
 
         # - remove zero-length edges, and zero-edges faces
         self.consolidate_temporary()
+        yield 'temporary'
 
         # - subdivide edges if there are new edges that cross them in the middle
-        while self.consolidate_subdivide_edges():
-            pass
+        progress = True
+        while progress:
+            progress = False
+            for group in self._all_changed_groups():
+                for p in self._subdivide_edges_group_iter(group):
+                    progress |= p
+                    yield 'subdivide_edges'
 
         # - subdivide faces if there are new edges in the middle of them
-        while self.consolidate_subdivide_faces():
-            pass
+        progress = True
+        while progress:
+            progress = False
+            self._reset_edge_indexes()
+            for group in self._all_changed_groups():
+                for p in self._subdivide_faces_group_iter(group):
+                    progress |= p
+                    yield 'subdivide_faces'
+            self._reset_edge_indexes()
+            if progress:
+                self._normalize_added_and_removed()
 
         # - remove duplicate edges and faces
         # XXX NOT IMPLEMENTED YET
@@ -656,6 +979,21 @@ class ModelStep(object):
 
         #self._dump()
 
+    def still_applies(self):
+        # False if some of the edges or faces to remove are not in the
+        # model any more, because another step changed them in the meantime
+        present = {}
+        for fe in self.fe_remove:
+            key = (isinstance(fe, Face), fe.group)
+            try:
+                items = present[key]
+            except KeyError:
+                items = present[key] = set(self.model.get_faces(fe.group) if key[0]
+                                           else self.model.get_edges(fe.group))
+            if fe not in items:
+                return False
+        return True
+
     def check_valid(self):
         # - assert that all the edges of the faces are present in the same group
         group_edges = {}
@@ -0,0 +1,69 @@
+"""Per-frame performance counters.
+
+App.handle_frame() calls reset() at the start of every frame.  The code
+below it adds to the counters with count(), or with timed(), which counts
+the calls and the time spent in milliseconds:
+
+    with perf.timed("tool_hover"):
+        ...
+
+    @perf.timed_function("find_closest")
+    def find_closest(...):
+        ...
+
+At the end of the frame, the counters are copied to App.perf_counters,
+which can be shown in VR and written to a JSONL log (see App.handle_frame()).
+"""
+import time
+
+
+# {name: number}, for the current frame
+counters = {}
+
+def reset():
+    counters.clear()
+
+def count(name, n=1):
+    counters[name] = counters.get(name, 0) + n
+
+def add_time(name, seconds):
+    # adds one call to 'name' and the time to 'name_ms'
+    counters[name] = counters.get(name, 0) + 1
+    key = name + '_ms'
+    counters[key] = counters.get(key, 0.0) + seconds * 1000.0
+
+
+class timed(object):
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.time()
+
+    def __exit__(self, *exc_info):
+        add_time(self.name, time.time() - self.t0)
+
+def timed_function(name):
+    def decorator(func):
+        def wrapper(*args, **kwds):
+            t0 = time.time()
+            try:
+                return func(*args, **kwds)
+            finally:
+                add_time(name, time.time() - t0)
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+    return decorator
+
+
+def format_counters(counters):
+    # one line per counter, sorted by name, for the TextHint overlay
+    lines = []
+    for key in sorted(counters):
+        value = counters[key]
+        if isinstance(value, float):
+            lines.append('%s %.1f' % (key, value))
+        else:
+            lines.append('%s %d' % (key, value))
+    return '\n'.join(lines)
@@ -0,0 +1,126 @@
+"""Least-squares plane fitting, done in-process.
+
+fit_plane() has the same contract as the PlaneRecomputer.RecomputePlane()
+of the Unity side, which util._approx_plane() used to call through cffi:
+it takes a flat list of coordinates [x0, y0, z0, x1, y1, z1, ...] and
+returns (nx, ny, nz, d), the plane through the center of the points whose
+normal is the direction of least variance.  fit_planes() does the same
+for a list of such flat lists, in a single batch if numpy is available.
+
+The sign of the normal is chosen to agree with the winding order of the
+points, as given by Newell's method.  This orientation is the reference:
+RecomputePlane() in Assets/Scripts/Vector3Ex.cs orients its eigenvector
+in the same way, so that both sides agree on which way a face points.
+"""
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# below this number of faces, fit_planes() doesn't bother with numpy
+BATCH_MIN = 8
+
+
+def _smallest_eigenvector(a00, a01, a02, a11, a12, a22):
+    # eigenvector of the symmetric matrix A for the smallest eigenvalue,
+    # using the closed-form eigenvalues of 3x3 symmetric matrices
+    p1 = a01 * a01 + a02 * a02 + a12 * a12
+    q = (a00 + a11 + a22) / 3.0
+    p2 = ((a00 - q) ** 2 + (a11 - q) ** 2 + (a22 - q) ** 2 + 2.0 * p1)
+    if p2 == 0.0:
+        return (1.0, 0.0, 0.0)    # A is a multiple of the identity
+    p = math.sqrt(p2 / 6.0)
+    b00 = (a00 - q) / p
+    b11 = (a11 - q) / p
+    b22 = (a22 - q) / p
+    b01 = a01 / p
+    b02 = a02 / p
+    b12 = a12 / p
+    r = (b00 * (b11 * b22 - b12 * b12) - b01 * (b01 * b22 - b12 * b02) +
+         b02 * (b01 * b12 - b11 * b02)) * 0.5
+    r = max(-1.0, min(1.0, r))
+    phi = math.acos(r) / 3.0
+    lmin = q + 2.0 * p * math.cos(phi + 2.0 * math.pi / 3.0)
+    #
+    # the rows of (A - lmin*I) are orthogonal to the eigenvector
+    rows = [(a00 - lmin, a01, a02), (a01, a11 - lmin, a12), (a02, a12, a22 - lmin)]
+    best = None
+    best_norm2 = 0.0
+    for i, j in [(0, 1), (0, 2), (1, 2)]:
+        u = rows[i]
+        v = rows[j]
+        c = (u[1] * v[2] - u[2] * v[1], u[2] * v[0] - u[0] * v[2], u[0] * v[1] - u[1] * v[0])
+        norm2 = c[0] * c[0] + c[1] * c[1] + c[2] * c[2]
+        if norm2 > best_norm2:
+            best = c
+            best_norm2 = norm2
+    if best is None:
+        # the smallest eigenvalue is double (e.g. the points are on a line):
+        # any vector orthogonal to the remaining row will do
+        u = max(rows, key=lambda row: row[0] * row[0] + row[1] * row[1] + row[2] * row[2])
+        if abs(u[0]) < abs(u[1]) or abs(u[0]) < abs(u[2]):
+            best = (0.0, u[2], -u[1])
+        else:
+            best = (u[1], -u[0], 0.0)
+        best_norm2 = best[0] * best[0] + best[1] * best[1] + best[2] * best[2]
+    norm = math.sqrt(best_norm2)
+    return (best[0] / norm, best[1] / norm, best[2] / norm)
+
+
+def fit_plane(coords):
+    count = len(coords) // 3
+    xs = coords[0::3]
+    ys = coords[1::3]
+    zs = coords[2::3]
+    cx = sum(xs) / count
+    cy = sum(ys) / count
+    cz = sum(zs) / count
+    a00 = a01 = a02 = a11 = a12 = a22 = 0.0
+    nx = ny = nz = 0.0
+    for i in range(count):
+        x = xs[i] - cx
+        y = ys[i] - cy
+        z = zs[i] - cz
+        a00 += x * x
+        a01 += x * y
+        a02 += x * z
+        a11 += y * y
+        a12 += y * z
+        a22 += z * z
+        # Newell's method, for the orientation
+        x2 = xs[i - 1] - cx
+        y2 = ys[i - 1] - cy
+        z2 = zs[i - 1] - cz
+        nx += y2 * z - z2 * y
+        ny += z2 * x - x2 * z
+        nz += x2 * y - y2 * x
+    ex, ey, ez = _smallest_eigenvector(a00, a01, a02, a11, a12, a22)
+    if ex * nx + ey * ny + ez * nz < 0.0:
+        ex, ey, ez = -ex, -ey, -ez
+    return (ex, ey, ez, -(ex * cx + ey * cy + ez * cz))
+
+
+def fit_planes(coords_list):
+    """Same as [fit_plane(coords) for coords in coords_list]."""
+    if numpy is None or len(coords_list) < BATCH_MIN:
+        return [fit_plane(coords) for coords in coords_list]
+    counts = numpy.array([len(coords) // 3 for coords in coords_list])
+    starts = numpy.zeros(len(counts), dtype=numpy.intp)
+    numpy.cumsum(counts[:-1], out=starts[1:])
+    points = numpy.array([c for coords in coords_list for c in coords]).reshape(-1, 3)
+    centers = numpy.add.reduceat(points, starts, axis=0) / counts[:, None]
+    points -= numpy.repeat(centers, counts, axis=0)
+    cov = numpy.add.reduceat(points[:, :, None] * points[:, None, :], starts, axis=0)
+    eigenvalues, eigenvectors = numpy.linalg.eigh(cov)
+    normals = eigenvectors[:, :, 0]      # eigh() sorts the eigenvalues
+    #
+    # Newell's method, for the orientation
+    previous = numpy.arange(len(points)) - 1
+    previous[starts] += counts
+    newell = numpy.add.reduceat(numpy.cross(points[previous], points), starts, axis=0)
+    flip = (normals * newell).sum(axis=1) < 0.0
+    normals[flip] *= -1.0
+    distances = -(normals * centers).sum(axis=1)
+    return [tuple(row) for row in numpy.column_stack((normals, distances)).tolist()]
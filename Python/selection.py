@@ -1,5 +1,7 @@
 from worldobj import Cylinder, SmallSphere, PolygonHighlight
-from util import Vector3, SinglePoint, WholeSpace, Plane, Line
+from util import Vector3, SinglePoint, WholeSpace, Plane, Line, EPSILON
+from vertextable import iter_coords
+import batchselect, facebvh, geom, perf
 
 
 DISTANCE_VERTEX_MIN = SinglePoint._SELECTION_DISTANCE
@@ -255,6 +257,7 @@ def marginal_increase(dist):
     else:
         return dist * 1.01
 
+@perf.timed_function('find_closest')
 def find_closest(app, position, ignore=(), only_group=None):
     for attempt in [find_closest_vertex, find_closest_edge, find_closest_face]:
         if attempt in ignore:
@@ -264,35 +267,101 @@ def find_closest(app, position, ignore=(), only_group=None):
             return result
     return SelectVoid(app, position)
 
+@perf.timed_function('find_closest_vertex')
 def find_closest_vertex(app, position, ignore=(), only_group=None):
     closest = None
     distance_min = app.scale_ctrl(DISTANCE_VERTEX_MIN)
-    for v, group in app.model.all_vertices_with_group(only_group):
-        if v in ignore:
+    for coords, group in app.model.all_vertices_with_group(only_group):
+        if batchselect.ENABLED:
+            distances = batchselect.vertex_distances(coords, position)
+            rows = coords.reshape(-1, 3)
+            def accept(i):
+                return Vector3(*rows[i].tolist()) not in ignore
+            distance_min, i = batchselect.closest_in_order(distances, distance_min, accept)
+            if i is not None:
+                closest = SelectVertex(app, Vector3(*rows[i].tolist()), group)
             continue
-        distance = abs(position - v)
-        if distance < distance_min:
-            distance_min = distance * 1.01
-            closest = SelectVertex(app, v, group)
+        p = (position.x, position.y, position.z)
+        for xyz in iter_coords(coords):
+            distance = geom.distance(p, xyz)
+            if distance < distance_min:
+                v = Vector3(*xyz)
+                if v in ignore:
+                    continue
+                distance_min = distance * 1.01
+                closest = SelectVertex(app, v, group)
     return closest
 
+def _select_along_edge(app, position, e, frac):
+    (x1, y1, z1), (x2, y2, z2) = e.coords()
+    middle = ((x1 + x2) * 0.5, (y1 + y2) * 0.5, (z1 + z2) * 0.5)
+    if geom.distance((position.x, position.y, position.z), middle) < app.scale_ctrl(DISTANCE_VERTEX_MIN):
+        frac = 0.5
+    return SelectAlongEdge(app, e, frac)
+
+@perf.timed_function('find_closest_edge')
 def find_closest_edge(app, position, ignore=(), only_group=None):
     closest = None
     distance_min = app.scale_ctrl(DISTANCE_EDGE_MIN)
+    if batchselect.ENABLED:
+        for group in app.model.iter_groups(only_group, app.model.group_edges):
+            arrays = batchselect.get_group_arrays(app.model, group)
+            fracs, distances = arrays.edge_measures(position)
+            edges = arrays.edges
+            def accept(i):
+                return 0 < fracs[i] < 1 and edges[i] not in ignore
+            distance_min, i = batchselect.closest_in_order(distances, distance_min, accept)
+            if i is not None:
+                closest = _select_along_edge(app, position, edges[i], float(fracs[i]))
+        return closest
+
     for e in app.model.all_edges(only_group):
         if e in ignore:
             continue
         frac, distance = e.measure_distance(position)
         if 0 < frac < 1 and distance < distance_min:
             distance_min = distance * 1.01
-            if abs(position - (e.v1 + e.v2) * 0.5) < app.scale_ctrl(DISTANCE_VERTEX_MIN):
-                frac = 0.5
-            closest = SelectAlongEdge(app, e, frac)
+            closest = _select_along_edge(app, position, e, frac)
     return closest
 
+@perf.timed_function('find_closest_face')
 def find_closest_face(app, position, ignore=(), only_group=None):
-    closest = None
     distance_min = app.scale_ctrl(DISTANCE_FACE_MIN)
+    if facebvh.ENABLED:
+        # Only look at the faces whose bounding box is within 'margin'.  A face
+        # further away can only be selected if 'distance_min' grows above
+        # 'margin' because of the 1.01 factor; in that case, do a full scan.
+        margin = distance_min * 1.05 + 10 * EPSILON
+        peak = distance_min
+        closest = None
+        for group in app.model.iter_groups(only_group, app.model.group_faces):
+            for face in app.model.get_face_bvh(group).query(position, margin):
+                if face in ignore:
+                    continue
+                signed_distance = face.plane.signed_distance_to_point(position)
+                distance = abs(signed_distance)
+                if distance < distance_min and face.point_is_inside(position):
+                    distance_min = distance * 1.01
+                    peak = max(peak, distance_min)
+                    closest = SelectOnFace(app, face, position - face.plane.normal * signed_distance)
+        if peak <= margin:
+            return closest
+        distance_min = app.scale_ctrl(DISTANCE_FACE_MIN)
+
+    closest = None
+    if batchselect.ENABLED:
+        for group in app.model.iter_groups(only_group, app.model.group_faces):
+            arrays = batchselect.get_group_arrays(app.model, group)
+            signed_distances = arrays.face_signed_distances(position)
+            faces = arrays.faces
+            def accept(i):
+                return faces[i] not in ignore and faces[i].point_is_inside(position)
+            distance_min, i = batchselect.closest_in_order(abs(signed_distances), distance_min, accept)
+            if i is not None:
+                face = faces[i]
+                closest = SelectOnFace(app, face, position - face.plane.normal * float(signed_distances[i]))
+        return closest
+
     for face in app.model.all_faces(only_group):
         if face in ignore:
             continue
@@ -303,6 +372,7 @@ def find_closest_face(app, position, ignore=(), only_group=None):
             closest = SelectOnFace(app, face, position - face.plane.normal * signed_distance)
     return closest
 
+@perf.timed_function('find_subgroup')
 def find_subgroup(app, position, ignore=()):
     parent_group = app.curgroup
     distance_min = app.scale_ctrl(max(DISTANCE_EDGE_MIN, DISTANCE_FACE_MIN))
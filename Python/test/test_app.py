@@ -0,0 +1,558 @@
+import os
+import py
+import array
+import app as app_module
+import model as model_module
+import controller
+import document
+import perf as perf_module
+import indexalloc
+from util import Vector3
+from bench import scenes, suite
+
+
+# the data of one controller, far away from the scenes
+FAR = [0.0, 0.0, -5.0, 0.0, 1.0, 0.0, 0.0, 1.7, 0.0]
+
+def start_app(monkeypatch, tmpdir, scene=scenes.box_grid, scene_args=(2,),
+              batch_updates=False, controllers=True):
+    # Writes the model of a scene to a file and opens it in an App.
+    # Returns (app, calls, frame): 'calls' is the list of fn_update() calls,
+    # and frame(data, num_controllers) runs one frame and returns the calls
+    # made during it.  If 'controllers' is False, the tools are not run.
+    calls = []
+    def fn_update(index, kind, raw, length):
+        assert length == len(raw)
+        calls.append((index, kind, list(raw)))
+    monkeypatch.setattr(app_module, 'fn_update', fn_update, raising=False)
+    monkeypatch.setattr(app_module, 'BATCH_UPDATES', batch_updates)
+    monkeypatch.setattr(controller, '_show_menu', lambda index, text: None, raising=False)
+
+    model, step = scenes.make_model(scene, *scene_args)
+    filename = str(tmpdir.join('%s.vrsketch' % (scene.__name__,)))
+    suite.write_vrsketch(filename, step)
+    app = app_module.App(filename)
+    if not controllers:
+        app.ctrlmgr.handle_controllers = lambda num_controllers, controllers: None
+    def frame(data=FAR, num_controllers=1):
+        del calls[:]
+        app.handle_frame(num_controllers, data)
+        return list(calls)
+    return app, calls, frame
+
+def kinds_of(calls):
+    return [kind for index, kind, raw in calls]
+
+def run_frames(monkeypatch, tmpdir, batch_updates):
+    app, calls, frame = start_app(monkeypatch, tmpdir, batch_updates=batch_updates)
+    frames = []
+    for i in range(20):
+        position = Vector3(i * 0.15, 0.5, 0.9)
+        frames.append(frame([position.x, position.y, position.z, 0.0,
+                             1.0, i / 90.0, 0.0, 1.7, 0.0]))
+    return frames
+
+def test_batched_updates_match_per_object_updates(monkeypatch, tmpdir):
+    per_object = run_frames(monkeypatch, tmpdir, False)
+    batched = run_frames(monkeypatch, tmpdir, True)
+    assert len(per_object[0]) > 50
+    for calls, batch_calls in zip(per_object, batched):
+        if not calls:
+            assert batch_calls == []
+            continue
+        assert len(batch_calls) == 1
+        count, kind, data = batch_calls[0]
+        assert kind == app_module.KIND_BATCH
+        # the batch is made of 32-bit floats
+        calls = [(index, kind, list(array.array('f', raw))) for index, kind, raw in calls]
+        assert app_module.decode_batch(count, data) == calls
+
+def test_unchanged_world_objects_are_not_sent_again(monkeypatch, tmpdir):
+    app, calls, frame = start_app(monkeypatch, tmpdir, controllers=False)
+    frame()
+    num_edges = len(app.model.all_edges())
+    num_faces = len(app.model.all_faces())
+    assert app.frame_stats["skipped"] == 0
+    assert app.frame_stats["updates"] >= num_edges + num_faces
+
+    # selecting one edge re-sends only that edge (and the other edges of
+    # the box_grid that have the same two vertices)
+    edge = app.model.all_edges()[0]
+    old_indexes = dict((e, app.model2worldobj[e]._index) for e in app.model.all_edges())
+    app.selected_edges.add(edge)
+    app.selection_updated(also_faces=True)
+    selected = [e for e in app.model.all_edges() if app.model2worldobj[e]._kind == 253]
+    assert edge in selected
+    calls = frame()
+    assert app.frame_stats["skipped"] == num_edges + num_faces - len(selected)
+    sent = [call for call in calls if call[1] != app_module.KIND_DESTROYED]
+    removed = [call for call in calls if call[1] == app_module.KIND_DESTROYED]
+    assert [call[1] for call in sent if call[1] >= 250] == [253] * len(selected)
+    # the SelectedStems take the indexes of the Stems: nothing is removed
+    assert removed == []
+    assert (sorted(call[0] for call in sent if call[1] == 253) ==
+            sorted(old_indexes[e] for e in selected))
+
+    # nothing changes: nothing is displayed again, nothing is sent
+    app.selection_updated(also_faces=True)
+    calls = frame()
+    assert app.frame_stats["skipped"] == 0
+    assert [call for call in calls if call[1] in (0, 101, 102, 251, 253)] == []
+
+    # reopening the same file doesn't send the model again, except the
+    # edges that are not selected any more
+    app.open(app.file.filename)
+    calls = frame()
+    assert app.frame_stats["skipped"] == num_edges + num_faces - len(selected)
+    assert [call[1] for call in calls if call[1] in (101, 102, 251)] == [251] * len(selected)
+
+def test_flash_slots(monkeypatch, tmpdir):
+    app, calls, run_frame = start_app(monkeypatch, tmpdir)
+    def frame(x):
+        return run_frame([x, 0.5, 0.9, 0.0, 1.0, 0.0, 0.0, 1.7, 0.0])
+
+    first = frame(0.5)
+    assert app.flash_slots
+    # a stationary controller sends nothing more
+    assert frame(0.5) == []
+    assert frame(0.5) == []
+    assert app.frame_stats["skipped"] == len(app.flash_slots)
+    # moving it sends updates of the same indexes, without removes
+    moved = frame(0.52)
+    assert moved
+    assert set((index, kind) for index, kind, raw in moved) <= set(
+        (index, kind) for index, kind, raw in first)
+    # the slots that are not flashed any more are removed
+    indexes = set(wo._index for wo, raw in app.flash_slots.values())
+    app.ctrlmgr.handle_controllers = lambda num_controllers, controllers: None
+    removed = frame(0.52)
+    assert sorted(index for index, kind, raw in removed) == sorted(indexes)
+    assert set(kind for index, kind, raw in removed) == set([app_module.KIND_DESTROYED])
+    assert app.flash_slots == {}
+
+def test_flash_slots_send_the_raw_data_compared(monkeypatch, tmpdir):
+    app, calls, run_frame = start_app(monkeypatch, tmpdir, batch_updates=True)
+    added = []
+    original_add = app_module.UpdateBatch.add
+    def add(batch, index, wo, raw=None):
+        added.append((wo, raw))
+        return original_add(batch, index, wo, raw)
+    monkeypatch.setattr(app_module.UpdateBatch, 'add', add)
+    def frame(x):
+        del added[:]
+        return run_frame([x, 0.5, 0.9, 0.0, 1.0, 0.0, 0.0, 1.7, 0.0])
+
+    frame(0.5)
+    [(count, kind, data)] = frame(0.52)
+    # the flashed objects that changed are sent with the raw data that
+    # _update_flash_slots() computed, instead of calling writeraw()
+    flashed = dict(app.flash_slots.values())
+    sent = [(wo, raw) for wo, raw in added if wo in flashed]
+    assert sent
+    for wo, raw in sent:
+        assert raw is flashed[wo]
+    records = dict((index, raw) for index, kind, raw in app_module.decode_batch(count, data))
+    for wo, raw in sent:
+        assert records[wo._index] == list(array.array('f', raw))
+    assert app.pending_raw == {}
+
+def test_merged_groups(monkeypatch, tmpdir):
+    app, calls, run_frame = start_app(monkeypatch, tmpdir, scenes.nested_groups, (2, 2),
+                                      controllers=False)
+    def frame():
+        return kinds_of(run_frame())
+
+    root = app.model.root_group
+    groups = app.model.get_groups()
+    assert len(groups) == 7
+    kinds = frame()
+    # the root group has one box, of 24 edges and 6 faces; the 6 other
+    # groups are merged
+    assert sorted(kinds) == [101] * 6 + [251] * 24 + [260] * 6
+    for fe in app.model2worldobj:
+        assert fe.group is root
+    merged = app.merged_groups.values()
+    assert len(merged) == 6
+    wo = merged[0]
+    assert wo.rawsize() == len(wo.getrawdata())
+    assert wo.getrawdata()[:4] == [1, -1, 6, 4]     # default color, 6 faces of 4 vertices
+
+    # entering a subgroup: it becomes per-element, and the root group merged
+    sub = [g for g in groups if g.parent is root][0]
+    app.change_group(sub)
+    kinds = frame()
+    # the root group and the other child of the root, with its two
+    # subgroups, change from "subgroup" to "elsewhere" and are sent again;
+    # the two subgroups of 'sub' didn't change.  All the indexes that are
+    # freed are reused.
+    assert sorted(kinds) == [101] * 6 + [251] * 24 + [260] * 4
+    assert set(fe.group for fe in app.model2worldobj) == set([sub])
+    assert set(app.merged_groups) == groups - set([sub])
+    assert app.frame_stats["skipped"] == 2
+
+    # changing a merged group re-sends only that group
+    other = [g for g in groups if g.parent is root][1]
+    step = model_module.ModelStep(app.model, "Remove")
+    step.fe_remove.add(app.model.get_faces(other)[0])
+    step.apply(app)
+    old_wo = app.merged_groups[other]
+    kinds = frame()
+    assert kinds == [260]
+    assert app.merged_groups[other] is not old_wo
+    assert app.merged_groups[other]._index == calls[0][0]
+
+    # nothing changes: nothing is sent
+    app.selection_updated(also_faces=True)
+    assert frame() == []
+
+def test_merged_groups_disabled(monkeypatch, tmpdir):
+    monkeypatch.setattr(app_module, 'MERGE_INACTIVE_GROUPS', False)
+    app, calls, frame = start_app(monkeypatch, tmpdir, scenes.nested_groups, (2, 2))
+    frame()
+    assert app.merged_groups == {}
+    assert len(app.model2worldobj) == 7 * 30
+
+def test_merged_groups_lod(monkeypatch, tmpdir):
+    import lod
+    monkeypatch.setattr(lod, 'MAX_SWAPS_PER_FRAME', 2)
+    app, calls, run_frame = start_app(monkeypatch, tmpdir, scenes.nested_groups, (2, 2))
+    def frame(head):
+        return kinds_of(run_frame([1.0, 0.0, head.x, head.y, head.z], 0))
+
+    # the first frame already knows where the head is: far away, every
+    # group is shown as its bounding box
+    kinds = frame(Vector3(0, 0, 1000))
+    assert kinds.count(260) == 6
+    assert set(app.group_lod.values()) == set([lod.LOD_BOX])
+    wo = app.merged_groups.values()[0]
+    assert wo.getrawdata()[:4] == [1, -1, 6, 4]
+    assert len(wo.raw) == 1 + 2 + 6 * (1 + 12) + 2 + 12 * 6
+    # moving around a bit doesn't change anything
+    assert frame(Vector3(0, 0, 999)) == []
+
+    # coming back near: at most two groups per frame get more detail,
+    # the nearest first
+    def distance(group):
+        return lod.box_distance(Vector3(0, 0, 0), app.model.get_bounding_box(group))
+    expected = dict((group, lod.choose_level(distance(group), lod.LOD_BOX))
+                    for group in app.group_lod)
+    assert len([group for group in expected if expected[group] != lod.LOD_BOX]) == 4
+    done = set()
+    for i in range(2):
+        assert frame(Vector3(0, 0, 0)) == [260, 260]
+        assert app.frame_stats["lod_swaps"] == 2
+        assert app.frame_stats["lod_pending"] == 2 - 2 * i
+        swapped = [group for group, level in app.group_lod.items()
+                   if level != lod.LOD_BOX and group not in done]
+        assert len(swapped) == 2
+        waiting = [group for group in expected
+                   if expected[group] != lod.LOD_BOX and app.group_lod[group] == lod.LOD_BOX]
+        if waiting:
+            assert max(map(distance, swapped)) <= min(map(distance, waiting))
+        done.update(swapped)
+    assert frame(Vector3(0, 0, 0)) == []
+    assert app.frame_stats["lod_pending"] == 0
+    assert app.group_lod == expected
+    assert lod.LOD_HULL in expected.values()
+
+def test_time_sliced_consolidation(monkeypatch, tmpdir):
+    # a negative budget: every frame does a single slice of consolidation
+    monkeypatch.setattr(app_module, 'CONSOLIDATE_BUDGET', -1.0)
+
+    def edge_key(edge):
+        return tuple(sorted([(edge.v1.x, edge.v1.y, edge.v1.z),
+                             (edge.v2.x, edge.v2.y, edge.v2.z)]))
+    def line_step(model, x):
+        # a line on the ground that cuts the bottom of a box in two
+        step = model_module.ModelStep(model, "Draw line")
+        step.add_edge(model.root_group, Vector3(x, -0.5, 0.0), Vector3(x, 1.5, 0.0))
+        return step
+
+    app, calls, run_frame = start_app(monkeypatch, tmpdir, controllers=False)
+    def frame():
+        return kinds_of(run_frame())
+    frame()
+
+    # the step is previewed until it is applied and recorded, some frames later
+    step = line_step(app.model, 0.5)
+    app.execute_step(step)
+    kinds = frame()
+    assert app.pending_steps == [step]
+    assert 251 in kinds
+    preview = app.step_previews[step]
+    assert app.frame_stats["steps_pending"] == 1
+    frames = 1
+    while app.pending_steps:
+        frame()
+        frames += 1
+    assert frames > 2
+    assert app.frame_stats["steps_done"] == 1
+    assert app.file.undoable_actions[-1] is step
+    assert app.step_previews == {}
+    assert set(wo._kind for wo in preview) == set([app_module.KIND_DESTROYED])
+
+    # the result is the same as with consolidate()
+    reference, ref_step = scenes.make_model(scenes.box_grid, 2)
+    ref_step = line_step(reference, 0.5)
+    ref_step.consolidate(None)
+    ref_step._apply_to_model()
+    assert (sorted(map(edge_key, app.model.all_edges())) ==
+            sorted(map(edge_key, reference.all_edges())))
+    assert len(app.model.all_faces()) == len(reference.all_faces())
+
+    # the steps executed in the meantime wait; undo cancels the last one
+    step1 = line_step(app.model, 2.0)
+    app.execute_step(step1)
+    frame()
+    edge = [e for e in app.model.get_edges(app.model.root_group)
+                 if edge_key(e) == ((1.5, 0.0, 0.0), (2.5, 0.0, 0.0))][0]
+    step2 = model_module.ModelStep(app.model, "Erase")
+    step2.remove(edge)
+    app.execute_step(step2)
+    step3 = line_step(app.model, 3.0)
+    app.execute_step(step3)
+    app._handle_click_undo()
+    assert app.pending_steps == [step1, step2]
+    # nothing happens while a tool shows a temporary step
+    temporary = model_module.ModelStep(app.model, "Move")
+    app.execute_temporary_step(temporary)
+    frame()
+    frame()
+    assert app.pending_steps == [step1, step2]
+    app.cancel_temporary_step(temporary)
+    dropped = 0
+    while app.pending_steps:
+        frame()
+        dropped += app.frame_stats["steps_dropped"]
+    # step1 split 'edge', so step2 doesn't apply any more and is dropped
+    assert app.file.undoable_actions[-1] is step1
+    assert edge not in app.model.get_edges(app.model.root_group)
+    assert app.step_previews == {}
+    assert dropped == 1
+    # this is shown next to the controller for a while
+    del app.ctrlmgr.handle_controllers
+    for i in range(3):
+        frame()
+        assert app.frame_stats["steps_dropped"] == 0
+        [hint] = [wo for wo, raw in app.flash_slots.values() if wo._kind == 150]
+        assert '"Erase"' in hint.text
+    app.dropped_hint = (hint.text, 1)
+    frame()
+    frame()
+    assert [wo for wo, raw in app.flash_slots.values() if wo._kind == 150] == []
+
+class FailingStep(model_module.ModelStep):
+    def consolidate_iter(self):
+        for phase in model_module.ModelStep.consolidate_iter(self):
+            yield phase
+            raise ValueError("consolidation failed")
+
+def test_failed_consolidation(monkeypatch, tmpdir):
+    monkeypatch.setattr(app_module, 'CONSOLIDATE_BUDGET', -1.0)
+    app, calls, frame = start_app(monkeypatch, tmpdir, controllers=False)
+    frame()
+    num_edges = len(app.model.all_edges())
+    step = FailingStep(app.model, "Draw line")
+    step.add_edge(app.model.root_group, Vector3(0.5, -0.5, 0.0), Vector3(0.5, 1.5, 0.0))
+    app.execute_step(step)
+    frame()
+    preview = app.step_previews[step]
+    # the error is raised once; the step is not applied by the next frames
+    py.test.raises(ValueError, frame)
+    assert app.pending_steps == []
+    assert app.consolidating is None
+    assert app.step_previews == {}
+    assert set(wo._kind for wo in preview) == set([app_module.KIND_DESTROYED])
+    frame()
+    frame()
+    assert step not in app.file.undoable_actions
+    assert len(app.model.all_edges()) == num_edges
+
+def test_open_applies_the_pending_steps(monkeypatch, tmpdir):
+    monkeypatch.setattr(app_module, 'CONSOLIDATE_BUDGET', -1.0)
+    app, calls, frame = start_app(monkeypatch, tmpdir, controllers=False)
+    frame()
+    filename = app.file.filename
+    step = model_module.ModelStep(app.model, "Draw line")
+    step.add_edge(app.model.root_group, Vector3(0.5, -0.5, 0.0), Vector3(0.5, 1.5, 0.0))
+    app.execute_step(step)
+    frame()
+    assert app.pending_steps == [step]
+    app.open(str(tmpdir.join('other.vrsketch')))
+    assert app.pending_steps == []
+    assert app.step_previews == {}
+    # the step was recorded in the first document before it was closed
+    reloaded = document.VRSketchFile(filename)
+    assert reloaded.undoable_actions[-1].name == "Draw line"
+    reloaded.close()
+
+def test_perf_counters(monkeypatch, tmpdir):
+    import json
+    monkeypatch.setattr(app_module, 'CONSOLIDATE_BUDGET', None)
+    app, calls, run_frame = start_app(monkeypatch, tmpdir, batch_updates=True)
+    def frame():
+        return kinds_of(run_frame([0.5, 0.5, 0.9, 0.0, 1.0, 0.0, 0.0, 1.7, 0.0]))
+
+    frame()
+    counters = app.perf_counters
+    assert counters["fn_update_calls"] == 1
+    assert counters["floats_sent"] == len(calls[0][2])
+    assert counters["updates"] == app.frame_stats["updates"]
+    assert counters["find_closest"] >= 1
+    assert counters["tool_hover"] == 1
+    assert counters["frame_ms"] >= counters["tool_hover_ms"]
+    assert "tool_drag" not in counters
+
+    # the overlay is a TextHint, showing the counters of the previous frame
+    app.handle_click('perf')
+    previous = app.perf_counters
+    frame()
+    [hint] = [wo for wo, raw in app.flash_slots.values() if wo._kind == 150]
+    assert hint.text == perf_module.format_counters(previous)
+    app.handle_click('perf')
+    frame()
+    assert [wo for wo, raw in app.flash_slots.values() if wo._kind == 150] == []
+
+    # the consolidation phases of a step
+    step = model_module.ModelStep(app.model, "Draw line")
+    step.add_edge(app.model.root_group, Vector3(0.5, -0.5, 0.0), Vector3(0.5, 1.5, 0.0))
+    app.execute_step(step)
+    frame()
+    for key in ["consolidate_temporary", "consolidate_subdivide_edges",
+                "consolidate_subdivide_faces", "consolidate_finish", "apply_step"]:
+        assert app.perf_counters[key] >= 1
+
+    # the log is written every PERF_LOG_FLUSH_FRAMES frames, and when it
+    # is turned off
+    monkeypatch.setattr(app_module, 'PERF_LOG_FLUSH_FRAMES', 3)
+    log_filename = app.file.filename + app_module.PERF_LOG_SUFFIX
+    def read_log():
+        with open(log_filename) as f:
+            return [json.loads(line) for line in f]
+    app.handle_click('perflog')
+    frame()
+    frame()
+    assert not os.path.exists(log_filename)
+    frame()
+    assert len(read_log()) == 3
+    frame()
+    assert len(read_log()) == 3
+    app.handle_click('perflog')
+    frame()
+    lines = read_log()
+    assert len(lines) == 4
+    assert set(lines[-1]) == set(app.perf_counters) | set(["time"])
+
+def test_world_object_indexes_stay_dense(monkeypatch, tmpdir):
+    monkeypatch.setattr(indexalloc, 'COMPACT_MIN_FREE', 8)
+    app, calls, run_frame = start_app(monkeypatch, tmpdir, scene_args=(3,), controllers=False)
+    model, step = scenes.make_model(scenes.box_grid, 1)
+    smaller = str(tmpdir.join('grid1.vrsketch'))
+    suite.write_vrsketch(smaller, step)
+    # 'unity' simulates WorldScript.world_objects: {index: kind}
+    unity = {}
+    def frame():
+        for index, kind, raw in run_frame():
+            if kind == app_module.KIND_DESTROYED:
+                del unity[index]
+            else:
+                unity[index] = kind
+        owners = app.indexes.owners
+        assert unity == dict((index, wo._kind) for index, wo in owners.items())
+    frame()
+    high_water = app.indexes.top
+    assert high_water == 9 * 30
+
+    # a smaller model: the idle frames that follow move the world objects
+    # down, until they use the indexes 0 to 29
+    app.open(smaller)
+    frame()
+    assert len(app.indexes.owners) == 30
+    assert app.indexes.top > 30
+    for i in range(10):
+        frame()
+    assert app.indexes.stats()["index_top"] == 30
+    assert app.indexes.stats()["index_high_water"] == high_water
+    assert app.perf_counters["index_compacted"] > 0
+
+def test_perf_overlay_does_not_prevent_compaction(monkeypatch, tmpdir):
+    # the overlay is sent again in every frame, but the frames are still idle
+    monkeypatch.setattr(indexalloc, 'COMPACT_MIN_FREE', 8)
+    app, calls, frame = start_app(monkeypatch, tmpdir, scene_args=(3,))
+    model, step = scenes.make_model(scenes.box_grid, 1)
+    smaller = str(tmpdir.join('grid1.vrsketch'))
+    suite.write_vrsketch(smaller, step)
+    app.show_perf = True
+    frame()
+    high_water = app.indexes.top
+    app.open(smaller)
+    frame()
+    assert app.indexes.top > 30
+    # the first idle frame already compacts
+    frame()
+    assert app.frame_stats["compacted"] > 0
+    assert app.indexes.top < high_water
+    assert app.perf_counters["index_top"] == app.indexes.top
+
+def test_incremental_selection(monkeypatch, tmpdir):
+    app, calls, run_frame = start_app(monkeypatch, tmpdir, scenes.nested_groups, (1, 2),
+                                      controllers=False)
+    def frame():
+        run_frame()
+        return app.frame_stats
+    app.selection_updated(also_faces=True)
+    frame()
+    root = app.model.root_group
+
+    # selecting an edge displays again only it and the edges with the same
+    # vertices, in either direction
+    edge = app.model.get_edges(root)[0]
+    same = [e for e in app.model.get_edges(root)
+              if (e.v1, e.v2) in [(edge.v1, edge.v2), (edge.v2, edge.v1)]]
+    assert len(same) == 2
+    app.selected_edges.add(edge)
+    app.selection_updated()
+    stats = frame()
+    assert (stats["updates"], stats["skipped"]) == (2, 0)
+    for e in app.model.get_edges(root):
+        assert (app.model2worldobj[e]._kind == 253) == (e in same)
+    # selecting the other one changes nothing visible
+    app.selected_edges.add(same[1] if same[0] is edge else same[0])
+    app.selection_updated()
+    stats = frame()
+    assert (stats["updates"], stats["skipped"]) == (0, 2)
+    app.selected_edges.clear()
+    app.selection_updated()
+    stats = frame()
+    assert (stats["updates"], stats["skipped"]) == (2, 0)
+    assert len(app.selected_pairs) == 0
+
+    # selecting a subgroup displays its edges and faces on their own,
+    # instead of the MergedGroup
+    sub = [g for g in app.model.get_groups() if g.parent is root][0]
+    merged = app.merged_groups[sub]
+    app.selected_subgroups.add(sub)
+    app.selection_updated()
+    stats = frame()
+    assert stats["updates"] == 24 + 6
+    assert sub not in app.merged_groups
+    assert merged._kind == app_module.KIND_DESTROYED
+    app.selected_subgroups.clear()
+    app.selection_updated()
+    stats = frame()
+    assert stats["updates"] == 1
+    assert sub in app.merged_groups
+
+    # opening another document starts from an empty selection
+    app.selected_edges.add(edge)
+    app.selected_subgroups.add(sub)
+    app.selection_updated()
+    frame()
+    app.open(app.file.filename)
+    assert app.selected_edges == app.shown_selected_edges == set()
+    assert app.selected_subgroups == app.shown_selected_subgroups == set()
+    assert len(app.selected_pairs) == 0
+    app.selection_updated(also_faces=True)
+    frame()
+    assert [wo for wo in app.model2worldobj.values() if wo._kind == 253] == []
+    assert len(app.merged_groups) == len(app.model.get_groups()) - 1
@@ -0,0 +1,33 @@
+from model import Model, Face
+from bench import scenes, suite
+
+
+def test_scenes_are_valid():
+    for name, generator in sorted(scenes.SCENES.items()):
+        model = Model()
+        step = generator(model, 2)
+        step.check_valid()
+        step._apply_to_model()
+        assert model.all_edges()
+
+def test_scene_sizes():
+    model, _ = scenes.make_model(scenes.box_grid, 2)
+    assert len(model.all_faces()) == 4 * 6
+    assert len(model.all_edges()) == 4 * 6 * 4
+    model, _ = scenes.make_model(scenes.coplanar_faces, 3)
+    assert len(model.all_faces()) == 9
+    for face in model.all_faces():
+        assert face.plane.normal.z == 1.0
+    model, _ = scenes.make_model(scenes.nested_groups, 2, 2)
+    assert len(model.get_groups()) == 1 + 2 + 4
+    model, _ = scenes.make_model(scenes.polyline, 10)
+    assert len(model.all_edges()) == 10
+
+def test_quick_suite():
+    results = suite.run(["consolidate", "find_closest", "edge_access", "load", "load_binary"],
+                        quick=True)
+    scenarios = set(entry["scenario"] for entry in results.entries)
+    assert scenarios == set(["consolidate", "find_closest", "edge_v1_v2", "edge_v1_v2_detached",
+                             "edge_coords", "load", "load_binary"])
+    for entry in results.entries:
+        assert entry["seconds"] >= 0.0
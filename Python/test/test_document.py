@@ -0,0 +1,365 @@
+import os
+import document
+from document import VRSketchFile
+from model import ModelStep, Group, Edge, Face
+from util import Vector3
+from bench import scenes, suite
+
+
+def model_key(model):
+    root = model.root_group
+    edges = sorted((e.eid, document._group_path(e.group, root),
+                    tuple(e.v1.tolist() + e.v2.tolist())) for e in model.all_edges())
+    faces = sorted((f.fid, tuple(e.eid for e in f.edges), f.physics.color)
+                   for f in model.all_faces())
+    return edges, faces
+
+class FakeApp(object):
+    selected_edges = ()
+    def _remove_edge_or_face(self, fe): pass
+    def _add_edge_or_face(self, fe): pass
+
+def test_varints():
+    values = [0, 1, 127, 128, 300, 2 ** 40]
+    out = bytearray()
+    document._encode_varints(values, out)
+    assert document._decode_varints(out, 0) == (values, len(out))
+    out = bytearray()
+    document._encode_varints([5, 0, 127], out)
+    assert out == bytearray([3, 3, 5, 0, 127])
+    ids = [10, 11, 12, 3, 1000, 999]
+    out = bytearray()
+    document._encode_ids(ids, out)
+    assert document._decode_ids(out, 0) == (ids, len(out))
+
+def test_binary_step_round_trip():
+    model, step = scenes.make_model(scenes.nested_groups, 2, 2)
+    step = ModelStep(model, u"Caf\xe9")
+    step.fe_add += model.all_edges()
+    step.fe_add += model.all_faces()
+    face = model.all_faces()[0]
+    face.physics.color = 0x123456
+    step.fe_remove.add(model.all_edges()[3])
+    step.fe_remove.add(face)
+    name, remove_eids, remove_fids, edges, faces = document.decode_binary_step(
+        document.encode_binary_step(step))
+    assert name == u"Caf\xe9"
+    assert remove_eids == [model.all_edges()[3].eid]
+    assert remove_fids == [face.fid]
+    root = model.root_group
+    assert [(eid, path, v1.tolist(), v2.tolist()) for eid, path, v1, v2 in edges] == [
+        (e.eid, document._group_path(e.group, root) if e.group is not root else None,
+         e.v1.tolist(), e.v2.tolist()) for e in model.all_edges()]
+    assert faces[0] == (face.fid, [e.eid for e in face.edges], 0x123456)
+    assert faces[1][2] is None
+
+def test_load_json_and_binary(tmpdir):
+    for generator, args in [(scenes.box_grid, (2,)), (scenes.nested_groups, (2, 2))]:
+        model, step = scenes.make_model(generator, *args)
+        fj = str(tmpdir.join('a.vrsketch'))
+        fb = str(tmpdir.join('b.vrsketch'))
+        suite.write_vrsketch(fj, step)
+        suite.write_vrsketch(fb, step, binary=True)
+        with open(fb, 'rb') as f:
+            assert f.read(len(document.BINARY_MAGIC)) == document.BINARY_MAGIC
+        a = VRSketchFile(fj)
+        b = VRSketchFile(fb)
+        assert not a.binary and b.binary
+        assert model_key(a.model) == model_key(b.model) == model_key(model)
+        assert os.path.getsize(fb) < os.path.getsize(fj) / 4
+
+def test_compression(tmpdir, monkeypatch):
+    model, step = scenes.make_model(scenes.box_grid, 2)
+    sizes = {}
+    for compress in [False, True]:
+        filename = str(tmpdir.join('%s.vrsketch' % compress))
+        with open(filename, 'wb') as f:
+            document.write_header(f, binary=True)
+            document.write_binary_model_step(f, step, compress=compress)
+        sizes[compress] = os.path.getsize(filename)
+        assert model_key(VRSketchFile(filename).model) == model_key(model)
+    assert sizes[True] < sizes[False] / 4
+
+def test_truncated_binary_file(tmpdir):
+    import pytest
+    model, step = scenes.make_model(scenes.box_grid, 1)
+    payload = document.encode_binary_step(step)
+    for k in range(len(payload)):
+        with pytest.raises(ValueError):
+            document.decode_binary_step(payload[:k])
+    # a file cut inside the header, or inside the header or the payload
+    # of the first record
+    filename = str(tmpdir.join('truncated.vrsketch'))
+    with open(filename, 'wb') as f:
+        document.write_header(f, binary=True)
+        document.write_binary_model_step(f, step, compress=False)
+    with open(filename, 'rb') as f:
+        data = f.read()
+    start = len(document.BINARY_MAGIC) + 1
+    size, hlen = document._decode_uvarint(bytearray(data[start:start + 11]), 0)
+    assert hlen > 1
+    for k in [start - 1] + range(start + 1, start + hlen + 1 + size):
+        with open(filename, 'wb') as f:
+            f.write(data[:k])
+        with pytest.raises(ValueError):
+            VRSketchFile(filename)
+
+def test_binary_document_steps_and_undo(tmpdir, monkeypatch):
+    monkeypatch.setattr(document, 'NEW_FILES_BINARY', True)
+    filename = str(tmpdir.join('new.vrsketch'))
+    doc = VRSketchFile(filename)
+    assert doc.binary
+    initial = model_key(doc.model)
+    doc.wait_for_writes()
+    size0 = os.path.getsize(filename)
+
+    group = Group(doc.model.root_group)
+    step = ModelStep(doc.model, "Draw line")
+    step.add_edge(group, Vector3(0, 0, 0), Vector3(0, 0, 2.5))
+    step._apply_to_model()
+    doc.record_undoable_action(step)
+    doc.wait_for_writes()
+    assert model_key(VRSketchFile(filename).model) == model_key(doc.model)
+
+    doc.undo_once(FakeApp())
+    assert os.path.getsize(filename) == size0
+    reloaded = VRSketchFile(filename)
+    assert model_key(reloaded.model) == initial
+    assert [s.name for s in reloaded.undoable_actions] == ["Initial rectangle"]
+
+
+def make_history(doc, num_steps):
+    # records 'num_steps' steps that add and remove edges, in the root group
+    # and in a subgroup, and remove the initial face; returns the model and
+    # the file size after each step, starting with the initial state
+    doc.wait_for_writes()
+    keys = [model_key(doc.model)]
+    sizes = [os.path.getsize(doc.filename)]
+    group = Group(doc.model.root_group)
+    added = []
+    for i in range(num_steps):
+        step = ModelStep(doc.model, "Step %d" % i)
+        gr = group if i % 2 else doc.model.root_group
+        added.append(step.add_edge(gr, Vector3(i, 0, 0), Vector3(i, 1, 0.5)))
+        if i % 3 == 2:
+            step.fe_remove.add(added.pop(0))
+        if i == 4:
+            step.fe_remove.add(doc.model.all_faces()[0])
+        step._apply_to_model()
+        doc.record_undoable_action(step)
+        doc.wait_for_writes()
+        keys.append(model_key(doc.model))
+        sizes.append(os.path.getsize(doc.filename))
+    return keys, sizes
+
+def test_snapshots(tmpdir, monkeypatch):
+    monkeypatch.setattr(document, 'SNAPSHOT_EVERY_STEPS', 4)
+    monkeypatch.setattr(document, 'SNAPSHOT_EVERY_BYTES', None)
+    for binary in [False, True]:
+        monkeypatch.setattr(document, 'NEW_FILES_BINARY', binary)
+        filename = str(tmpdir.join('snap%d.vrsketch' % binary))
+        doc = VRSketchFile(filename)
+        keys, sizes = make_history(doc, 10)
+        assert len(doc.snapshots) == 2     # after 4 and 8 of the 11 steps
+        counters = (Edge._NUMBER, Face._NUMBER, Group._NUMBER)
+        #
+        monkeypatch.setattr(Edge, '_NUMBER', 1)
+        monkeypatch.setattr(Face, '_NUMBER', 1)
+        monkeypatch.setattr(Group, '_NUMBER', 1)
+        reloaded = VRSketchFile(filename)
+        assert model_key(reloaded.model) == keys[-1]
+        assert (Edge._NUMBER, Face._NUMBER, Group._NUMBER) == counters
+        # only the 3 steps after the last snapshot are loaded
+        assert isinstance(reloaded.undoable_actions[0], document._OlderSteps)
+        assert reloaded.undoable_actions[0].name == "Step 6"
+        assert [s.name for s in reloaded.undoable_actions[1:]] == [
+            "Step 7", "Step 8", "Step 9"]
+        #
+        # undo everything, reconstructing the older steps on the way
+        for i in range(len(keys) - 1, 0, -1):
+            reloaded.undo_once(FakeApp())
+            assert model_key(reloaded.model) == keys[i - 1]
+            assert os.path.getsize(filename) == sizes[i - 1]
+        assert [s.name for s in reloaded.undoable_actions] == ["Initial rectangle"]
+        assert reloaded.snapshots == []
+        #
+        # redo them; the snapshots are written again at the same places
+        for i in range(1, len(keys)):
+            reloaded.redo_once(FakeApp())
+            reloaded.wait_for_writes()
+            assert model_key(reloaded.model) == keys[i]
+            assert os.path.getsize(filename) == sizes[i]
+        assert reloaded.snapshots == doc.snapshots
+
+def test_invalid_snapshot(tmpdir, monkeypatch):
+    monkeypatch.setattr(document, 'SNAPSHOT_EVERY_STEPS', 3)
+    for binary in [False, True]:
+        monkeypatch.setattr(document, 'NEW_FILES_BINARY', binary)
+        filename = str(tmpdir.join('bad%d.vrsketch' % binary))
+        doc = VRSketchFile(filename)
+        keys, sizes = make_history(doc, 7)
+        first, last = doc.snapshots
+        with open(filename, 'rb') as f:
+            data = f.read()
+        if binary:
+            # change a byte in the middle of the payload of the last snapshot
+            size, hlen = document._decode_uvarint(bytearray(data[last:last + 11]), 0)
+            k = last + hlen + 1 + size // 2
+        else:
+            k = data.index('"counters"', last) + 1
+        data = data[:k] + chr(ord(data[k]) ^ 1) + data[k + 1:]
+        with open(filename, 'wb') as f:
+            f.write(data)
+        reloaded = VRSketchFile(filename)
+        assert reloaded.snapshots == [first]
+        assert reloaded.invalid_snapshots == [last]
+        assert doc.invalid_snapshots == []
+        assert model_key(reloaded.model) == keys[-1]
+        assert [s.name for s in reloaded.undoable_actions[1:]] == [
+            "Step 2", "Step 3", "Step 4", "Step 5", "Step 6"]
+
+def test_lazy_history(tmpdir, monkeypatch):
+    monkeypatch.setattr(document, 'LAZY_HISTORY', True)
+    monkeypatch.setattr(document, 'LAZY_HISTORY_KEEP', 2)
+    monkeypatch.setattr(document, 'SNAPSHOT_EVERY_STEPS', 4)
+    monkeypatch.setattr(document, 'SNAPSHOT_EVERY_BYTES', None)
+    for binary in [False, True]:
+        monkeypatch.setattr(document, 'NEW_FILES_BINARY', binary)
+        filename = str(tmpdir.join('lazy%d.vrsketch' % binary))
+        doc = VRSketchFile(filename)
+        keys, sizes = make_history(doc, 10)
+        # the 9 first steps are only positions in the file
+        older = doc.undoable_actions[0]
+        assert isinstance(older, document._OlderSteps)
+        assert len(older.positions) == 9 and older.name == "Step 7"
+        assert [s.name for s in doc.undoable_actions[1:]] == ["Step 8", "Step 9"]
+        reloaded = VRSketchFile(filename)
+        assert len(reloaded.undoable_actions) == 3
+        assert len(reloaded.undoable_actions[0].positions) == 9
+        #
+        for d in [doc, reloaded]:
+            for i in range(len(keys) - 1, 0, -1):
+                d.undo_once(FakeApp())
+                assert model_key(d.model) == keys[i - 1]
+                assert os.path.getsize(filename) == sizes[i - 1]
+                assert len(d.undoable_actions) <= 1 + 4
+            for i in range(1, len(keys)):
+                d.redo_once(FakeApp())
+                d.wait_for_writes()
+                assert model_key(d.model) == keys[i]
+                assert os.path.getsize(filename) == sizes[i]
+            assert len(d.undoable_actions) == 3
+
+def test_enum_steps(tmpdir, monkeypatch):
+    monkeypatch.setattr(document, 'SNAPSHOT_EVERY_STEPS', 3)
+    for binary in [False, True]:
+        monkeypatch.setattr(document, 'NEW_FILES_BINARY', binary)
+        filename = str(tmpdir.join('enum%d.vrsketch' % binary))
+        make_history(VRSketchFile(filename), 5)
+        with open(filename, 'rb') as f:
+            data = f.read()
+        names = [step[1] for step in document.enum_steps(data)]
+        assert names == ["Initial rectangle"] + ["Step %d" % i for i in range(5)]
+
+def geometry_key(model):
+    # like model_key(), but without the ids
+    edges = sorted(tuple(e.v1.tolist() + e.v2.tolist()) for e in model.all_edges())
+    faces = sorted((tuple(sorted(tuple(e.v1.tolist() + e.v2.tolist()) for e in f.edges)),
+                    f.physics.color) for f in model.all_faces())
+    return edges, faces
+
+def test_compact_history(tmpdir, monkeypatch):
+    monkeypatch.setattr(document, 'SNAPSHOT_EVERY_STEPS', 4)
+    for binary in [False, True]:
+        monkeypatch.setattr(document, 'NEW_FILES_BINARY', binary)
+        source = str(tmpdir.join('long%d.vrsketch' % binary))
+        doc = VRSketchFile(source)
+        make_history(doc, 10)
+        geometries = []
+        for i in range(3):
+            geometries.append(geometry_key(doc.model))
+            doc.undo_once(FakeApp())
+        for i in range(3):
+            doc.redo_once(FakeApp())
+        doc.wait_for_writes()
+        for keep_steps, target_binary in [(0, None), (2, None), (20, not binary)]:
+            target = str(tmpdir.join('compact%d_%d.vrsketch' % (binary, keep_steps)))
+            num_steps = document.compact_history(source, target, keep_steps, target_binary)
+            compacted = VRSketchFile(target)
+            assert compacted.binary == (binary if target_binary is None else target_binary)
+            names = [s.name for s in compacted.undoable_actions]
+            assert len(names) == num_steps
+            if keep_steps == 20:
+                assert names == ["Initial rectangle"] + ["Step %d" % i for i in range(10)]
+            else:
+                assert names == ["Compacted"] + ["Step %d" % i for i in range(10 - keep_steps, 10)]
+            # the ids are dense
+            model = compacted.model
+            assert geometry_key(model) == geometries[0]
+            eids = sorted(e.eid for e in model.all_edges())
+            assert eids[-1] <= len(eids) + 2 * keep_steps
+            if keep_steps == 0:
+                assert eids == range(1, len(eids) + 1)
+                assert [f.fid for f in model.all_faces()] == []
+                assert sorted(g.gid for g in model.group_edges if g.parent) == [1]
+                assert os.path.getsize(target) < os.path.getsize(source) / 3
+            for i in range(min(keep_steps, 2)):
+                compacted.undo_once(FakeApp())
+                assert geometry_key(compacted.model) == geometries[i + 1]
+
+def test_compact_history_check(tmpdir, monkeypatch):
+    source = str(tmpdir.join('check.vrsketch'))
+    make_history(VRSketchFile(source), 3)
+    def bad_write_model_step(f, model_step, binary=False):
+        model_step.fe_add = model_step.fe_add[1:]
+        write_model_step(f, model_step, binary)
+    write_model_step = document.write_model_step
+    monkeypatch.setattr(document, 'write_model_step', bad_write_model_step)
+    target = str(tmpdir.join('bad.vrsketch'))
+    import pytest
+    with pytest.raises(ValueError):
+        document.compact_history(source, target)
+    assert not os.path.exists(target)
+
+def test_writer_thread(tmpdir, monkeypatch):
+    monkeypatch.setattr(document, 'WRITER_QUEUE_SIZE', 2)
+    monkeypatch.setattr(document, 'SNAPSHOT_EVERY_STEPS', 5)
+    for flush, fsync in [('idle', False), ('always', True)]:
+        monkeypatch.setattr(document, 'WRITER_FLUSH', flush)
+        monkeypatch.setattr(document, 'WRITER_FSYNC', fsync)
+        filename = str(tmpdir.join('writer_%s.vrsketch' % flush))
+        doc = VRSketchFile(filename)
+        steps = []
+        for i in range(12):
+            step = ModelStep(doc.model, "Line %d" % i)
+            step.add_edge(doc.model.root_group, Vector3(i, 0, 0), Vector3(i, 2, 0))
+            step._apply_to_model()
+            doc.record_undoable_action(step)
+            steps.append(step)
+        assert doc.writes_queued() <= 3
+        # undo waits for the steps to be written before truncating the file
+        doc.undo_once(FakeApp())
+        assert doc.writes_queued() == 0
+        assert [s.file_position for s in steps[:11]] == sorted(s.file_position for s in steps[:11])
+        assert os.path.getsize(filename) == steps[11].file_position
+        assert len(doc.snapshots) == 2     # after "Line 3" and "Line 8"
+        assert model_key(VRSketchFile(filename).model) == model_key(doc.model)
+        doc.close()
+        assert doc.writes_queued() == 0
+
+def test_writer_error(tmpdir, monkeypatch):
+    filename = str(tmpdir.join('error.vrsketch'))
+    doc = VRSketchFile(filename)
+    doc.wait_for_writes()
+    def failing_write(*args, **kwds):
+        raise IOError("disk full")
+    monkeypatch.setattr(document, '_write_captured', failing_write)
+    step = ModelStep(doc.model, "Line")
+    step.add_edge(doc.model.root_group, Vector3(0, 0, 0), Vector3(0, 2, 0))
+    step._apply_to_model()
+    doc.record_undoable_action(step)
+    import pytest
+    with pytest.raises(IOError):
+        doc.wait_for_writes()
+    assert step.file_position is None
+    doc.wait_for_writes()     # the error is only reported once
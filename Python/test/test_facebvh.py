@@ -0,0 +1,96 @@
+import random
+from util import Vector3, EPSILON
+from facebvh import FaceBVH, EdgeBVH
+from model import Group, Edge
+
+
+class FakeEdge(object):
+    def __init__(self, v1):
+        self.v1 = v1
+
+    def coords(self):
+        v1 = self.v1
+        return (v1.x, v1.y, v1.z), None
+
+class FakeFace(object):
+    def __init__(self, vertices):
+        self.edges = [FakeEdge(v) for v in vertices]
+
+def random_face():
+    x = random.uniform(0, 10)
+    y = random.uniform(0, 10)
+    z = random.uniform(0, 3)
+    return FakeFace([Vector3(x, y, z), Vector3(x + random.uniform(0, 1), y, z),
+                     Vector3(x, y + random.uniform(0, 1), z + random.uniform(0, 0.5))])
+
+def brute_force(faces, position, margin):
+    result = []
+    for face in faces:
+        vs = [e.v1 for e in face.edges]
+        if (min(v.x for v in vs) - margin <= position.x <= max(v.x for v in vs) + margin and
+            min(v.y for v in vs) - margin <= position.y <= max(v.y for v in vs) + margin and
+            min(v.z for v in vs) - margin <= position.z <= max(v.z for v in vs) + margin):
+            result.append(face)
+    return result
+
+def check(bvh, faces):
+    assert len(bvh) == len(faces)
+    for i in range(50):
+        position = Vector3(random.uniform(-1, 11), random.uniform(-1, 11), random.uniform(-1, 4))
+        for margin in [0.0, 0.1, 0.5]:
+            assert bvh.query(position, margin) == brute_force(faces, position, margin)
+
+def test_empty():
+    bvh = FaceBVH()
+    assert bvh.query(Vector3(0, 0, 0), 1.0) == []
+    face = random_face()
+    bvh.insert(face)
+    bvh.remove(face)
+    assert bvh.query(Vector3(0, 0, 0), 100.0) == []
+
+def test_build_and_query():
+    random.seed(42)
+    faces = [random_face() for i in range(200)]
+    check(FaceBVH(faces), faces)
+
+def test_incremental():
+    random.seed(43)
+    faces = [random_face() for i in range(100)]
+    bvh = FaceBVH(faces)
+    for i in range(300):
+        if faces and random.random() < 0.45:
+            face = faces.pop(random.randrange(len(faces)))
+            bvh.remove(face)
+        else:
+            face = random_face()
+            faces.append(face)
+            bvh.insert(face)
+        if i % 50 == 0:
+            check(bvh, faces)
+    check(bvh, faces)
+
+
+def test_edge_bvh_finds_all_intersections():
+    random.seed(44)
+    group = Group(None)
+    edges = []
+    for i in range(100):
+        v1 = Vector3(random.uniform(0, 1), random.uniform(0, 1), 0)
+        length = random.choice([1e-3, 0.01, 0.1, 1.0])
+        v2 = v1 + Vector3(random.uniform(-1, 1), random.uniform(-1, 1), 0).normalized() * length
+        edges.append(Edge(group, v1, v2))
+        # a short edge that touches the end of the previous one, within the
+        # tolerance of intersect_edge() but outside its bounding box
+        d = (v2 - v1).normalized()
+        tip = v2 + d * (EPSILON * 0.9 / length)
+        side = Vector3(-d.y, d.x, 0)
+        edges.append(Edge(group, tip - side * 1e-3, tip + side * 1e-3))
+    bvh = EdgeBVH(edges)
+    found = 0
+    for edge in edges:
+        candidates = bvh.query_edge(edge)
+        for other in edges:
+            if other is not edge and edge.intersect_edge(other) is not None:
+                assert other in candidates
+                found += 1
+    assert found > 100
@@ -0,0 +1,88 @@
+import random
+import geom
+from util import Vector3, EPSILON
+from bench.bench_geom import (old_eq, old_between, old_measure_distance,
+                              old_point_on_segment, old_intersect_edge,
+                              old_point_in_polygon)
+
+
+def t(v):
+    return (v.x, v.y, v.z)
+
+def random_point(scale=1.0):
+    return Vector3(random.uniform(0, scale), random.uniform(0, scale), random.uniform(0, scale))
+
+def nearby(v, distance):
+    return v + random_point().normalized() * distance
+
+
+def test_equal():
+    random.seed(1)
+    for i in range(500):
+        a = random_point()
+        b = nearby(a, random.choice([0.5, 2.0]) * EPSILON)
+        assert geom.equal(t(a), t(b)) == old_eq(a, b) == (a == b)
+        assert (a != b) == (not old_eq(a, b))
+
+def test_measure_distance_and_point_on_segment():
+    random.seed(2)
+    for i in range(500):
+        a, b, p = random_point(), random_point(), random_point()
+        if i % 3 == 0:
+            p = nearby(a + (b - a) * random.uniform(-0.1, 1.1), EPSILON * 0.5)
+        frac1, dist1 = geom.measure_distance(t(a), t(b), t(p))
+        frac2, dist2 = old_measure_distance(a, b, p)
+        assert abs(frac1 - frac2) < 1e-12
+        assert abs(dist1 - dist2) < 1e-12
+        assert geom.point_on_segment(t(a), t(b), t(p)) == old_point_on_segment(a, b, p)
+        assert geom.between(t(p), t(a), t(b)) == old_between(p, a, b)
+
+def test_intersect_segments():
+    random.seed(3)
+    found = 0
+    for i in range(2000):
+        a1, a2, b1, b2 = random_point(), random_point(), random_point(), random_point()
+        kind = i % 5
+        if kind == 1:
+            # coplanar
+            b2 = a1 + (a2 - a1) * random.uniform(-0.5, 1.5) + (b1 - a1) * random.uniform(-2, 0.5)
+        elif kind == 2:
+            # touching at a vertex
+            b1 = nearby(a2, EPSILON * 0.5)
+        elif kind == 3:
+            # colinear
+            b1 = a1 + (a2 - a1) * 0.3
+            b2 = a1 + (a2 - a1) * 1.3
+        elif kind == 4:
+            # one of the segments is very short
+            b2 = nearby(b1, EPSILON * random.uniform(0, 2))
+            b1 = b1 * 0.5 + (a1 + (a2 - a1) * 0.5) * 0.5
+        p1 = geom.intersect_segments(t(a1), t(a2), t(b1), t(b2))
+        p2 = old_intersect_edge(a1, a2, b1, b2)
+        if p2 is None:
+            assert p1 is None
+        else:
+            found += 1
+            assert p1 is not None and Vector3(*p1) == p2
+    assert found > 300
+
+def test_point_in_polygon():
+    random.seed(4)
+    polygon = [Vector3(0, 0, 0), Vector3(1, 0, 0), Vector3(1, 1, 0), Vector3(0.5, 0.4, 0),
+               Vector3(0, 1, 0)]
+    u = Vector3(0.6, 0.8, 0)
+    v = Vector3(-0.8, 0.6, 0)
+    for i in range(500):
+        p = Vector3(random.uniform(-0.2, 1.2), random.uniform(-0.2, 1.2), 0)
+        assert (geom.point_in_polygon(t(u), t(v), t(p), [t(q) for q in polygon]) ==
+                old_point_in_polygon(u, v, p, polygon))
+
+def test_vector3_slots():
+    v = Vector3(1, 2, 3)
+    try:
+        v.foo = 5
+    except AttributeError:
+        pass
+    else:
+        raise AssertionError("Vector3 should have __slots__")
+    assert v.withcoord('y', 5) == Vector3(1, 5, 3)
@@ -0,0 +1,77 @@
+import indexalloc
+from indexalloc import IndexAllocator
+
+
+class WO(object):
+    def __init__(self, kind):
+        self._kind = kind
+        self._index = None
+
+def allocate(alloc, wo):
+    wo._index = alloc.allocate(wo)
+    return wo._index
+
+def test_allocate_and_reuse(monkeypatch):
+    monkeypatch.setattr(indexalloc, 'CROSS_KIND_REUSE', True)
+    alloc = IndexAllocator()
+    wos = [WO(251) for i in range(4)] + [WO(101)]
+    assert [allocate(alloc, wo) for wo in wos] == [0, 1, 2, 3, 4]
+    # freed in this frame: reused by the same kind first
+    alloc.release(1, 251)
+    alloc.release(4, 101)
+    assert allocate(alloc, WO(101)) == 4
+    assert allocate(alloc, WO(253)) == 1      # another kind
+    assert alloc.take_removes() == []
+    # the indexes not reused are removed, and reused lowest first later
+    alloc.release(0, 251)
+    alloc.release(2, 251)
+    assert sorted(alloc.take_removes()) == [0, 2]
+    assert allocate(alloc, WO(250)) == 0
+    assert allocate(alloc, WO(250)) == 2
+    assert allocate(alloc, WO(250)) == 5
+    stats = alloc.stats()
+    assert stats["index_top"] == stats["index_high_water"] == 6
+    assert stats["index_live"] == 6
+    assert stats["index_reused_same_kind"] == 1
+    assert stats["index_reused_other_kind"] == 1
+    assert stats["index_reused_free"] == 2
+
+def test_no_cross_kind_reuse(monkeypatch):
+    monkeypatch.setattr(indexalloc, 'CROSS_KIND_REUSE', False)
+    alloc = IndexAllocator()
+    allocate(alloc, WO(251))
+    alloc.release(0, 251)
+    assert allocate(alloc, WO(253)) == 1
+    assert alloc.take_removes() == [0]
+
+def test_top_shrinks():
+    alloc = IndexAllocator()
+    for i in range(5):
+        allocate(alloc, WO(251))
+    for index in [4, 3, 1]:
+        alloc.release(index, 251)
+    alloc.take_removes()
+    assert alloc.top == 3
+    assert alloc.free == set([1])
+    assert alloc.high_water == 5
+
+def test_compact(monkeypatch):
+    monkeypatch.setattr(indexalloc, 'COMPACT_MIN_FREE', 2)
+    monkeypatch.setattr(indexalloc, 'COMPACT_MAX_MOVES', 2)
+    alloc = IndexAllocator()
+    wos = [WO(251) for i in range(10)]
+    for wo in wos:
+        allocate(alloc, wo)
+    for wo in wos[:6]:
+        alloc.release(wo._index, 251)
+    alloc.take_removes()
+    assert alloc.compact() == [wos[9], wos[8]]
+    assert (wos[9]._index, wos[8]._index) == (0, 1)
+    assert sorted(alloc.take_removes()) == [8, 9]
+    assert alloc.top == 8
+    assert alloc.compact() == [wos[7], wos[6]]
+    alloc.take_removes()
+    assert alloc.top == 4
+    assert alloc.compact() == []
+    assert sorted(alloc.owners) == [0, 1, 2, 3]
+    assert alloc.stats()["index_compacted"] == 4
@@ -0,0 +1,51 @@
+import lod
+from util import Vector3
+from bench import scenes
+
+
+def test_choose_level():
+    assert lod.choose_level(0.0) == lod.LOD_FULL
+    assert lod.choose_level(lod.FULL_DISTANCE * 1.05) == lod.LOD_HULL
+    assert lod.choose_level(lod.HULL_DISTANCE * 1.05) == lod.LOD_BOX
+    # hysteresis: a group stays at its current level a bit past the threshold
+    d = lod.FULL_DISTANCE * 1.05
+    assert lod.choose_level(d, lod.LOD_FULL) == lod.LOD_FULL
+    assert lod.choose_level(d, lod.LOD_HULL) == lod.LOD_HULL
+    d = lod.FULL_DISTANCE * 0.95
+    assert lod.choose_level(d, lod.LOD_HULL) == lod.LOD_HULL
+    assert lod.choose_level(d, lod.LOD_BOX) == lod.LOD_HULL
+    assert lod.choose_level(d * 0.5, lod.LOD_BOX) == lod.LOD_FULL
+    d = lod.HULL_DISTANCE * 1.05
+    assert lod.choose_level(d, lod.LOD_HULL) == lod.LOD_HULL
+    assert lod.choose_level(d, lod.LOD_FULL) == lod.LOD_HULL
+    assert lod.choose_level(d * 2, lod.LOD_FULL) == lod.LOD_BOX
+
+def test_box_distance():
+    box = (Vector3(0, 0, 0), Vector3(1, 2, 3))
+    assert lod.box_distance(Vector3(0.5, 0.5, 0.5), box) == 0.0
+    assert lod.box_distance(Vector3(4, 1, 1), box) == 3.0
+    assert abs(lod.box_distance(Vector3(-3, 6, 1), box) - 5.0) < 1e-9
+
+def test_box_geometry():
+    faces, edges = lod.box_geometry((Vector3(0, 0, 0), Vector3(1, 2, 3)))
+    assert len(faces) == 6
+    assert len(edges) == 12
+    for v1, v2 in edges:
+        assert abs(v2 - v1) in (1.0, 2.0, 3.0)
+    corners = set()
+    for face in faces:
+        assert len(face) == 4
+        corners.update(v.tolist().__repr__() for v in face)
+    assert len(corners) == 8
+
+def test_hull_faces():
+    model, _ = scenes.make_model(scenes.coplanar_faces, 4, 0.5)
+    hull = lod.hull_faces(model.all_faces())
+    assert len(hull) == 1
+    assert sorted((v.x, v.y, v.z) for v in hull[0]) == [
+        (0.0, 0.0, 0.0), (0.0, 2.0, 0.0), (2.0, 0.0, 0.0), (2.0, 2.0, 0.0)]
+    model, _ = scenes.make_model(scenes.box_grid, 1)
+    hull = lod.hull_faces(model.all_faces())
+    assert len(hull) == 6
+    for polygon in hull:
+        assert len(polygon) == 4
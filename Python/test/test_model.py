@@ -4,17 +4,6 @@ from util import *
 from model import *
 
 
-def fake_approx_plane(lst):
-    assert len(lst) >= 3
-    for z in lst[2 : len(lst) : 3]:
-        assert z == 1.0, "missing approx_plane: %r" % (lst,)
-    return (0., 0., 1., -1.)
-
-def setup_module(mod):
-    import util
-    util._approx_plane = fake_approx_plane
-
-
 def test_initial_rectangle():
     model = Model()
     v1 = Vector3(0, 0, 1)
@@ -167,3 +156,118 @@ def test_consolidate_subdivide_edges_and_faces():
     assert len([fe for fe in step.fe_remove if isinstance(fe, Edge)]) == 2
     assert len([fe for fe in step.fe_add if isinstance(fe, Face)]) == 2
     assert len([fe for fe in step.fe_add if isinstance(fe, Edge)]) == 6
+
+def test_shared_vertices():
+    model = test_initial_rectangle()
+    gr = model.root_group
+    assert len(gr.vertices) == 4
+    assert len(model.all_vertices(gr)) == 12
+    e1 = model.get_edges(gr)[0]
+    assert e1._i1 is not None
+    assert e1._i2 == model.get_edges(gr)[1]._i1
+    assert e1.v1 == Vector3(0, 0, 1)
+    vmin, vmax = model.get_bounding_box(gr)
+    assert vmin == Vector3(0, 0, 1)
+    assert vmax == Vector3(1, 1, 1)
+
+def test_remove_edges_detach_vertices():
+    model = test_initial_rectangle()
+    gr = model.root_group
+    e1, e2, e3, e4 = model.get_edges(gr)
+    step = ModelStep(model, "Remove")
+    step.remove(model.get_faces(gr)[0])
+    step.remove(e1)
+    step._apply_to_model()
+    assert e1._i1 is None
+    assert e1.v1 == Vector3(0, 0, 1)
+    assert e1.v2 == Vector3(1, 0, 1)
+    assert len(gr.vertices) == 4
+    step = ModelStep(model, "Remove more")
+    step.remove(e2)
+    step._apply_to_model()
+    assert len(gr.vertices) == 3
+    assert sorted(model.all_vertices(gr).tolist()) == [0, 0, 0, 1, 1, 1, 1, 1, 1]
+    assert e3.v1 == Vector3(1, 1, 1)
+    assert e4.v2 == Vector3(0, 0, 1)
+    #
+    step.reversed()._apply_to_model()
+    assert len(gr.vertices) == 4
+    assert e2.v1 == Vector3(1, 0, 1)
+
+def test_caches_of_unchanged_groups_are_kept():
+    import model as model_mod
+    model = test_initial_rectangle()
+    gr = model.root_group
+    sub = Group(gr)
+    step = ModelStep(model, "Subgroup")
+    step.add_edge(sub, Vector3(0, 0, 1), Vector3(0, 0, 2))
+    step._apply_to_model()
+    model.get_bounding_box(gr)
+    model.get_bounding_box(sub)
+    assert model.get_subgroups(gr) == set([gr, sub])
+    model_mod.reset_cache_stats()
+    #
+    step = ModelStep(model, "Change only the subgroup")
+    step.add_edge(sub, Vector3(0, 0, 2), Vector3(0, 5, 2))
+    step._apply_to_model()
+    assert 'bounding_box' in gr.caches
+    assert 'subgroups' not in gr.caches     # 'gr' is an ancestor of 'sub'
+    # the bounding box of 'sub' was grown, not recomputed
+    assert model.get_bounding_box(sub) == (Vector3(0, 0, 1), Vector3(0, 5, 2))
+    assert model.get_bounding_box(gr) == (Vector3(0, 0, 1), Vector3(1, 1, 1))
+    assert model_mod.cache_stats['bounding_box'] == [2, 0]
+
+def test_bounding_box_after_remove():
+    model = test_initial_rectangle()
+    gr = model.root_group
+    e1, e2, e3, e4 = model.get_edges(gr)
+    step = ModelStep(model, "Inner edge")
+    step.add_edge(gr, Vector3(0, 0, 1), Vector3(0, 0, 2))
+    inner = step.add_edge(gr, Vector3(0.2, 0.2, 1.5), Vector3(0.5, 0.5, 1.5))
+    step._apply_to_model()
+    assert model.get_bounding_box(gr) == (Vector3(0, 0, 1), Vector3(1, 1, 2))
+    step = ModelStep(model, "Remove inner edge")
+    step.remove(inner)
+    step._apply_to_model()
+    assert 'bounding_box' in gr.caches
+    step = ModelStep(model, "Remove border")
+    step.remove(model.get_faces(gr)[0])
+    step.remove(e1)
+    step.remove(e2)
+    step.remove(e3)
+    step._apply_to_model()
+    assert 'bounding_box' not in gr.caches
+    assert model.get_bounding_box(gr) == (Vector3(0, 0, 1), Vector3(0, 1, 2))
+
+def test_vertex_edge_index():
+    gr = Group(None)
+    near = Vector3(1 + EPSILON * 0.5, 0, 1)
+    e1 = Edge(gr, Vector3(0, 0, 1), Vector3(1, 0, 1))
+    e2 = Edge(gr, near, Vector3(1, 1, 1))
+    e3 = Edge(gr, Vector3(2, 2, 1), Vector3(1, 1, 1))
+    index = VertexEdgeIndex([e1, e2, e3])
+    assert len(index) == 3
+    assert index.edges_at(Vector3(1, 0, 1)) == [e1, e2]
+    assert index.edges_at(Vector3(1, 1, 1)) == [e2, e3]
+    assert index.edges_at(Vector3(0, 0, 1)) == [e1]
+    assert index.edges_at(Vector3(5, 5, 5)) == []
+    index.remove_edge(e1)
+    assert index.edges_at(Vector3(1, 0, 1)) == [e2]
+    assert index.edges_at(Vector3(0, 0, 1)) == []
+
+def test_consolidate_subdivide_face_long_branch():
+    # a zig-zag of new edges splitting the rectangle in two: the walk
+    # along the branch uses the edges added so far in the same step
+    model = test_initial_rectangle()
+    gr = model.root_group
+    points = [Vector3(0, 0.5, 1)]
+    for i in range(1, 10):
+        points.append(Vector3(i * 0.1, 0.4 if i % 2 else 0.6, 1))
+    points.append(Vector3(1, 0.5, 1))
+    step = ModelStep(model, "Zig-zag")
+    for i in range(len(points) - 1):
+        step.add_edge(gr, points[i], points[i + 1])
+    step.consolidate(None)
+    faces = [fe for fe in step.fe_add if isinstance(fe, Face)]
+    assert len(faces) == 2
+    assert sorted([len(face.edges) for face in faces]) == [13, 13]
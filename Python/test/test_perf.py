@@ -0,0 +1,30 @@
+import perf
+
+
+def test_counters():
+    perf.reset()
+    perf.count("a")
+    perf.count("a", 4)
+    with perf.timed("b"):
+        pass
+    with perf.timed("b"):
+        pass
+    assert perf.counters["a"] == 5
+    assert perf.counters["b"] == 2
+    assert perf.counters["b_ms"] >= 0.0
+    perf.reset()
+    assert perf.counters == {}
+
+def test_timed_function():
+    @perf.timed_function("double")
+    def double(x):
+        """Doubles."""
+        return x * 2
+    perf.reset()
+    assert double(21) == 42
+    assert double(1) == 2
+    assert perf.counters["double"] == 2
+    assert double.__name__ == "double" and double.__doc__ == "Doubles."
+
+def test_format_counters():
+    assert perf.format_counters({"b": 2, "a_ms": 1.25}) == "a_ms 1.2\nb 2"
@@ -0,0 +1,87 @@
+import math
+import random
+import planefit
+from planefit import fit_plane, fit_planes
+from util import Vector3, Plane, EPSILON
+
+
+def polygon(center, normal, count, noise=0.0):
+    # 'count' points in CCW order around 'normal'
+    normal = normal.normalized()
+    if abs(normal.x) < 0.9:
+        u = normal.cross(Vector3(1, 0, 0)).normalized()
+    else:
+        u = normal.cross(Vector3(0, 1, 0)).normalized()
+    v = normal.cross(u)
+    result = []
+    for i in range(count):
+        angle = 2 * math.pi * i / count
+        r = random.uniform(0.5, 2.0)
+        p = center + u * (r * math.cos(angle)) + v * (r * math.sin(angle))
+        p = p + normal * random.uniform(-noise, noise)
+        result += p.tolist()
+    return result
+
+def random_normal():
+    while True:
+        n = Vector3(random.uniform(-1, 1), random.uniform(-1, 1), random.uniform(-1, 1))
+        if 0.1 < abs(n) <= 1:
+            return n.normalized()
+
+def check_plane(result, normal, coords):
+    n = Vector3(*result[:3])
+    assert abs(abs(n) - 1.0) < 1e-9
+    assert n == normal
+    for i in range(0, len(coords), 3):
+        assert abs(n.dot(Vector3(*coords[i:i + 3])) + result[3]) < 1e-9
+
+
+def test_fit_plane_exact():
+    random.seed(42)
+    for i in range(200):
+        normal = random_normal()
+        center = Vector3(random.uniform(-5, 5), random.uniform(-5, 5), random.uniform(-5, 5))
+        coords = polygon(center, normal, random.randrange(3, 9))
+        check_plane(fit_plane(coords), normal, coords)
+
+def test_fit_plane_axis_aligned():
+    coords = [0, 0, 1, 1, 0, 1, 1, 1, 1, 0, 1, 1]
+    assert fit_plane(coords) == (0.0, 0.0, 1.0, -1.0)
+    coords = [0, 1, 1, 1, 1, 1, 1, 0, 1, 0, 0, 1]
+    assert fit_plane(coords) == (0.0, 0.0, -1.0, 1.0)
+
+def test_fit_plane_least_squares():
+    # the 4 points are not coplanar: the best plane is in the middle
+    coords = [0, 0, 0.1, 1, 0, -0.1, 1, 1, 0.1, 0, 1, -0.1]
+    nx, ny, nz, d = fit_plane(coords)
+    assert Vector3(nx, ny, nz) == Vector3(0, 0, 1)
+    assert abs(d) < EPSILON
+
+def test_fit_plane_degenerate():
+    for coords in [[1, 2, 3], [1, 2, 3, 1, 2, 3], [0, 0, 0, 1, 1, 1, 2, 2, 2]]:
+        nx, ny, nz, d = fit_plane(coords)
+        n = Vector3(nx, ny, nz)
+        assert abs(abs(n) - 1.0) < 1e-9
+        if len(coords) == 9:
+            assert abs(n.dot(Vector3(1, 1, 1))) < 1e-9
+        assert abs(n.dot(Vector3(*coords[:3])) + d) < 1e-9
+
+def test_fit_planes_batch():
+    random.seed(43)
+    coords_list = []
+    for i in range(50):
+        coords_list.append(polygon(Vector3(random.uniform(-5, 5), 0, 0), random_normal(),
+                                   random.randrange(3, 9), noise=0.01))
+    results = fit_planes(coords_list)
+    assert len(results) == 50
+    for result, coords in zip(results, coords_list):
+        expected = fit_plane(coords)
+        for a, b in zip(result, expected):
+            assert abs(a - b) < 1e-9
+
+def test_from_vertices_list():
+    vertices_list = [[Vector3(0, 0, z), Vector3(1, 0, z), Vector3(0, 1, z)]
+                     for z in range(planefit.BATCH_MIN + 2)]
+    planes = Plane.from_vertices_list(vertices_list)
+    for z, plane in enumerate(planes):
+        assert plane == Plane(Vector3(0, 0, 1), -z)
@@ -0,0 +1,134 @@
+import random
+import util
+import batchselect
+import facebvh
+import selection
+from util import Vector3
+from model import Model, ModelStep, Group
+
+
+class FakeApp(object):
+    model_scale = 1.0
+
+    def __init__(self, model):
+        self.model = model
+
+    def scale_ctrl(self, distance):
+        return distance / self.model_scale
+
+
+def make_grid_model(n=6, levels=3):
+    model = Model()
+    step = ModelStep(model, "Grid")
+    groups = [model.root_group, Group(model.root_group)]
+    for k in range(levels):
+        group = groups[k % 2]
+        z = k * 0.1
+        for i in range(n):
+            for j in range(n):
+                v = [Vector3(i * 0.1, j * 0.1, z),
+                     Vector3(i * 0.1 + 0.1, j * 0.1, z),
+                     Vector3(i * 0.1 + 0.1, j * 0.1 + 0.1, z),
+                     Vector3(i * 0.1, j * 0.1 + 0.1, z)]
+                edges = [step.add_edge(group, v[m - 1], v[m]) for m in range(4)]
+                step.add_face(edges)
+    step._apply_to_model()
+    return model
+
+def describe(sel):
+    if sel is None:
+        return None
+    if isinstance(sel, selection.SelectVertex):
+        return ('vertex', sel.position.tolist(), sel.group)
+    if isinstance(sel, selection.SelectAlongEdge):
+        return ('edge', sel.edge, round(sel.fraction, 9))
+    if isinstance(sel, selection.SelectOnFace):
+        return ('face', sel.face, [round(c, 9) for c in sel.position.tolist()])
+    raise AssertionError(sel)
+
+ALL_FINDERS = [selection.find_closest_vertex,
+               selection.find_closest_edge,
+               selection.find_closest_face]
+
+def compare_backends(app, positions, only_groups, backends, finders=ALL_FINDERS):
+    found = set()
+    for only_group in only_groups:
+        for position in positions:
+            for fn in finders:
+                results = []
+                for batch, bvh in backends:
+                    batchselect.ENABLED = batch
+                    facebvh.ENABLED = bvh
+                    try:
+                        results.append(describe(fn(app, position, only_group=only_group)))
+                    finally:
+                        batchselect.ENABLED = ORIGINAL_BATCH
+                        facebvh.ENABLED = True
+                for r in results[1:]:
+                    assert r == results[0]
+                if results[0] is not None:
+                    found.add(results[0][0])
+    return found
+
+ORIGINAL_BATCH = batchselect.ENABLED
+
+def random_positions(count, seed=1234):
+    random.seed(seed)
+    return [Vector3(random.uniform(-0.1, 0.7),
+                    random.uniform(-0.1, 0.7),
+                    random.uniform(-0.05, 0.25)) for i in range(count)]
+
+def test_batch_matches_python_loops():
+    if not batchselect.ENABLED:
+        return
+    app = FakeApp(make_grid_model())
+    found = compare_backends(app, random_positions(150),
+                             [None, app.model.root_group],
+                             [(True, False), (False, False)])
+    assert found == set(['vertex', 'edge', 'face'])
+
+def test_face_bvh_matches_full_scan():
+    app = FakeApp(make_grid_model())
+    finders = [selection.find_closest_face]
+    found = compare_backends(app, random_positions(150, seed=5678),
+                             [None, app.model.root_group],
+                             [(False, True), (False, False)], finders)
+    assert 'face' in found
+    # after some incremental changes
+    model = app.model
+    gr = model.root_group
+    step = ModelStep(model, "Remove some faces")
+    for face in model.get_faces(gr)[::3]:
+        step.remove(face)
+    step._apply_to_model()
+    assert len(model.get_face_bvh(gr)) == len(model.get_faces(gr))
+    compare_backends(app, random_positions(100, seed=91011), [None],
+                     [(False, True), (False, False)], finders)
+    step.reversed()._apply_to_model()
+    assert len(model.get_face_bvh(gr)) == len(model.get_faces(gr))
+    compare_backends(app, random_positions(100, seed=1213), [None],
+                     [(False, True), (False, False)], finders)
+
+def test_ignore():
+    app = FakeApp(make_grid_model(n=2, levels=1))
+    position = Vector3(0.101, 0.1, 0.0)
+    sel = selection.find_closest_vertex(app, position)
+    assert sel.position == Vector3(0.1, 0.1, 0)
+    ignore = util.GeometryDict()
+    ignore[Vector3(0.1, 0.1, 0)] = True
+    assert selection.find_closest_vertex(app, position, ignore=ignore) is None
+    sel = selection.find_closest(app, position, ignore=ignore)
+    assert isinstance(sel, selection.SelectAlongEdge)
+
+def test_closest_in_order():
+    if not batchselect.ENABLED:
+        return
+    import numpy
+    distances = numpy.array([5.0, 0.99, 0.5, 0.497, 0.3, 0.299, 1.0, 0.2])
+    d_min, best = batchselect.closest_in_order(distances, 1.0, lambda i: i != 7)
+    assert best == 5
+    assert abs(d_min - 0.299 * 1.01) < 1e-12
+    # a chain of slowly increasing distances that the 1.01 rule keeps accepting
+    distances = numpy.array([1.0 * 1.009 ** i for i in range(20)]) * 0.99
+    d_min, best = batchselect.closest_in_order(distances, 1.0, lambda i: True)
+    assert best == 19
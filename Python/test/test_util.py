@@ -154,3 +154,89 @@ def test_planedict():
     assert d.get(Plane(Vector3(4, 5, 6.01), 10)) is None
     assert Plane(Vector3(4, 5, 6.01), 10) not in d
     assert sorted(d.keys()) == sorted([p1, p2, p3])
+
+def test_geometrydict_cell_boundary():
+    d = GeometryDict()
+    edge = GeometryDict._CELL_SIZE * 3.5
+    k1 = Vector3(edge - EPSILON * 0.4, 1, 2)
+    d[k1] = 123
+    assert d[Vector3(edge + EPSILON * 0.4, 1, 2)] == 123
+    assert Vector3(edge + EPSILON * 1.1, 1, 2) not in d
+    k2 = Vector3(edge + EPSILON * 0.7, 1, 2)
+    d[k2] = 234
+    assert len(d) == 2
+    assert d[Vector3(edge + EPSILON * 0.5, 1, 2)] in (123, 234)
+    assert d[Vector3(edge - EPSILON, 1, 2)] == 123
+    k3 = Vector3(-edge, -edge + EPSILON * 0.3, edge - EPSILON * 0.3)
+    d[k3] = 345
+    assert d[Vector3(-edge - EPSILON * 0.3, -edge - EPSILON * 0.3, edge + EPSILON * 0.3)] == 345
+    assert d.keys() == [k1, k2, k3]
+    assert list(d) == [k1, k2, k3]
+    assert d.items() == [(k1, 123), (k2, 234), (k3, 345)]
+    assert len(d) == 3
+
+def test_geometrydict_grid():
+    d = GeometryDict()
+    for i in range(20):
+        for j in range(20):
+            d[Vector3(i * 0.1, j * 0.1, 0)] = (i, j)
+    assert len(d) == 400
+    assert max(d._bucket_lengths()) == 1
+    assert d[Vector3(0.7 + EPSILON * 0.5, 1.2, -EPSILON * 0.5)] == (7, 12)
+    assert d.get(Vector3(0.75, 1.2, 0)) is None
+    assert (lambda: 42) not in d
+
+def test_cell_hash():
+    h = CellHash()
+    k1 = Vector3(1, 2, 3)
+    k2 = Vector3(1 + EPSILON * 0.5, 2, 3)
+    h.add(k1, 'a')
+    h.add(k2, 'b')
+    h.add(k1, 'c')
+    assert h.find_values(Vector3(1, 2, 3)) == ['a', 'b', 'c']
+    assert h.find_entry(k2).value == 'a'
+    assert h.find_values(Vector3(1, 2, 4)) == []
+    h.remove(k1, 'a')
+    assert h.find_values(k1) == ['b', 'c']
+    h.remove(k2, 'b')
+    h.remove(k1, 'c')
+    assert h.find_values(k1) == []
+    assert h._bucket_lengths() == []
+
+def test_vertex_pair_dict():
+    d = VertexPairDict()
+    v1, v2, v3 = Vector3(1, 2, 3), Vector3(4, 5, 6), Vector3(7, 8, 9)
+    d[v1, v2] = 'a'
+    assert d.get(v1, v2) == 'a'
+    assert d.get(v2, v1) == 'a'
+    assert d.get(Vector3(4, 5, 6.000000001), Vector3(1, 2, 3)) == 'a'
+    assert (v2, v1) in d
+    assert (v1, v3) not in d
+    assert d.get(v1, v3) is None
+    assert d.setdefault(v3, v1, []) == []
+    d.setdefault(v1, v3, []).append(5)
+    assert d.get(v3, v1) == [5]
+    assert len(d) == 2
+    assert d.pop(v2, v1) == 'a'
+    assert d.pop(v2, v1) is None
+    assert len(d) == 1
+    # the vertices used by no pair are forgotten
+    assert v2 not in d._numbers
+    assert d.pop(v3, Vector3(1, 2, 3.000000001)) == [5]
+    assert len(d._numbers) == 0
+    assert d._uses == {}
+    d[v1, v1] = 'b'
+    assert d.get(v1, v1) == 'b'
+    assert d.pop(v1, v1) == 'b'
+    assert len(d._numbers) == 0
+
+def test_geometrydict_pop():
+    d = GeometryDict()
+    k1, k2 = Vector3(1, 2, 3), Vector3(4, 5, 6)
+    d[k1] = 123
+    d[k2] = 234
+    assert d.pop(Vector3(1, 2, 3.000000001)) == 123
+    assert d.pop(k1) is None
+    assert k1 not in d
+    assert d.keys() == [k2]
+    assert d._bucket_lengths() == [1]
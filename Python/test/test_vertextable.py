@@ -0,0 +1,70 @@
+import math
+from util import Vector3
+from vertextable import *
+
+
+def test_add_and_share():
+    t = VertexTable()
+    i1 = t.add(Vector3(1, 2, 3))
+    i2 = t.add(Vector3(4, 5, 6))
+    i3 = t.add(Vector3(1, 2, 3))
+    assert i1 == i3
+    assert i1 != i2
+    assert len(t) == 2
+    assert t.get(i1) == Vector3(1, 2, 3)
+    assert t.get(i2).exactly_equal(Vector3(4, 5, 6))
+    assert [tuple(v) for v in iter_coords(t.coords())] == [(1, 2, 3), (4, 5, 6)]
+
+def test_release_and_reuse():
+    t = VertexTable()
+    i1 = t.add(Vector3(1, 2, 3))
+    t.add(Vector3(1, 2, 3))
+    i2 = t.add(Vector3(4, 5, 6))
+    t.release(i1)
+    assert len(t) == 2
+    t.release(i1)
+    assert len(t) == 1
+    assert t.needs_compact()
+    i4 = t.add(Vector3(7, 8, 9))
+    assert i4 == i1
+    assert not t.needs_compact()
+    assert sorted(tuple(v) for v in iter_coords(t.coords())) == [(4, 5, 6), (7, 8, 9)]
+
+def test_grow():
+    t = VertexTable()
+    for i in range(100):
+        assert t.add(Vector3(i, -i, 0.5)) == i
+    for i in range(100):
+        assert t.get(i) == Vector3(i, -i, 0.5)
+    assert len(t.coords()) == 300
+
+def test_compact():
+    class FakeEdge(object):
+        pass
+    t = VertexTable()
+    edges = []
+    for i in range(10):
+        e = FakeEdge()
+        e._i1 = t.add(Vector3(i, 0, 0))
+        e._i2 = t.add(Vector3(i + 1, 0, 0))
+        edges.append(e)
+    for e in edges[:5]:
+        t.release(e._i1)
+        t.release(e._i2)
+    del edges[:5]
+    t.compact(edges)
+    assert len(t) == 6
+    assert len(t.coords()) == 18
+    for i, e in enumerate(edges):
+        assert t.get(e._i1) == Vector3(i + 5, 0, 0)
+        assert t.get(e._i2) == Vector3(i + 6, 0, 0)
+
+def test_coords_bounds():
+    coords = concat_coords([])
+    assert len(coords) == 0
+    t = VertexTable()
+    t.add(Vector3(1, 5, -3))
+    t.add(Vector3(-2, 6, 0))
+    vmin, vmax = coords_bounds(concat_coords([t.coords(), t.coords()]))
+    assert vmin == Vector3(-2, 5, -3)
+    assert vmax == Vector3(1, 6, 0)
@@ -0,0 +1,59 @@
+import array
+from util import Vector3
+from worldobj import *
+
+
+class FakeController(object):
+    _index = 3
+
+
+def all_kinds():
+    v1 = Vector3(0.1, 0.2, 0.3)
+    v2 = Vector3(-1.5, 2.0, 1e-3)
+    v3 = Vector3(4.0, 5.0, 6.0)
+    yield Polygon([v1, v2, v3])
+    yield ColoredPolygon([v1, v2, v3], 0x808080)
+    yield ColoredPolygon([v1, v2, v3, v1], 0x808080, 0xFF00FF)
+    yield PolygonHighlight([v1, v2], 0xFFC0FF)
+    yield SelectedPolygon([v1, v2, v3], 0xFFC0FF, 0xFF00FF)
+    yield SmallSphere(v1, 0xFF0000)
+    for cls in [RectanglePointer, CrossPointer, PencilPointer, PushPullPointer]:
+        yield cls(v2)
+        yield cls(v2, FakeController())
+    for cls in [Stem, Cylinder, DashedStem, SelectedStem]:
+        yield cls(v1, v2)
+        yield cls(v1, v2, 0x404040)
+        yield cls(v1, v2, 0x404040, 0xFFFFFF)
+    yield TextHint(v1, v2, "12.5 cm")
+    yield TextHint(v1, v2, u"~ 1.00 m", 1, 7)
+    yield MergedGroup([(0x757575, [v1, v2, v3]), (None, [v3, v2, v1]),
+                       (0x757575, [v1, v3, v2, v1])], [(v1, v2), (v2, v3)], 0x606060)
+    yield MergedGroup([], [], 0x808080)
+
+
+def test_writeraw_matches_getrawdata():
+    for wo in all_kinds():
+        raw = wo.getrawdata()
+        assert wo.rawsize() == len(raw)
+        buf = array.array('f', [-42.0]) * (len(raw) + 4)
+        assert wo.writeraw(buf, 2) == 2 + len(raw)
+        assert buf[:2] == buf[-2:] == array.array('f', [-42.0, -42.0])
+        assert buf[2:-2] == array.array('f', raw)
+
+def test_default_writeraw():
+    class Custom(WorldObject):
+        def getrawdata(self):
+            return [1.0, 2.5, 17]
+    wo = Custom()
+    buf = array.array('f', [0.0]) * 4
+    assert wo.rawsize() == 3
+    assert wo.writeraw(buf, 1) == 4
+    assert list(buf) == [0.0, 1.0, 2.5, 17.0]
+
+def test_merged_group_raw():
+    v1 = Vector3(1, 2, 3)
+    v2 = Vector3(4, 5, 6)
+    wo = MergedGroup([(0x757575, [v1, v2, v1]), (None, [v2, v1, v2])], [(v1, v2)], 0x606060)
+    assert wo.getrawdata() == [2, -1, 1, 3, 4, 5, 6, 1, 2, 3, 4, 5, 6,
+                               0x757575, 1, 3, 1, 2, 3, 4, 5, 6, 1, 2, 3,
+                               0x606060, 1, 1, 2, 3, 4, 5, 6]
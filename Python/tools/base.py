@@ -1,3 +1,5 @@
+import perf
+
 DISTANCE_MOVEMENT_MIN = 0.05
 DISTANCE_MOVEMENT_TIME = 0.4
 
@@ -54,7 +56,8 @@ class BaseTool(object):
 
         self._all_controllers = controllers
         if self._clicking_gen is None:
-            ctrl = self.handle_hover(controllers)
+            with perf.timed("tool_hover"):
+                ctrl = self.handle_hover(controllers)
             self._following(ctrl)
 
         elif self._follow_ctrl not in controllers:
@@ -71,7 +74,8 @@ class BaseTool(object):
                     self._following(self._follow_ctrl)
             else:
                 other_ctrl = self.other_ctrl(self._follow_ctrl, controllers)
-                self.handle_drag(self._follow_ctrl, other_ctrl)
+                with perf.timed("tool_drag"):
+                    self.handle_drag(self._follow_ctrl, other_ctrl)
 
     def _following(self, ctrl):
         if ctrl is not None:
@@ -23,7 +23,7 @@ class Pushpull(BaseTool):
         return None
 
     def handle_cancel(self):
-        self.model_step.reversed().apply(self.app)
+        self.app.cancel_temporary_step(self.model_step)
 
     def handle_accept(self):
         self.handle_cancel()
@@ -1,9 +1,16 @@
 import math
+import planefit
 
 EPSILON = 1e-5
+EPSILON2 = EPSILON * EPSILON
+
+# computes the plane for Plane.from_vertices(); tests may replace it
+_approx_plane = planefit.fit_plane
 
 
 class Vector3(object):
+    __slots__ = ('x', 'y', 'z')
+
     def __init__(self, x, y, z):
         self.x = x
         self.y = y
@@ -57,14 +64,20 @@ class Vector3(object):
             return True
         if not isinstance(other, Vector3):
             return NotImplemented
-        return abs(self - other) < EPSILON
+        dx = self.x - other.x
+        dy = self.y - other.y
+        dz = self.z - other.z
+        return dx * dx + dy * dy + dz * dz < EPSILON2
 
     def __ne__(self, other):
         if self is other:
             return False
         if not isinstance(other, Vector3):
             return NotImplemented
-        return abs(self - other) >= EPSILON
+        dx = self.x - other.x
+        dy = self.y - other.y
+        dz = self.z - other.z
+        return dx * dx + dy * dy + dz * dz >= EPSILON2
 
     def __hash__(self):
         raise TypeError("cannot hash Vector3")
@@ -107,17 +120,18 @@ class Vector3(object):
     def project_on_axis(self, axis):
         return axis * axis.dot(self) / float(axis.dot(axis))
 
-    def _v_hash0(self):
-        # goal: return a number whose integer part is used as hash in GeometryDict.
-        # Two Vector3 at a distance < EPSILON must return a number that is at most 1.0 apart.
-        # The constants use the fact that EPSILON == 1e-5.
-        return self.x * 5e4 + self.y * 4.19812e4 + self.z * 3.8219e4
+    def _v_cell_coords(self):
+        # coordinates used by GeometryDict.  Two Vector3 at a distance < EPSILON
+        # must return coordinates that are all less than EPSILON apart.
+        return (self.x, self.y, self.z)
 
     def between(self, p1, p2):
-        p12 = p2 - p1
-        f = p12.dot(self)
-        g = p12.dot(p1)
-        h = p12.dot(p2)
+        x = p2.x - p1.x
+        y = p2.y - p1.y
+        z = p2.z - p1.z
+        f = x * self.x + y * self.y + z * self.z
+        g = x * p1.x + y * p1.y + z * p1.z
+        h = x * p2.x + y * p2.y + z * p2.z
         if g > h:
             g, h = h, g
         return g - EPSILON < f < h + EPSILON
@@ -135,29 +149,111 @@ class GeometryDictEntry(object):
         self.value = value
 
 
-class GeometryDict(object):
+class CellHash(object):
+    # Grid of cells of side _CELL_SIZE, holding (key, value) entries whose
+    # keys are Vector3 or Plane objects.  Each entry is stored in the cell
+    # that contains the coordinates of its key.  A lookup probes that cell,
+    # and also the neighbour cell along any axis where the coordinate is
+    # closer than EPSILON to the cell boundary.  The cells are centered on
+    # multiples of _CELL_SIZE, so that round coordinates are far from the
+    # boundaries.  Keys that are equal to each other are not merged here:
+    # see GeometryDict for that.
 
-    def __init__(self):
-        self._dict = {}    # {v_hash: [GeometryDictEntry]}
-        # Every key appears at least twice: once with its hash0, once with its hash1.
-        # The goal is that Vector3's that are equal to each other are considered
-        # to be the same key in this GeometryDict.
+    _CELL_SIZE = EPSILON * 8
+    _CELL_SCALE = 1.0 / _CELL_SIZE
+    _CELL_MARGIN = EPSILON * _CELL_SCALE * 1.001
 
-    def _v_hashes(self, v):
-        h = math.floor(v._v_hash0())
-        return [h, h + 1.0]
+    def __init__(self):
+        self._cells = {}     # {cell: [GeometryDictEntry]}
+
+    def _home_cell(self, coords):
+        scale = self._CELL_SCALE
+        return tuple([math.floor(c * scale + 0.5) for c in coords])
+
+    def _probe_cells(self, coords):
+        # returns the list of cells in which to look for 'coords'
+        scale = self._CELL_SCALE
+        low = self._CELL_MARGIN
+        high = 1.0 - low
+        fs = [c * scale + 0.5 for c in coords]
+        home = [math.floor(f) for f in fs]
+        result = [tuple(home)]
+        for axis in range(len(fs)):
+            r = fs[axis] - home[axis]
+            if low <= r <= high:
+                continue
+            i = home[axis] + (-1.0 if r < low else 1.0)
+            for cell in result[:]:
+                result.append(cell[:axis] + (i,) + cell[axis + 1:])
+        return result
+
+    def add(self, key, value):
+        entry = GeometryDictEntry(key, value)
+        cell = self._home_cell(key._v_cell_coords())
+        self._cells.setdefault(cell, []).append(entry)
+        return entry
+
+    def remove(self, key, value):
+        # removes the entries of 'key' whose value is 'value'
+        self._remove_if(key, lambda entry: entry.value is value)
+
+    def remove_entry(self, entry):
+        # removes an entry returned by add()
+        self._remove_if(entry.key, lambda e: e is entry)
+
+    def _remove_if(self, key, condition):
+        cell = self._home_cell(key._v_cell_coords())
+        lst = [entry for entry in self._cells.get(cell, ()) if not condition(entry)]
+        if lst:
+            self._cells[cell] = lst
+        else:
+            self._cells.pop(cell, None)
 
-    def _find_entry(self, v):
-        if not hasattr(v, '_v_hash0'):
+    def find_entry(self, v):
+        # returns the first entry whose key is equal to 'v', or None
+        get_coords = getattr(v, '_v_cell_coords', None)
+        if get_coords is None:
             return None
-        for h in self._v_hashes(v):
-            lst = self._dict.get(h)
+        cells = self._cells
+        for cell in self._probe_cells(get_coords()):
+            lst = cells.get(cell)
             if lst:
                 for entry in lst:
                     if entry.key == v:
                         return entry
         return None
 
+    def find_values(self, v):
+        # returns the values of all the entries whose key is equal to 'v'
+        result = []
+        cells = self._cells
+        for cell in self._probe_cells(v._v_cell_coords()):
+            lst = cells.get(cell)
+            if lst:
+                for entry in lst:
+                    if entry.key == v:
+                        result.append(entry.value)
+        return result
+
+    def _bucket_lengths(self):
+        # for benchmarks: the length of every non-empty cell
+        return [len(lst) for lst in self._cells.values()]
+
+
+class GeometryDict(object):
+    # Dictionary whose keys are Vector3 or Plane objects.  Keys that are equal
+    # to each other (i.e. less than EPSILON apart) are considered to be the
+    # same key.  The entries are stored in a CellHash.
+
+    _CELL_SIZE = CellHash._CELL_SIZE
+
+    def __init__(self):
+        self._grid = CellHash()
+        self._entries = []   # [GeometryDictEntry], in insertion order
+
+    def _find_entry(self, v):
+        return self._grid.find_entry(v)
+
     def __contains__(self, v):
         return self._find_entry(v) is not None
 
@@ -168,10 +264,7 @@ class GeometryDict(object):
         return n.value
 
     def _add_entry(self, key, value):
-        n = GeometryDictEntry(key, value)
-        for h in self._v_hashes(key):
-            lst = self._dict.setdefault(h, [])
-            lst.append(n)
+        self._entries.append(self._grid.add(key, value))
 
     def __setitem__(self, v, value):
         n = self._find_entry(v)
@@ -193,24 +286,102 @@ class GeometryDict(object):
             return default
         return n.value
 
-    def _entries_set(self):
-        seen = set()
-        for lst in self._dict.values():
-            seen.update(lst)
-        return seen
+    def pop(self, v, default=None):
+        # NB. this is linear in the number of keys
+        n = self._find_entry(v)
+        if n is None:
+            return default
+        self._grid.remove_entry(n)
+        self._entries.remove(n)
+        return n.value
 
     def keys(self):
-        return [n.key for n in self._entries_set()]
+        return [n.key for n in self._entries]
 
     def items(self):
-        return [(n.key, n.value) for n in self._entries_set()]
+        return [(n.key, n.value) for n in self._entries]
 
     def __iter__(self):
-        for n in self._entries_set():
+        for n in self._entries:
             yield n.key
 
     def __len__(self):
-        return len(self._entries_set())
+        return len(self._entries)
+
+    def _bucket_lengths(self):
+        # for benchmarks: the length of every non-empty cell
+        return self._grid._bucket_lengths()
+
+
+class VertexPairDict(object):
+    # Dictionary whose keys are undirected pairs of vertices: (v1, v2) is
+    # the same key as (v2, v1), and the vertices are compared like with
+    # Vector3.__eq__().  Every vertex gets a number from a GeometryDict, and
+    # the pairs are stored as the two numbers, smallest first.  A vertex
+    # loses its number when the last pair using it is removed.
+
+    def __init__(self):
+        self._numbers = GeometryDict()
+        self._uses = {}          # {number: number of pairs using it}
+        self._next_number = 0
+        self._pairs = {}
+
+    def _number(self, v):
+        n = self._numbers.get(v)
+        if n is None:
+            n = self._numbers[v] = self._next_number
+            self._next_number += 1
+        return n
+
+    def _key(self, v1, v2, add=False):
+        if add:
+            n1 = self._number(v1)
+            n2 = self._number(v2)
+        else:
+            numbers = self._numbers
+            n1 = numbers.get(v1)
+            n2 = numbers.get(v2)
+            if n1 is None or n2 is None:
+                return None
+        return (n1, n2) if n1 <= n2 else (n2, n1)
+
+    def _add_key(self, v1, v2):
+        key = self._key(v1, v2, add=True)
+        if key not in self._pairs:
+            for n in key:
+                self._uses[n] = self._uses.get(n, 0) + 1
+        return key
+
+    def get(self, v1, v2, default=None):
+        return self._pairs.get(self._key(v1, v2), default)
+
+    def __contains__(self, key):
+        v1, v2 = key
+        return self._key(v1, v2) in self._pairs
+
+    def __setitem__(self, key, value):
+        v1, v2 = key
+        self._pairs[self._add_key(v1, v2)] = value
+
+    def setdefault(self, v1, v2, default=None):
+        return self._pairs.setdefault(self._add_key(v1, v2), default)
+
+    def pop(self, v1, v2, default=None):
+        key = self._key(v1, v2)
+        if key not in self._pairs:
+            return default
+        value = self._pairs.pop(key)
+        for v in (v1, v2):
+            n = self._numbers.get(v)
+            if self._uses[n] > 1:
+                self._uses[n] -= 1
+            else:
+                del self._uses[n]
+                self._numbers.pop(v)
+        return value
+
+    def __len__(self):
+        return len(self._pairs)
 
 
 class AffineSubspace(object):
@@ -267,7 +438,7 @@ class Plane(AffineSubspace):
 
     @staticmethod
     def from_vertices(vertices):
-        # _approx_plane() is injected in this module's globals by app.initialize_functions()
+        # least-squares fit of the vertices, see planefit.py
         lst = []
         for v in vertices:
             lst += v.tolist()
@@ -277,6 +448,23 @@ class Plane(AffineSubspace):
         #    assert plane.distance_to_point(v) <= EPSILON
         return plane
 
+    @staticmethod
+    def from_vertices_list(vertices_list):
+        # same as [Plane.from_vertices(vertices) for vertices in vertices_list],
+        # but fitting all the planes in one batch
+        coords_list = []
+        for vertices in vertices_list:
+            lst = []
+            for v in vertices:
+                lst += v.tolist()
+            coords_list.append(lst)
+        if _approx_plane is planefit.fit_plane:
+            results = planefit.fit_planes(coords_list)
+        else:
+            results = [_approx_plane(lst) for lst in coords_list]
+        return [Plane(Vector3(result[0], result[1], result[2]), result[3])
+                for result in results]
+
     @staticmethod
     def from_point_and_normal(from_point, normal):
         return Plane(normal, -normal.dot(from_point))
@@ -334,8 +522,8 @@ class Plane(AffineSubspace):
     def __hash__(self):
         raise TypeError("cannot hash Plane")
 
-    def _v_hash0(self):
-        return self.normal._v_hash0() + self.distance * 2.9601e4
+    def _v_cell_coords(self):
+        return (self.normal.x, self.normal.y, self.normal.z, self.distance)
 
 
 class Line(AffineSubspace):
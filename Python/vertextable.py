@@ -0,0 +1,156 @@
+import array
+from util import Vector3
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class VertexTable(object):
+    """Per-group table of vertex coordinates.
+
+    The edges that are currently in the Model don't keep their own Vector3
+    objects; they store indexes into the VertexTable of their group instead.
+    The coordinates are stored in one contiguous float64 array, three
+    floats per vertex: a numpy array if numpy is available, or else an
+    array.array('d').  A vertex shared by several edges is stored once.
+    """
+
+    def __init__(self):
+        self._index = {}       # {(x, y, z): vertex index}
+        self._refcounts = []   # [number of edge ends using each vertex]
+        self._free = []        # vertex indexes with a refcount of zero
+        if numpy is not None:
+            self._coords = numpy.empty(48)
+        else:
+            self._coords = array.array('d')
+
+    def __len__(self):
+        return len(self._refcounts) - len(self._free)
+
+    def _store(self, index, x, y, z):
+        i = index * 3
+        coords = self._coords
+        if numpy is not None:
+            if i + 3 > len(coords):
+                grown = numpy.empty(len(coords) * 2)
+                grown[:i] = coords[:i]
+                coords = self._coords = grown
+        elif i == len(coords):
+            coords.extend((x, y, z))
+            return
+        coords[i] = x
+        coords[i + 1] = y
+        coords[i + 2] = z
+
+    def add(self, v):
+        key = (v.x, v.y, v.z)
+        try:
+            index = self._index[key]
+        except KeyError:
+            if self._free:
+                index = self._free.pop()
+            else:
+                index = len(self._refcounts)
+                self._refcounts.append(0)
+            self._store(index, v.x, v.y, v.z)
+            self._index[key] = index
+        self._refcounts[index] += 1
+        return index
+
+    def release(self, index):
+        self._refcounts[index] -= 1
+        if self._refcounts[index] == 0:
+            del self._index[self.get_tuple(index)]
+            nan = float('nan')
+            self._store(index, nan, nan, nan)
+            self._free.append(index)
+
+    def get_tuple(self, index):
+        # reads the three floats one by one: slicing the numpy array would
+        # make a temporary array, and item() returns a plain float instead
+        # of a slower numpy.float64
+        i = index * 3
+        if numpy is not None:
+            item = self._coords.item
+            return (item(i), item(i + 1), item(i + 2))
+        coords = self._coords
+        return (coords[i], coords[i + 1], coords[i + 2])
+
+    def get(self, index):
+        # the same as Vector3(*get_tuple(index)), without the tuple
+        i = index * 3
+        if numpy is not None:
+            item = self._coords.item
+            return Vector3(item(i), item(i + 1), item(i + 2))
+        coords = self._coords
+        return Vector3(coords[i], coords[i + 1], coords[i + 2])
+
+    def needs_compact(self):
+        return len(self._free) > 0
+
+    def compact(self, edges):
+        # renumber the vertices so that there are no holes left.  'edges' must
+        # be the complete list of edges that hold indexes into this table.
+        old2new = {}
+        keys = []
+        for key, index in self._index.items():
+            old2new[index] = len(keys)
+            keys.append(key)
+        refcounts = [0] * len(keys)
+        for old_index, new_index in old2new.items():
+            refcounts[new_index] = self._refcounts[old_index]
+        self._refcounts = refcounts
+        self._index = {}
+        self._free = []
+        if numpy is not None:
+            self._coords = numpy.empty(max(48, len(keys) * 6))
+        else:
+            self._coords = array.array('d')
+        for index, key in enumerate(keys):
+            self._index[key] = index
+            self._store(index, *key)
+        for edge in edges:
+            edge._i1 = old2new[edge._i1]
+            edge._i2 = old2new[edge._i2]
+
+    def coords(self):
+        """Return the flat float64 array of coordinates, (x, y, z) for each
+        vertex.  This is a slice of the internal storage; don't modify it."""
+        assert not self._free, "call compact() first"
+        return self._coords[:len(self._refcounts) * 3]
+
+
+def empty_coords():
+    if numpy is not None:
+        return numpy.empty(0)
+    return array.array('d')
+
+def concat_coords(coords_list):
+    if numpy is not None:
+        if not coords_list:
+            return empty_coords()
+        return numpy.concatenate(coords_list)
+    result = array.array('d')
+    for coords in coords_list:
+        result.extend(coords)
+    return result
+
+def iter_coords(coords):
+    """Iterate over the (x, y, z) triples of a flat coordinates array."""
+    if numpy is not None:
+        return iter(coords.reshape(-1, 3).tolist())
+    return zip(coords[0::3], coords[1::3], coords[2::3])
+
+def coords_bounds(coords):
+    """Return (vmin, vmax) for a non-empty flat coordinates array."""
+    if numpy is not None:
+        rows = coords.reshape(-1, 3)
+        return (Vector3(*rows.min(axis=0).tolist()),
+                Vector3(*rows.max(axis=0).tolist()))
+    xs = coords[0::3]
+    ys = coords[1::3]
+    zs = coords[2::3]
+    return (Vector3(min(xs), min(ys), min(zs)),
+            Vector3(max(xs), max(ys), max(zs)))
@@ -1,9 +1,45 @@
+import array
+import struct
 from util import EPSILON
 
 
+_packers = {}
+
+def _packer(count):
+    # a struct.Struct for 'count' native 32-bit floats
+    try:
+        return _packers[count]
+    except KeyError:
+        packer = _packers[count] = struct.Struct('=%df' % (count,))
+        return packer
+
+_PACK3 = _packer(3)
+_PACK4 = _packer(4)
+_PACK6 = _packer(6)
+_PACK7 = _packer(7)
+_PACK8 = _packer(8)
+
+def write_floats(buf, offset, values):
+    # writes the list 'values' into 'buf' at 'offset', like writeraw()
+    _packer(len(values)).pack_into(buf, offset * 4, *values)
+    return offset + len(values)
+
+
 class WorldObject(object):
     _index = None
 
+    # rawsize() is len(getrawdata()), and writeraw() writes the same
+    # values directly into the array of floats 'buf' (an array.array('f')
+    # or any writable buffer) at 'offset', returning the offset after them.
+    # The default implementations go through getrawdata(); the subclasses
+    # override them to avoid building the intermediate lists.
+
+    def rawsize(self):
+        return len(self.getrawdata())
+
+    def writeraw(self, buf, offset):
+        return write_floats(buf, offset, self.getrawdata())
+
 
 class Polygon(WorldObject):
     _kind = 101
@@ -17,6 +53,15 @@ class Polygon(WorldObject):
             lst += v.tolist()
         return lst
 
+    def rawsize(self):
+        return 3 * len(self.vertices)
+
+    def writeraw(self, buf, offset):
+        for v in self.vertices:
+            _PACK3.pack_into(buf, offset * 4, v.x, v.y, v.z)
+            offset += 3
+        return offset
+
 
 class ColoredPolygon(Polygon):
     _kind = 102
@@ -33,6 +78,17 @@ class ColoredPolygon(Polygon):
             lst.append(self.color2)
         return lst
 
+    def rawsize(self):
+        return 3 * len(self.vertices) + (1 if self.color2 is None else 2)
+
+    def writeraw(self, buf, offset):
+        offset = Polygon.writeraw(self, buf, offset)
+        if self.color2 is None:
+            _packer(1).pack_into(buf, offset * 4, self.color)
+            return offset + 1
+        _packer(2).pack_into(buf, offset * 4, self.color, self.color2)
+        return offset + 2
+
 
 class PolygonHighlight(ColoredPolygon):
     _kind = 103
@@ -53,6 +109,14 @@ class SmallSphere(WorldObject):
         lst.append(self.color)
         return lst
 
+    def rawsize(self):
+        return 4
+
+    def writeraw(self, buf, offset):
+        center = self.center
+        _PACK4.pack_into(buf, offset * 4, center.x, center.y, center.z, self.color)
+        return offset + 4
+
 
 class RectanglePointer(WorldObject):
     _kind = 201
@@ -67,6 +131,18 @@ class RectanglePointer(WorldObject):
             lst.append(self.controller._index)
         return lst
 
+    def rawsize(self):
+        return 3 if self.controller is None else 4
+
+    def writeraw(self, buf, offset):
+        position = self.position
+        if self.controller is None:
+            _PACK3.pack_into(buf, offset * 4, position.x, position.y, position.z)
+            return offset + 3
+        _PACK4.pack_into(buf, offset * 4, position.x, position.y, position.z,
+                         self.controller._index)
+        return offset + 4
+
 class CrossPointer(RectanglePointer):
     _kind = 202
 
@@ -109,6 +185,26 @@ class Stem(WorldObject):
                 lst.append(self.color2)
         return lst
 
+    def rawsize(self):
+        if self.color is None:
+            return 6
+        return 7 if self.color2 is None else 8
+
+    def writeraw(self, buf, offset):
+        end1 = self.end1
+        end2 = self.end2
+        if self.color is None:
+            _PACK6.pack_into(buf, offset * 4, end1.x, end1.y, end1.z,
+                             end2.x, end2.y, end2.z)
+            return offset + 6
+        if self.color2 is None:
+            _PACK7.pack_into(buf, offset * 4, end1.x, end1.y, end1.z,
+                             end2.x, end2.y, end2.z, self.color)
+            return offset + 7
+        _PACK8.pack_into(buf, offset * 4, end1.x, end1.y, end1.z,
+                         end2.x, end2.y, end2.z, self.color, self.color2)
+        return offset + 8
+
 
 class Cylinder(Stem):
     _kind = 250
@@ -122,6 +218,52 @@ class SelectedStem(Stem):
     _kind = 253
 
 
+class MergedGroup(WorldObject):
+    # All the faces and edges of a group, as a single world object.  'faces'
+    # is a list of (color, vertices), with color None for the default color;
+    # 'edges' is a list of (v1, v2), all drawn with 'edge_color'.  The raw
+    # data is: the number of face colors; for each color, the color (or -1)
+    # and the number of faces, each one given as its number of vertices
+    # followed by their coordinates; then the edge color, the number of
+    # edges, and their two end points.  It is computed only once, as an
+    # array of floats.
+    _kind = 260
+
+    def __init__(self, faces, edges, edge_color):
+        by_color = {}
+        for color, vertices in faces:
+            by_color.setdefault(color, []).append(vertices)
+        lst = [len(by_color)]
+        for color in sorted(by_color):
+            faces_of_color = by_color[color]
+            lst.append(-1 if color is None else color)
+            lst.append(len(faces_of_color))
+            for vertices in faces_of_color:
+                lst.append(len(vertices))
+                for v in vertices:
+                    lst += (v.x, v.y, v.z)
+        lst.append(edge_color)
+        lst.append(len(edges))
+        for v1, v2 in edges:
+            lst += (v1.x, v1.y, v1.z, v2.x, v2.y, v2.z)
+        self.raw = array.array('f', lst)
+
+    def getrawdata(self):
+        return self.raw.tolist()
+
+    def rawsize(self):
+        return len(self.raw)
+
+    def writeraw(self, buf, offset):
+        # 'buf' must be an array.array('f') here.  Raises struct.error if
+        # it is too small, like the other writeraw() methods.
+        end = offset + len(self.raw)
+        if end > len(buf):
+            raise struct.error("buffer too small")
+        buf[offset:end] = self.raw
+        return end
+
+
 def _text2raw(text):
     # 'text' can be a string or a unicode
     return [len(text)] + [ord(ch) for ch in text]
@@ -153,3 +295,17 @@ class TextHint(WorldObject):
         lst.append(self.ignore_controller_num)
         lst.append(self.manual_enter_token)
         return lst
+
+    def rawsize(self):
+        return 1 + len(self.text) + 8
+
+    def writeraw(self, buf, offset):
+        # like _text2raw(), without the list
+        text = self.text
+        _packer(1 + len(text)).pack_into(buf, offset * 4, len(text), *map(ord, text))
+        offset += 1 + len(text)
+        end1 = self.end1
+        end2 = self.end2
+        _PACK8.pack_into(buf, offset * 4, end1.x, end1.y, end1.z, end2.x, end2.y, end2.z,
+                         self.ignore_controller_num, self.manual_enter_token)
+        return offset + 8